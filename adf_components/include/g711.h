@@ -0,0 +1,140 @@
+#ifndef _G711_H_
+#define _G711_H_
+
+// G.711 mu-law and A-law companding (ITU-T G.711, g711_segment search as in the
+// public-domain Sun reference implementation). Header-only plain C with no
+// ESP-IDF dependencies, so the host can compile it to cross-check the
+// Python client (python_server/g711.py --check-c).
+
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#define G711_SIGN_BIT    0x80 // Sign bit of a companded byte
+#define G711_QUANT_MASK  0x0F // Quantization field
+#define G711_SEG_SHIFT   4    // Left shift of the segment number
+#define G711_SEG_MASK    0x70 // Segment field
+
+#define G711_ULAW_BIAS   0x84 // Bias added to the magnitude before mu-law encoding
+#define G711_ULAW_CLIP   8159 // Largest 14-bit magnitude mu-law can represent
+
+// Upper bound of each g711_segment: 14-bit magnitudes for mu-law, 13-bit for A-law
+static const int16_t g711_seg_uend[8] = {0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF};
+static const int16_t g711_seg_aend[8] = {0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF};
+
+static inline int g711_segment(int value, const int16_t *table)
+{
+    int seg = 0;
+    while (seg < 8 && value > table[seg]) {
+        seg++;
+    }
+    return seg;
+}
+
+static inline uint8_t g711_linear_to_ulaw(int16_t sample)
+{
+    int pcm = sample >> 2;
+    int mask = 0xFF;
+    if (pcm < 0) {
+        pcm = -pcm;
+        mask = 0x7F;
+    }
+    if (pcm > G711_ULAW_CLIP) {
+        pcm = G711_ULAW_CLIP;
+    }
+    pcm += G711_ULAW_BIAS >> 2;
+
+    int seg = g711_segment(pcm, g711_seg_uend);
+    if (seg >= 8) {
+        return 0x7F ^ mask;
+    }
+    return ((seg << G711_SEG_SHIFT) | ((pcm >> (seg + 1)) & G711_QUANT_MASK)) ^ mask;
+}
+
+static inline int16_t g711_ulaw_to_linear(uint8_t code)
+{
+    code = ~code;
+    int t = ((code & G711_QUANT_MASK) << 3) + G711_ULAW_BIAS;
+    t <<= (code & G711_SEG_MASK) >> G711_SEG_SHIFT;
+    return (code & G711_SIGN_BIT) ? (G711_ULAW_BIAS - t) : (t - G711_ULAW_BIAS);
+}
+
+static inline uint8_t g711_linear_to_alaw(int16_t sample)
+{
+    int pcm = sample >> 3;
+    int mask = 0xD5;
+    if (pcm < 0) {
+        pcm = -pcm - 1;
+        mask = 0x55;
+    }
+
+    int seg = g711_segment(pcm, g711_seg_aend);
+    if (seg >= 8) {
+        return 0x7F ^ mask;
+    }
+    int code = seg << G711_SEG_SHIFT;
+    code |= (pcm >> (seg < 2 ? 1 : seg)) & G711_QUANT_MASK;
+    return code ^ mask;
+}
+
+static inline int16_t g711_alaw_to_linear(uint8_t code)
+{
+    code ^= 0x55;
+    int t = (code & G711_QUANT_MASK) << 4;
+    int seg = (code & G711_SEG_MASK) >> G711_SEG_SHIFT;
+    if (seg == 0) {
+        t += 8;
+    } else {
+        t += 0x108;
+        t <<= seg - 1;
+    }
+    return (code & G711_SIGN_BIT) ? t : -t;
+}
+
+/**
+ * @brief Encode count 16-bit linear PCM samples to G.711 mu-law, one byte per sample
+ */
+static inline void g711_ulaw_encode(const int16_t *pcm, uint8_t *out, int count)
+{
+    for (int i = 0; i < count; i++) {
+        out[i] = g711_linear_to_ulaw(pcm[i]);
+    }
+}
+
+/**
+ * @brief Decode count G.711 mu-law bytes to 16-bit linear PCM samples
+ */
+static inline void g711_ulaw_decode(const uint8_t *in, int16_t *pcm, int count)
+{
+    for (int i = 0; i < count; i++) {
+        pcm[i] = g711_ulaw_to_linear(in[i]);
+    }
+}
+
+/**
+ * @brief Encode count 16-bit linear PCM samples to G.711 A-law, one byte per sample
+ */
+static inline void g711_alaw_encode(const int16_t *pcm, uint8_t *out, int count)
+{
+    for (int i = 0; i < count; i++) {
+        out[i] = g711_linear_to_alaw(pcm[i]);
+    }
+}
+
+/**
+ * @brief Decode count G.711 A-law bytes to 16-bit linear PCM samples
+ */
+static inline void g711_alaw_decode(const uint8_t *in, int16_t *pcm, int count)
+{
+    for (int i = 0; i < count; i++) {
+        pcm[i] = g711_alaw_to_linear(in[i]);
+    }
+}
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // _G711_H_
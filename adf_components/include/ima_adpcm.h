@@ -0,0 +1,172 @@
+#ifndef _IMA_ADPCM_H_
+#define _IMA_ADPCM_H_
+
+// IMA/DVI ADPCM, 4 bits per sample, packetized so every packet decodes on its
+// own. Header-only plain C with no ESP-IDF dependencies, so the host can
+// compile it to cross-check the Python client (python_server/adpcm.py --check-c).
+//
+// Packet payload:
+//   Offset | Size | Field
+//   0      | 2    | First sample, int16 little-endian (also the initial predictor)
+//   2      | 1    | Step index (0-88) the remaining samples start from
+//   3      | 1    | Padding nibbles at the end of the data (0 or 1)
+//   4      | N    | One nibble per remaining sample, low nibble first
+//
+// The predictor is reset from the header at the start of every packet, so a
+// lost packet never corrupts the ones after it. The encoder carries only the
+// step index from packet to packet, which the next header repeats.
+
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#define IMA_ADPCM_HEADER_LEN 4
+#define IMA_ADPCM_MAX_INDEX  88
+
+static const int16_t ima_adpcm_step_table[IMA_ADPCM_MAX_INDEX + 1] = {
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+};
+
+static const int8_t ima_adpcm_index_table[16] = {
+    -1, -1, -1, -1, 2, 4, 6, 8,
+    -1, -1, -1, -1, 2, 4, 6, 8,
+};
+
+/**
+ * @brief Payload bytes needed for count samples
+ */
+static inline int ima_adpcm_encoded_len(int count)
+{
+    return count > 0 ? IMA_ADPCM_HEADER_LEN + count / 2 : 0;
+}
+
+// Apply one nibble to the predictor and step index, as both encoder and decoder do
+static inline void ima_adpcm_step(int nibble, int *predictor, int *index)
+{
+    int step = ima_adpcm_step_table[*index];
+    int diff = step >> 3;
+    if (nibble & 4) {
+        diff += step;
+    }
+    if (nibble & 2) {
+        diff += step >> 1;
+    }
+    if (nibble & 1) {
+        diff += step >> 2;
+    }
+    int value = (nibble & 8) ? *predictor - diff : *predictor + diff;
+    if (value > 32767) {
+        value = 32767;
+    } else if (value < -32768) {
+        value = -32768;
+    }
+    *predictor = value;
+
+    int next = *index + ima_adpcm_index_table[nibble];
+    if (next < 0) {
+        next = 0;
+    } else if (next > IMA_ADPCM_MAX_INDEX) {
+        next = IMA_ADPCM_MAX_INDEX;
+    }
+    *index = next;
+}
+
+/**
+ * @brief Encode count samples into one packet payload
+ *
+ * @param pcm    Input samples
+ * @param count  Number of samples (at least 1)
+ * @param out    Output buffer, at least ima_adpcm_encoded_len(count) bytes
+ * @param index  Step index carried from the previous packet of the stream; updated
+ * @return Payload length in bytes
+ */
+static inline int ima_adpcm_encode(const int16_t *pcm, int count, uint8_t *out, uint8_t *index)
+{
+    if (count <= 0) {
+        return 0;
+    }
+    int predictor = pcm[0];
+    int step_index = *index > IMA_ADPCM_MAX_INDEX ? IMA_ADPCM_MAX_INDEX : *index;
+    out[0] = (uint8_t)(pcm[0] & 0xFF);
+    out[1] = (uint8_t)((pcm[0] >> 8) & 0xFF);
+    out[2] = (uint8_t)step_index;
+    out[3] = (uint8_t)(count % 2 == 0); // count - 1 nibbles: odd when count is even
+
+    uint8_t *data = out + IMA_ADPCM_HEADER_LEN;
+    for (int i = 1; i < count; i++) {
+        int step = ima_adpcm_step_table[step_index];
+        int delta = pcm[i] - predictor;
+        int nibble = 0;
+        if (delta < 0) {
+            nibble = 8;
+            delta = -delta;
+        }
+        if (delta >= step) {
+            nibble |= 4;
+            delta -= step;
+        }
+        if (delta >= step >> 1) {
+            nibble |= 2;
+            delta -= step >> 1;
+        }
+        if (delta >= step >> 2) {
+            nibble |= 1;
+        }
+        ima_adpcm_step(nibble, &predictor, &step_index);
+
+        int position = i - 1;
+        if (position % 2 == 0) {
+            data[position / 2] = (uint8_t)nibble;
+        } else {
+            data[position / 2] |= (uint8_t)(nibble << 4);
+        }
+    }
+    *index = (uint8_t)step_index;
+    return ima_adpcm_encoded_len(count);
+}
+
+/**
+ * @brief Decode one packet payload
+ *
+ * @param in           Payload
+ * @param len          Payload length in bytes
+ * @param pcm          Output samples
+ * @param max_samples  Capacity of pcm; extra samples are dropped
+ * @return Number of samples written, or -1 if the header is invalid
+ */
+static inline int ima_adpcm_decode(const uint8_t *in, int len, int16_t *pcm, int max_samples)
+{
+    if (len < IMA_ADPCM_HEADER_LEN || in[2] > IMA_ADPCM_MAX_INDEX || in[3] > 1 || max_samples <= 0) {
+        return -1;
+    }
+    int count = 1 + 2 * (len - IMA_ADPCM_HEADER_LEN) - in[3];
+    if (count > max_samples) {
+        count = max_samples;
+    }
+    int predictor = (int16_t)(in[0] | (in[1] << 8));
+    int step_index = in[2];
+    pcm[0] = (int16_t)predictor;
+
+    const uint8_t *data = in + IMA_ADPCM_HEADER_LEN;
+    for (int i = 1; i < count; i++) {
+        int position = i - 1;
+        int nibble = (position % 2 == 0) ? (data[position / 2] & 0x0F) : (data[position / 2] >> 4);
+        ima_adpcm_step(nibble, &predictor, &step_index);
+        pcm[i] = (int16_t)predictor;
+    }
+    return count;
+}
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // _IMA_ADPCM_H_
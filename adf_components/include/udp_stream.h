@@ -10,12 +10,26 @@
 extern "C" {
 #endif
 
+// Audio payload codec, carried in the high nibble of the packet type byte
+typedef enum {
+    UDP_STREAM_CODEC_PCM16 = 0, // 16-bit linear PCM, 324 bytes per 20.25 ms chunk
+    UDP_STREAM_CODEC_PCMU = 1,  // G.711 mu-law, 162 bytes per chunk
+    UDP_STREAM_CODEC_PCMA = 2,  // G.711 A-law, 162 bytes per chunk
+    UDP_STREAM_CODEC_ADPCM = 3, // IMA-ADPCM 4:1, 85 bytes per chunk (4-byte state header + 81)
+} udp_stream_codec_t;
+
+// Silence threshold used when udp_stream_cfg_t.dtx_threshold_dbfs is 0
+#define UDP_STREAM_DTX_DEFAULT_THRESHOLD (-45)
+
 typedef struct {
     audio_stream_type_t type; // Type of the audio stream
     int out_rb_size; // Size of the output ring buffer
     struct sockaddr_in dest_addr; // Destination address for UDP stream
     int task_stack; // Stack size for the task
     int buffer_len; // Length of the buffer for reading/writing
+    udp_stream_codec_t codec; // Payload codec for the writer; the reader decodes whatever each packet carries
+    bool dtx; // Writer: replace silent chunks with periodic silence descriptors (discontinuous transmission)
+    int dtx_threshold_dbfs; // Writer: chunks below this RMS level (dBFS, e.g. -45) are silent; 0 for the default
 } udp_stream_cfg_t;
 
 /**
@@ -26,6 +40,30 @@ typedef struct {
  */
 audio_element_handle_t udp_stream_init(udp_stream_cfg_t *config);
 
+/**
+ * @brief Change the codec a UDP writer encodes with, effective from the next packet
+ *
+ * @param el    Audio element handle returned by udp_stream_init
+ * @param codec Payload codec
+ * @return ESP_OK, or ESP_ERR_INVALID_ARG for an unknown codec
+ */
+esp_err_t udp_stream_set_codec(audio_element_handle_t el, udp_stream_codec_t codec);
+
+/**
+ * @brief Turn discontinuous transmission on or off for a UDP writer
+ *
+ * While on, chunks below threshold_dbfs are not sent once a 200 ms hangover
+ * after the last louder chunk has passed. A silence descriptor carrying the
+ * noise level goes out instead every 10 chunks. Suppressed chunks still use
+ * up their sequence number, so the receiver can tell silence from loss.
+ *
+ * @param el             Audio element handle returned by udp_stream_init
+ * @param enable         true to suppress silence
+ * @param threshold_dbfs Silence threshold in dBFS (negative), or 0 for UDP_STREAM_DTX_DEFAULT_THRESHOLD
+ * @return ESP_OK, or ESP_ERR_INVALID_ARG for a positive threshold
+ */
+esp_err_t udp_stream_set_dtx(audio_element_handle_t el, bool enable, int threshold_dbfs);
+
 #ifdef __cplusplus
 }
 #endif
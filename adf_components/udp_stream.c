@@ -1,5 +1,6 @@
 #include <string.h>
 #include <errno.h>
+#include <math.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
 #include <arpa/inet.h>
@@ -9,8 +10,12 @@
 #include "audio_element.h"
 #include "esp_log.h"
 #include "udp_stream.h"
+#include "g711.h"
+#include "ima_adpcm.h"
 
 #define AUDIO_PACKAGE 0
+#define AUDIO_PROBE   2 // Latency probe: reflected to its sender with device timestamps, never played
+#define AUDIO_SID     3 // Silence descriptor: chunks from this sequence on were suppressed as silence
 
 // UDP Stream packet header structure:
 // 1 Byte for package type
@@ -27,12 +32,27 @@
 #define UDP_HEADER_LENGTH_OFFSET    13  // Packet length (2 bytes)
 #define UDP_HEADER_DATA_OFFSET      15  // Start of data payload
 
+// Type byte: package type in the low nibble, payload codec (udp_stream_codec_t) in the high nibble
+#define UDP_HEADER_TYPE_MASK        0x0F
+#define UDP_HEADER_CODEC_SHIFT      4
+
 // Header field sizes
 #define UDP_HEADER_TYPE_SIZE        1
 #define UDP_HEADER_SEQUENCE_SIZE    4
 #define UDP_HEADER_TIMESTAMP_SIZE   8
 #define UDP_HEADER_LENGTH_SIZE      2
 
+// Latency probe payload: three int64 little-endian microsecond timestamps
+#define UDP_PROBE_PAYLOAD_LEN       24
+#define UDP_PROBE_RECEIVED_OFFSET   8   // Device receive time, filled in by the reader
+#define UDP_PROBE_SENT_OFFSET       16  // Device send time of the reflection
+
+// Discontinuous transmission (writer)
+#define UDP_DTX_HANGOVER_CHUNKS     10  // Quiet chunks still sent after a louder one, so word endings survive
+#define UDP_DTX_SID_INTERVAL        10  // Chunks between silence descriptors while suppressing
+#define UDP_SID_PAYLOAD_LEN         1   // Noise level in -dBFS (0-127), as in RFC 3389 comfort noise
+#define UDP_SID_MAX_LEVEL           127
+
 #define MAX_UDP_PACKET_SIZE 1400  // MTU-safe packet size
 
 static const char *TAG = "udp_STREAM";
@@ -42,6 +62,14 @@ typedef struct udp_stream {
     int sock; // Socket for UDP communication
     struct sockaddr_in dest_addr; // Destination address for UDP stream
     bool is_open; // Flag to indicate if the stream is open
+    udp_stream_codec_t codec; // Payload codec used by the writer
+    uint8_t adpcm_index; // ADPCM step index carried from one written packet to the next
+    bool dtx; // Writer suppresses silent chunks
+    int dtx_threshold_dbfs; // RMS level below which a chunk is silent
+    int dtx_hangover; // Quiet chunks still to send before suppression starts
+    int dtx_since_sid; // Chunks since the last silence descriptor, -1 while audio is being sent
+    float dtx_noise_power; // Smoothed mean square of recent quiet chunks, full scale = 1
+    uint8_t encode_buffer[MAX_UDP_PACKET_SIZE - UDP_STREAM_HEADER_LEN]; // Encoded (G.711 or ADPCM) payload for the writer
 } udp_stream_t;
 
 static esp_err_t _udp_open(audio_element_handle_t self)
@@ -112,6 +140,31 @@ static esp_err_t _udp_close(audio_element_handle_t self)
     return ESP_OK;
 }
 
+static int64_t _udp_time_us(void)
+{
+    struct timeval tv;
+    gettimeofday(&tv, NULL);
+    return (int64_t)tv.tv_sec * 1000000L + tv.tv_usec;
+}
+
+// Return a latency probe to its sender at once, stamped with the device's receive and send times
+static void _udp_reflect_probe(udp_stream_t *udp, uint8_t *packet, int size, const struct sockaddr_in *from,
+                               int64_t received_us)
+{
+    if (size < UDP_STREAM_HEADER_LEN + UDP_PROBE_PAYLOAD_LEN) {
+        ESP_LOGW(TAG, "Dropping short latency probe: %d bytes", size);
+        return;
+    }
+    uint8_t *payload = packet + UDP_STREAM_HEADER_LEN;
+    memcpy(payload + UDP_PROBE_RECEIVED_OFFSET, &received_us, sizeof(received_us));
+    int64_t sent_us = _udp_time_us();
+    memcpy(payload + UDP_PROBE_SENT_OFFSET, &sent_us, sizeof(sent_us));
+    if (sendto(udp->sock, packet, UDP_STREAM_HEADER_LEN + UDP_PROBE_PAYLOAD_LEN, 0,
+               (const struct sockaddr *)from, sizeof(*from)) < 0) {
+        ESP_LOGD(TAG, "Latency probe reply failed: errno %d", errno);
+    }
+}
+
 static int _udp_stream_read(audio_element_handle_t self, char *buffer, int len, TickType_t ticks_to_wait, void *context)
 {
     udp_stream_t *udp = (udp_stream_t *)audio_element_getdata(self);
@@ -139,7 +192,9 @@ static int _udp_stream_read(audio_element_handle_t self, char *buffer, int len,
     }
     setsockopt(udp->sock, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout));
     
-    int ret = recvfrom(udp->sock, recv_buffer, MAX_UDP_PACKET_SIZE, 0, NULL, NULL);
+    struct sockaddr_in from_addr;
+    socklen_t from_len = sizeof(from_addr);
+    int ret = recvfrom(udp->sock, recv_buffer, MAX_UDP_PACKET_SIZE, 0, (struct sockaddr *)&from_addr, &from_len);
 
     if (ret < 0) {
         if (errno == EAGAIN) {
@@ -151,8 +206,19 @@ static int _udp_stream_read(audio_element_handle_t self, char *buffer, int len,
         return AEL_IO_FAIL;
     }
 
+    int package_type = recv_buffer[UDP_HEADER_TYPE_OFFSET] & UDP_HEADER_TYPE_MASK;
+    if (package_type == AUDIO_PROBE) {
+        _udp_reflect_probe(udp, recv_buffer, ret, &from_addr, _udp_time_us());
+        return AEL_IO_TIMEOUT;
+    }
+    else if (package_type != AUDIO_PACKAGE) {
+        ESP_LOGW(TAG, "Dropping packet with unknown type %d", package_type);
+        return AEL_IO_TIMEOUT;
+    }
+
     int recv_length = recv_buffer[UDP_HEADER_LENGTH_OFFSET] | 
                       (recv_buffer[UDP_HEADER_LENGTH_OFFSET + 1] << 8);
+    int codec = recv_buffer[UDP_HEADER_TYPE_OFFSET] >> UDP_HEADER_CODEC_SHIFT;
 
     if (recv_length < 0) {
         ESP_LOGE(TAG, "Invalid packet length: %d", recv_length);
@@ -165,7 +231,41 @@ static int _udp_stream_read(audio_element_handle_t self, char *buffer, int len,
         recv_length = len; // Limit to buffer size
     }
 
-    memcpy(buffer, recv_buffer + UDP_STREAM_HEADER_LEN, recv_length);
+    const uint8_t *payload = recv_buffer + UDP_STREAM_HEADER_LEN;
+    int samples;
+    switch (codec) {
+    case UDP_STREAM_CODEC_PCM16:
+        memcpy(buffer, payload, recv_length);
+        break;
+    case UDP_STREAM_CODEC_PCMU:
+    case UDP_STREAM_CODEC_PCMA:
+        // One companded byte per sample: the decoded chunk is twice the payload
+        samples = recv_length;
+        if (samples * 2 > len) {
+            ESP_LOGE(TAG, "Decoded packet too large for buffer: %d samples", samples);
+            samples = len / 2;
+        }
+        if (codec == UDP_STREAM_CODEC_PCMU) {
+            g711_ulaw_decode(payload, (int16_t *)buffer, samples);
+        }
+        else {
+            g711_alaw_decode(payload, (int16_t *)buffer, samples);
+        }
+        recv_length = samples * 2;
+        break;
+    case UDP_STREAM_CODEC_ADPCM:
+        // Self-contained packet: the predictor and step index come from its own header
+        samples = ima_adpcm_decode(payload, recv_length, (int16_t *)buffer, len / 2);
+        if (samples < 0) {
+            ESP_LOGW(TAG, "Dropping ADPCM packet with invalid header");
+            return AEL_IO_TIMEOUT;
+        }
+        recv_length = samples * 2;
+        break;
+    default:
+        ESP_LOGW(TAG, "Dropping packet with unknown codec %d", codec);
+        return AEL_IO_TIMEOUT;
+    }
 
     pckg_count++;
     ESP_LOGD(TAG, "UDP packet count: %d", pckg_count);
@@ -177,6 +277,44 @@ static int _udp_stream_read(audio_element_handle_t self, char *buffer, int len,
     return recv_length;
 }
 
+// Mean square of a chunk relative to full scale
+static float _udp_chunk_power(const int16_t *pcm, int samples)
+{
+    if (samples <= 0) {
+        return 0.0f;
+    }
+    int64_t sum = 0;
+    for (int i = 0; i < samples; i++) {
+        sum += (int32_t)pcm[i] * pcm[i];
+    }
+    return (float)sum / samples / (32768.0f * 32768.0f);
+}
+
+static int _udp_power_to_dbfs(float power)
+{
+    if (power <= 1e-13f) {
+        return -UDP_SID_MAX_LEVEL;
+    }
+    int dbfs = (int)lroundf(10.0f * log10f(power));
+    return dbfs < -UDP_SID_MAX_LEVEL ? -UDP_SID_MAX_LEVEL : dbfs;
+}
+
+// Tell the receiver that chunks from sequence on are silence at the current noise level
+static void _udp_send_sid(udp_stream_t *udp, uint32_t sequence, int64_t time_ms)
+{
+    uint8_t packet[UDP_STREAM_HEADER_LEN + UDP_SID_PAYLOAD_LEN];
+    uint16_t length = UDP_SID_PAYLOAD_LEN;
+    packet[UDP_HEADER_TYPE_OFFSET] = AUDIO_SID;
+    memcpy(&packet[UDP_HEADER_SEQUENCE_OFFSET], &sequence, UDP_HEADER_SEQUENCE_SIZE);
+    memcpy(&packet[UDP_HEADER_TIMESTAMP_OFFSET], &time_ms, UDP_HEADER_TIMESTAMP_SIZE);
+    memcpy(&packet[UDP_HEADER_LENGTH_OFFSET], &length, UDP_HEADER_LENGTH_SIZE);
+    packet[UDP_HEADER_DATA_OFFSET] = (uint8_t)(-_udp_power_to_dbfs(udp->dtx_noise_power));
+    if (sendto(udp->sock, packet, sizeof(packet), 0, (const struct sockaddr *)&udp->dest_addr,
+               sizeof(udp->dest_addr)) < 0) {
+        ESP_LOGD(TAG, "Silence descriptor send failed: errno %d", errno);
+    }
+}
+
 static int _udp_stream_write(audio_element_handle_t self, char *buffer, int len, TickType_t ticks_to_wait, void *context)
 {
     udp_stream_t *udp = (udp_stream_t *)audio_element_getdata(self);
@@ -202,10 +340,68 @@ static int _udp_stream_write(audio_element_handle_t self, char *buffer, int len,
     struct timeval tv;
     gettimeofday(&tv, NULL);
     int64_t time_ms = (int64_t)tv.tv_sec * 1000L + (int64_t)tv.tv_usec / 1000L;
+    uint8_t *payload = (uint8_t *)buffer;
     uint16_t packet_length = len;
+
+    int samples = len / 2;
+    if (udp->dtx) {
+        float power = _udp_chunk_power((const int16_t *)buffer, samples);
+        if (_udp_power_to_dbfs(power) >= udp->dtx_threshold_dbfs) {
+            udp->dtx_hangover = UDP_DTX_HANGOVER_CHUNKS;
+            udp->dtx_since_sid = -1;
+        }
+        else {
+            if (udp->dtx_noise_power == 0.0f) {
+                udp->dtx_noise_power = power;
+            }
+            udp->dtx_noise_power += (power - udp->dtx_noise_power) / 8;
+            if (udp->dtx_hangover > 0) {
+                udp->dtx_hangover--;
+            }
+            else {
+                if (udp->dtx_since_sid < 0 || ++udp->dtx_since_sid >= UDP_DTX_SID_INTERVAL) {
+                    _udp_send_sid(udp, sequence_number, time_ms);
+                    udp->dtx_since_sid = 0;
+                }
+                // The suppressed chunk keeps its sequence number, so the receiver can tell silence from loss
+                sequence_number++;
+                return len;
+            }
+        }
+    }
+
+    switch (udp->codec) {
+    case UDP_STREAM_CODEC_PCMU:
+    case UDP_STREAM_CODEC_PCMA:
+        // G.711: one byte per 16-bit sample, half the airtime of raw PCM
+        if (samples > (int)sizeof(udp->encode_buffer)) {
+            ESP_LOGE(TAG, "Write of %d bytes too large to encode in one packet", len);
+            return AEL_IO_FAIL;
+        }
+        if (udp->codec == UDP_STREAM_CODEC_PCMU) {
+            g711_ulaw_encode((const int16_t *)buffer, udp->encode_buffer, samples);
+        }
+        else {
+            g711_alaw_encode((const int16_t *)buffer, udp->encode_buffer, samples);
+        }
+        payload = udp->encode_buffer;
+        packet_length = samples;
+        break;
+    case UDP_STREAM_CODEC_ADPCM:
+        // IMA-ADPCM: 4 bits per sample plus a 4-byte state header, a quarter of raw PCM
+        if (ima_adpcm_encoded_len(samples) > (int)sizeof(udp->encode_buffer)) {
+            ESP_LOGE(TAG, "Write of %d bytes too large to encode in one packet", len);
+            return AEL_IO_FAIL;
+        }
+        packet_length = ima_adpcm_encode((const int16_t *)buffer, samples, udp->encode_buffer, &udp->adpcm_index);
+        payload = udp->encode_buffer;
+        break;
+    default:
+        break;
+    }
     
     // Audio packet header construction
-    header[UDP_HEADER_TYPE_OFFSET] = AUDIO_PACKAGE;
+    header[UDP_HEADER_TYPE_OFFSET] = AUDIO_PACKAGE | (udp->codec << UDP_HEADER_CODEC_SHIFT);
     memcpy(&header[UDP_HEADER_SEQUENCE_OFFSET], &sequence_number, UDP_HEADER_SEQUENCE_SIZE);
     memcpy(&header[UDP_HEADER_TIMESTAMP_OFFSET], &time_ms, UDP_HEADER_TIMESTAMP_SIZE);
     memcpy(&header[UDP_HEADER_LENGTH_OFFSET], &packet_length, UDP_HEADER_LENGTH_SIZE);
@@ -213,8 +409,8 @@ static int _udp_stream_write(audio_element_handle_t self, char *buffer, int len,
     struct iovec iov[2];
     iov[0].iov_base = header;
     iov[0].iov_len = UDP_STREAM_HEADER_LEN;
-    iov[1].iov_base = buffer;
-    iov[1].iov_len = len;
+    iov[1].iov_base = payload;
+    iov[1].iov_len = packet_length;
 
     struct msghdr msg = {
         .msg_name = &udp->dest_addr,
@@ -290,6 +486,10 @@ audio_element_handle_t udp_stream_init(udp_stream_cfg_t *config)
     udp->sock = -1;
     udp->dest_addr = config->dest_addr;
     udp->is_open = false;
+    udp->codec = config->codec;
+    udp->dtx = config->dtx;
+    udp->dtx_threshold_dbfs = config->dtx_threshold_dbfs < 0 ? config->dtx_threshold_dbfs : UDP_STREAM_DTX_DEFAULT_THRESHOLD;
+    udp->dtx_since_sid = -1;
 
     audio_element_cfg_t cfg = DEFAULT_AUDIO_ELEMENT_CONFIG();
     if (config -> task_stack < 4096) {
@@ -321,3 +521,32 @@ audio_element_handle_t udp_stream_init(udp_stream_cfg_t *config)
              udp->type == AUDIO_STREAM_WRITER ? "writer" : "reader");
     return el;
 }
+
+esp_err_t udp_stream_set_codec(audio_element_handle_t el, udp_stream_codec_t codec)
+{
+    if (codec != UDP_STREAM_CODEC_PCM16 && codec != UDP_STREAM_CODEC_PCMU && codec != UDP_STREAM_CODEC_PCMA &&
+        codec != UDP_STREAM_CODEC_ADPCM) {
+        ESP_LOGE(TAG, "Unknown codec %d", codec);
+        return ESP_ERR_INVALID_ARG;
+    }
+    udp_stream_t *udp = (udp_stream_t *)audio_element_getdata(el);
+    udp->codec = codec;
+    udp->adpcm_index = 0;
+    ESP_LOGI(TAG, "UDP stream codec set to %d", codec);
+    return ESP_OK;
+}
+
+esp_err_t udp_stream_set_dtx(audio_element_handle_t el, bool enable, int threshold_dbfs)
+{
+    if (threshold_dbfs > 0) {
+        ESP_LOGE(TAG, "DTX threshold must be negative dBFS, got %d", threshold_dbfs);
+        return ESP_ERR_INVALID_ARG;
+    }
+    udp_stream_t *udp = (udp_stream_t *)audio_element_getdata(el);
+    udp->dtx = enable;
+    udp->dtx_threshold_dbfs = threshold_dbfs < 0 ? threshold_dbfs : UDP_STREAM_DTX_DEFAULT_THRESHOLD;
+    udp->dtx_hangover = UDP_DTX_HANGOVER_CHUNKS;
+    udp->dtx_since_sid = -1;
+    ESP_LOGI(TAG, "UDP stream DTX %s (threshold %d dBFS)", enable ? "on" : "off", udp->dtx_threshold_dbfs);
+    return ESP_OK;
+}
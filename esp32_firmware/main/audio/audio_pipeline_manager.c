@@ -12,6 +12,26 @@
 #define I2S_SAMPLE_RATE     8000
 #define UDP_PORT_LOCAL      12345
 
+// Codec of the audio sent to the client; the client answers in the codec it receives
+#if CONFIG_DOORBELL_AUDIO_CODEC_PCMU
+#define AUDIO_UPLINK_CODEC  UDP_STREAM_CODEC_PCMU
+#elif CONFIG_DOORBELL_AUDIO_CODEC_PCMA
+#define AUDIO_UPLINK_CODEC  UDP_STREAM_CODEC_PCMA
+#elif CONFIG_DOORBELL_AUDIO_CODEC_ADPCM
+#define AUDIO_UPLINK_CODEC  UDP_STREAM_CODEC_ADPCM
+#else
+#define AUDIO_UPLINK_CODEC  UDP_STREAM_CODEC_PCM16
+#endif
+
+// Silence suppression of the audio sent to the client
+#if CONFIG_DOORBELL_AUDIO_DTX
+#define AUDIO_UPLINK_DTX            true
+#define AUDIO_UPLINK_DTX_THRESHOLD  (-CONFIG_DOORBELL_AUDIO_DTX_THRESHOLD)
+#else
+#define AUDIO_UPLINK_DTX            false
+#define AUDIO_UPLINK_DTX_THRESHOLD  0
+#endif
+
 static const char *TAG = "AUDIO_MANAGER";
 
 esp_err_t audio_pipelines_init(struct audio_pipeline_manager_info *audio_pipelines_info)
@@ -59,6 +79,9 @@ esp_err_t audio_pipelines_init(struct audio_pipeline_manager_info *audio_pipelin
         .out_rb_size = 1024,
         .task_stack = 4096,
         .buffer_len = 324,
+        .codec = AUDIO_UPLINK_CODEC,
+        .dtx = AUDIO_UPLINK_DTX,
+        .dtx_threshold_dbfs = AUDIO_UPLINK_DTX_THRESHOLD,
     };
     audio_pipelines_info->udp_writer = udp_stream_init(&udp_cfg_send);
     if (audio_pipelines_info->udp_writer == NULL) {
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+asyncio client for ESP32 doorbells, runs on uvloop when it is installed
+"""
+import asyncio
+import socket
+import sys
+import time
+
+from protocol import (
+    Commands, PacketTypes, TCP_PORT, UDP_PORT, VIDEO_UDP_PORT, COMMAND,
+    COMMAND_SIZE, HDR_TYPE, HDR_SEQUENCE, HDR_TIMESTAMP, PACKET_TYPE_MASK,
+    pack_command, parse_audio_header, parse_video_header,
+)
+from reassembly import FrameReassembler
+
+class _DatagramEndpoint(asyncio.DatagramProtocol):
+    """Forward every datagram on one UDP port to the hub"""
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.dispatch(data, addr)
+
+    def error_received(self, exc):
+        print(f"UDP error: {exc}")
+
+class StreamHub:
+    """Own the audio and video UDP ports and route datagrams to clients by source IP
+
+    Every doorbell sends to the same local ports, so one hub serves all the
+    DoorbellClient instances of a process.
+    """
+
+    def __init__(self, host='0.0.0.0', audio_port=UDP_PORT, video_port=VIDEO_UDP_PORT):
+        self.host = host
+        self.audio_port = audio_port
+        self.video_port = video_port
+        self.clients = {}
+        self.audio_transport = None
+        self.video_transport = None
+        self.unknown_datagrams = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.audio_transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramEndpoint(self._on_audio),
+            sock=self._bind(self.audio_port, None))
+        self.video_transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramEndpoint(self._on_video),
+            sock=self._bind(self.video_port, 4 * 1024 * 1024))
+
+    def _bind(self, port, rcvbuf):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if rcvbuf:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            except OSError as e:
+                print(f"Could not set large UDP buffer: {e}")
+        sock.bind((self.host, port))
+        sock.setblocking(False)
+        return sock
+
+    def close(self):
+        for transport in (self.audio_transport, self.video_transport):
+            if transport is not None:
+                transport.close()
+
+    def attach(self, client):
+        self.clients[client.esp32_ip] = client
+
+    def detach(self, client):
+        self.clients.pop(client.esp32_ip, None)
+
+    def _on_audio(self, data, addr):
+        client = self.clients.get(addr[0])
+        if client is None:
+            self.unknown_datagrams += 1
+            return
+        client._on_audio(data)
+
+    def _on_video(self, data, addr):
+        client = self.clients.get(addr[0])
+        if client is None:
+            self.unknown_datagrams += 1
+            return
+        client._on_video(data)
+
+    def send_audio(self, packet, esp32_ip):
+        self.audio_transport.sendto(packet, (esp32_ip, self.audio_port))
+
+class _Stream:
+    """Bounded queue behind an async iterator; drops the oldest item when full"""
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(None)
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+class DoorbellClient:
+    """One talk session with one ESP32 doorbell
+
+    Audio chunks are yielded as (header, payload) from audio_chunks() and
+    complete JPEG frames as (frame_id, timestamp, frame_data) from frames().
+    Both iterators end when the talk session ends.
+    """
+
+    def __init__(self, esp32_ip, hub, queue_size=64):
+        self.esp32_ip = esp32_ip
+        self.hub = hub
+        self.reader = None
+        self.writer = None
+        self.reassembler = FrameReassembler()
+        self._audio = _Stream(queue_size)
+        self._frames = _Stream(queue_size)
+        self._control_task = None
+        self.ended = asyncio.Event()
+        self.stats = {
+            'audio_packets': 0,
+            'video_packets': 0,
+            'completed_frames': 0,
+        }
+
+    async def connect(self, timeout=5.0):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.esp32_ip, TCP_PORT), timeout)
+
+    async def request_talk(self, timeout=5.0):
+        """Ask for talk permission, return True if granted"""
+        self.hub.attach(self)
+        self.writer.write(pack_command(Commands.REQUEST_TALK))
+        await self.writer.drain()
+        try:
+            response = COMMAND.unpack(await asyncio.wait_for(self.reader.readexactly(COMMAND_SIZE), timeout))[0]
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            print(f"{self.esp32_ip}: no response to talk request")
+            self._finish()
+            return False
+        if response != Commands.GRANT_TALK:
+            print(f"{self.esp32_ip}: unexpected response {response}")
+            self._finish()
+            return False
+        self._control_task = asyncio.get_running_loop().create_task(self._read_control())
+        return True
+
+    async def end_talk(self):
+        if self.writer is not None and not self.writer.is_closing():
+            try:
+                self.writer.write(pack_command(Commands.END_TALK))
+                await self.writer.drain()
+            except OSError as e:
+                print(f"{self.esp32_ip}: could not send end of talk: {e}")
+        self._finish()
+        if self._control_task is not None:
+            self._control_task.cancel()
+
+    async def close(self):
+        self._finish()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+
+    def audio_chunks(self):
+        return self._audio
+
+    def frames(self):
+        return self._frames
+
+    def send_audio(self, packet):
+        self.hub.send_audio(packet, self.esp32_ip)
+
+    async def _read_control(self):
+        try:
+            while True:
+                command = COMMAND.unpack(await self.reader.readexactly(COMMAND_SIZE))[0]
+                if command == Commands.TALK_ENDED:
+                    print(f"{self.esp32_ip}: talk session ended by ESP32")
+                    break
+                elif command == Commands.DOORBELL_RING:
+                    print(f"{self.esp32_ip}: doorbell ring")
+                else:
+                    print(f"{self.esp32_ip}: unexpected command {command}")
+        except (asyncio.IncompleteReadError, OSError):
+            print(f"{self.esp32_ip}: control connection closed")
+        self._finish()
+
+    def _finish(self):
+        self.hub.detach(self)
+        self._audio.close()
+        self._frames.close()
+        self.ended.set()
+
+    def _on_audio(self, data):
+        header, payload = parse_audio_header(memoryview(data))
+        # Any codec: the payload is handed on as received (header[HDR_TYPE] >> CODEC_SHIFT tells which)
+        if header is None or header[HDR_TYPE] & PACKET_TYPE_MASK != PacketTypes.AUDIO_PACKAGE:
+            return
+        self.stats['audio_packets'] += 1
+        self._audio.put((header, payload))
+
+    def _on_video(self, data):
+        header, payload = parse_video_header(memoryview(data))
+        if header is None or header[HDR_TYPE] != PacketTypes.VIDEO_PACKAGE:
+            return
+        self.stats['video_packets'] += 1
+        completed = self.reassembler.add(header, payload)
+        if completed is not None:
+            self.stats['completed_frames'] += 1
+            self._frames.put((completed[0], header[HDR_TIMESTAMP], completed[1]))
+
+def new_event_loop():
+    """Event loop factory: uvloop if available, the default asyncio loop otherwise"""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+def run(coro):
+    """Run a coroutine to completion on the preferred event loop"""
+    loop = new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+async def _session(hub, esp32_ip, duration):
+    """Echo audio back and count frames for one device, like audio_video_test.py"""
+    client = DoorbellClient(esp32_ip, hub)
+    try:
+        await client.connect()
+    except (OSError, asyncio.TimeoutError) as e:
+        print(f"{esp32_ip}: TCP connection failed: {e}")
+        return client.stats
+    if not await client.request_talk():
+        await client.close()
+        return client.stats
+    print(f"{esp32_ip}: talk permission GRANTED")
+
+    async def echo_audio():
+        last_seq = None
+        async for header, payload in client.audio_chunks():
+            if last_seq is not None and last_seq + 1 != header[HDR_SEQUENCE]:
+                print(f"{esp32_ip}: missing audio sequence: expected {last_seq + 1}, got {header[HDR_SEQUENCE]}")
+            last_seq = header[HDR_SEQUENCE]
+            # payload is a view of the received datagram; echo it unchanged
+            client.send_audio(payload.obj)
+
+    async def consume_frames():
+        async for frame_id, timestamp, frame_data in client.frames():
+            pass
+
+    tasks = [asyncio.ensure_future(echo_audio()), asyncio.ensure_future(consume_frames())]
+    try:
+        await asyncio.wait_for(client.ended.wait(), duration)
+    except asyncio.TimeoutError:
+        pass
+    await client.end_talk()
+    await asyncio.gather(*tasks)
+    await client.close()
+    return client.stats
+
+async def main(esp32_ips, duration):
+    hub = StreamHub()
+    await hub.start()
+    start_time = time.time()
+    try:
+        results = await asyncio.gather(*(_session(hub, ip, duration) for ip in esp32_ips))
+    finally:
+        hub.close()
+    elapsed = time.time() - start_time
+    print(f"\nTest Results ({type(asyncio.get_running_loop()).__module__} loop):")
+    for ip, stats in zip(esp32_ips, results):
+        print(f"  {ip}: audio {stats['audio_packets']} ({stats['audio_packets']/elapsed:.1f}/s), "
+              f"video {stats['video_packets']}, frames {stats['completed_frames']} ({stats['completed_frames']/elapsed:.1f}/s)")
+    return all(stats['audio_packets'] > 0 for stats in results)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python async_client.py <esp32_ip> [<esp32_ip> ...] [--duration SECONDS]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    duration = 30.0
+    if '--duration' in args:
+        index = args.index('--duration')
+        duration = float(args[index + 1])
+        del args[index:index + 2]
+
+    success = run(main(args, duration))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Batched audio analytics: level, peak, clipping and energy/zero-crossing voice activity, with events
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+from audio_ring import CHUNK_DURATION, CHUNK_SAMPLES
+from protocol import serial_diff
+
+ANALYSIS_INTERVAL = 0.1  # About 5 chunks per batch
+# Chunks this close to the newest one wait for the next batch, so slightly reordered chunks are not skipped
+REORDER_CHUNKS = 2
+CLIP_LEVEL = 32700  # |sample| at or above this counts as clipped
+FULL_SCALE = 32768.0
+
+# Voice activity: a chunk is speech-like when it is SPEECH_MARGIN_DB above the noise floor and above
+# MIN_SPEECH_DBFS; voice starts after ONSET_CHUNKS such chunks in a row whose zero-crossing rate is at
+# most MAX_ONSET_ZCR (voiced speech crosses far less often than hiss or wind), and stops HANGOVER_CHUNKS
+# after the last speech-like chunk
+SPEECH_MARGIN_DB = 12.0
+MIN_SPEECH_DBFS = -50.0
+MAX_ONSET_ZCR = 0.25
+ONSET_CHUNKS = 2
+HANGOVER_CHUNKS = 15
+FLOOR_RISE_DB = 0.05  # Per chunk, about 2.5 dB/s; the floor falls to any quieter chunk at once
+SILENCE_DBFS = -96.0
+# A clipping event is raised for the first clipped chunk after this long without clipping
+CLIP_EVENT_GAP = 1.0
+
+def chunk_features(samples):
+    """Per-chunk (level in dBFS, peak, clipped samples, zero-crossing rate) for a (chunks x samples) int16 array
+
+    Four whole-batch NumPy reductions; the samples are read in place.
+    """
+    energy = np.einsum('ij,ij->i', samples, samples, dtype=np.float64) / samples.shape[1]
+    level = 10 * np.log10(np.maximum(energy / (FULL_SCALE * FULL_SCALE), 10 ** (SILENCE_DBFS / 10)))
+    peak = np.maximum(samples.max(axis=1).astype(np.int32), -samples.min(axis=1).astype(np.int32))
+    clipped = np.count_nonzero(samples >= CLIP_LEVEL, axis=1) + np.count_nonzero(samples <= -CLIP_LEVEL, axis=1)
+    # Two samples differ in sign exactly when their XOR is negative
+    zcr = np.count_nonzero((samples[:, 1:] ^ samples[:, :-1]) < 0, axis=1) / (samples.shape[1] - 1)
+    return level, peak, clipped, zcr
+
+class AudioAnalyzer:
+    """Level metrics and voice activity events for one audio stream, a batch of chunks at a time
+
+    process() takes consecutive chunks as a 2-D int16 view, such as a
+    window of the AudioRing, and computes every chunk's features with
+    chunk_features(). Only the small voice-activity state machine then
+    walks the batch chunk by chunk. Missing chunks are skipped without
+    changing the state. metrics holds the latest values and events the recent
+    ('voice_started' | 'voice_stopped' | 'clipping', sequence, value)
+    tuples. Each event is also passed to on_event(kind, sequence, value)
+    when given. The value is the speech duration in seconds for
+    voice_stopped, and the clipped sample count for clipping.
+    """
+
+    def __init__(self, on_event=None, max_onset_zcr=MAX_ONSET_ZCR):
+        self.on_event = on_event
+        self.max_onset_zcr = max_onset_zcr
+        self.noise_floor = None  # dBFS
+        self.voice_active = False
+        self._run = 0  # Consecutive speech-like chunks while inactive
+        self._quiet = 0  # Chunks since the last speech-like one while active
+        self._voice_start = None
+        self._last_clip = None
+        self._next = None  # Next sequence follow() analyzes
+        self.events = deque(maxlen=1000)
+        self.metrics = {
+            'level_dbfs': SILENCE_DBFS,
+            'peak': 0,
+            'noise_floor_dbfs': SILENCE_DBFS,
+            'zero_crossing_rate': 0.0,
+            'voice_active': False,
+        }
+        self.stats = {
+            'chunks': 0,
+            'missing': 0,
+            'skipped': 0,  # Fell more than a ring's worth behind
+            'clipped_samples': 0,
+            'clipped_chunks': 0,
+            'voice_chunks': 0,
+            'voice_segments': 0,
+        }
+
+    def _emit(self, kind, sequence, value):
+        self.events.append((kind, sequence, value))
+        if self.on_event is not None:
+            self.on_event(kind, sequence, value)
+
+    def process(self, samples, first_sequence, received=None):
+        """Analyze consecutive chunks (chunks x CHUNK_SAMPLES int16) starting at first_sequence
+
+        received masks the chunks that actually arrived. Returns the
+        per-chunk features (level, peak, clipped, zcr) as arrays.
+        """
+        features = chunk_features(samples)
+        if received is None:
+            received = np.ones(len(samples), dtype=bool)
+        level, peak, clipped, zcr = features
+        stats = self.stats
+        present = int(received.sum())
+        stats['chunks'] += present
+        stats['missing'] += len(samples) - present
+        clipped_present = clipped * received
+        stats['clipped_samples'] += int(clipped_present.sum())
+        stats['clipped_chunks'] += int(np.count_nonzero(clipped_present))
+
+        floor = self.noise_floor
+        for n in np.flatnonzero(received).tolist():
+            sequence = (first_sequence + n) & 0xFFFFFFFF
+            chunk_level = level[n]
+            if floor is None or chunk_level < floor:
+                floor = chunk_level
+            else:
+                floor += FLOOR_RISE_DB
+            speech = chunk_level > floor + SPEECH_MARGIN_DB and chunk_level > MIN_SPEECH_DBFS
+            if self.voice_active:
+                stats['voice_chunks'] += 1
+                self._quiet = 0 if speech else self._quiet + 1
+                if self._quiet >= HANGOVER_CHUNKS:
+                    self.voice_active = False
+                    duration = serial_diff(sequence, self._voice_start) * CHUNK_DURATION
+                    self._emit('voice_stopped', sequence, duration)
+            elif speech and zcr[n] <= self.max_onset_zcr:
+                self._run += 1
+                if self._run >= ONSET_CHUNKS:
+                    self.voice_active = True
+                    self._quiet = 0
+                    self._run = 0
+                    self._voice_start = (sequence - ONSET_CHUNKS + 1) & 0xFFFFFFFF
+                    stats['voice_segments'] += 1
+                    self._emit('voice_started', self._voice_start, 0.0)
+            else:
+                self._run = 0
+            if clipped[n]:
+                if self._last_clip is None or serial_diff(sequence, self._last_clip) * CHUNK_DURATION >= CLIP_EVENT_GAP:
+                    self._emit('clipping', sequence, int(clipped[n]))
+                self._last_clip = sequence
+        self.noise_floor = floor
+
+        if present:
+            last = np.flatnonzero(received)[-1]
+            self.metrics.update({
+                'level_dbfs': float(level[last]),
+                'peak': int(peak[received].max()),
+                'noise_floor_dbfs': SILENCE_DBFS if floor is None else float(floor),
+                'zero_crossing_rate': float(zcr[last]),
+                'voice_active': self.voice_active,
+            })
+        return features
+
+    def follow(self, ring):
+        """Analyze every chunk the AudioRing has received since the last call, in one batch"""
+        if ring.newest is None:
+            return
+        end = (ring.newest - REORDER_CHUNKS) & 0xFFFFFFFF
+        if self._next is None:
+            self._next = end
+        count = serial_diff(end, self._next) + 1
+        if count <= 0:
+            return
+        if count > ring.capacity - REORDER_CHUNKS:
+            # Too far behind: the oldest rows are being overwritten, start from what is still intact
+            skip = count - (ring.capacity - REORDER_CHUNKS)
+            self.stats['skipped'] += skip
+            self._next = (self._next + skip) & 0xFFFFFFFF
+            count -= skip
+        samples, received = ring.window(self._next, count)
+        self.process(samples.reshape(count, CHUNK_SAMPLES), self._next, received)
+        self._next = (end + 1) & 0xFFFFFFFF
+
+def _doorstep_recording(seconds, seed):
+    """Background noise with utterances, a burst of wind hiss and a clipped shout; (samples, speech mask per chunk)"""
+    from audio_concealment import _synthetic_speech
+
+    rng = np.random.default_rng(seed)
+    total = int(seconds / CHUNK_DURATION) * CHUNK_SAMPLES
+    signal = rng.normal(0, 60, total)  # Street noise around -55 dBFS
+    speech = np.zeros(total, dtype=bool)
+    voice = _synthetic_speech(4.0, seed).astype(np.float64)
+    position = int(2.0 / CHUNK_DURATION) * CHUNK_SAMPLES
+    while position < total - len(voice):
+        length = int(rng.uniform(0.8, 3.0) * 8000)
+        gain = rng.uniform(0.3, 1.0)
+        signal[position:position + length] += gain * voice[:length]
+        speech[position:position + length] = np.abs(voice[:length]) > 300
+        position += length + int(rng.uniform(2.0, 6.0) * 8000)
+    # Wind across the microphone: loud broadband hiss, no voice
+    hiss = slice(int(0.3 * total), int(0.3 * total) + 16000)
+    signal[hiss] += rng.normal(0, 2500, 16000)
+    # A shout that clips
+    shout = slice(int(0.7 * total), int(0.7 * total) + 8000)
+    signal[shout] += 8 * voice[:8000]
+    speech[shout] = True
+    samples = np.clip(signal, -32768, 32767).astype(np.int16).reshape(-1, CHUNK_SAMPLES)
+    return samples, speech.reshape(-1, CHUNK_SAMPLES).any(axis=1)
+
+def benchmark(seconds=120, seed=8):
+    """Voice detection on a synthetic doorstep recording, energy-only vs energy + zero crossings; CPU per batch size"""
+    samples, truth = _doorstep_recording(seconds, seed)
+    onsets = np.flatnonzero(truth[1:] & ~truth[:-1]) + 1
+
+    for name, zcr in (('energy only', 1.0), ('energy + ZCR', MAX_ONSET_ZCR)):
+        analyzer = AudioAnalyzer(max_onset_zcr=zcr)
+        active = np.zeros(len(samples), dtype=bool)
+        for n in range(0, len(samples), 5):
+            analyzer.process(samples[n:n + 5], n)
+            active[n:n + 5] = analyzer.voice_active
+        starts = [sequence for kind, sequence, _ in analyzer.events if kind == 'voice_started']
+        detected = [min((s - onset for s in starts if 0 <= s - onset < 50), default=None) for onset in onsets]
+        found = [d for d in detected if d is not None]
+        false_starts = sum(1 for s in starts if not truth[s:s + 10].any())
+        print(f"  {name:<13} {len(found)}/{len(onsets)} utterances detected, "
+              f"onset error p50 {1000 * CHUNK_DURATION * float(np.median(found) if found else 0):.0f} ms, "
+              f"{false_starts} false starts, chunk agreement {100 * np.mean(active == truth):.1f}%, "
+              f"{analyzer.stats['clipped_chunks']} clipped chunks")
+
+    chunk_rate = 1 / CHUNK_DURATION
+    for batch in (1, 5, 50):
+        analyzer = AudioAnalyzer()
+        start = time.process_time()
+        for n in range(0, len(samples), batch):
+            analyzer.process(samples[n:n + batch], n)
+        per_chunk = (time.process_time() - start) / len(samples)
+        print(f"  batches of {batch:>2} chunks ({1000 * batch * CHUNK_DURATION:>5.0f} ms): {1e6 * per_chunk:6.1f} us per chunk "
+              f"-> {100 * per_chunk * chunk_rate:.3f}% of a core per stream")
+
+if __name__ == "__main__":
+    print("Audio analytics benchmark (2 min synthetic doorstep recording)")
+    benchmark()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Audio codec dispatch: decode any payload codec to linear PCM and encode back, keyed by AudioCodecs
+"""
+import g711
+import adpcm
+from protocol import CHUNK_SIZE, AudioCodecs
+
+# Command-line names
+CODEC_NAMES = {
+    'pcm': AudioCodecs.PCM16,
+    'pcmu': AudioCodecs.PCMU,
+    'pcma': AudioCodecs.PCMA,
+    'adpcm': AudioCodecs.ADPCM,
+}
+
+def codec_name(codec):
+    return next((name for name, value in CODEC_NAMES.items() if value == codec), f'codec {codec}')
+
+def payload_size(codec, pcm_size=CHUNK_SIZE):
+    """Encoded payload bytes for pcm_size bytes of 16-bit PCM"""
+    if codec == AudioCodecs.ADPCM:
+        return adpcm.encoded_size(pcm_size // 2)
+    if codec in (AudioCodecs.PCMU, AudioCodecs.PCMA):
+        return pcm_size // 2
+    return pcm_size
+
+def decode(payload, codec):
+    """Return 16-bit little-endian PCM bytes, or None for an unknown codec or a malformed payload"""
+    if codec == AudioCodecs.PCM16:
+        return payload
+    if codec in (AudioCodecs.PCMU, AudioCodecs.PCMA):
+        return g711.decode(payload, codec)
+    if codec == AudioCodecs.ADPCM:
+        return adpcm.decode(payload)
+    return None
+
+class Encoder:
+    """Encode successive chunks of one stream; ADPCM carries its step index from chunk to chunk"""
+
+    def __init__(self, codec):
+        if codec not in CODEC_NAMES.values():
+            raise ValueError(f"Unknown audio codec {codec}")
+        self.codec = codec
+        self._index = 0
+
+    def encode(self, pcm):
+        if self.codec == AudioCodecs.PCM16:
+            return pcm
+        if self.codec == AudioCodecs.ADPCM:
+            payload, self._index = adpcm.encode(pcm, self._index)
+            return payload
+        return g711.encode(pcm, self.codec)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Packet-loss concealment for the 8 kHz 16-bit mono audio stream (pitch waveform substitution)
+"""
+import numpy as np
+
+from protocol import CHUNK_SIZE, SAMPLE_RATE
+
+CHUNK_SAMPLES = CHUNK_SIZE // 2
+# Pitch search range: 66-400 Hz
+MIN_PITCH = SAMPLE_RATE // 400
+MAX_PITCH = SAMPLE_RATE // 66
+# Correlation window for the pitch search and history kept for it
+PITCH_WINDOW = 160
+HISTORY = MAX_PITCH + PITCH_WINDOW
+# Full level for the first 10 ms of a loss, then -20% per 10 ms: silent after 60 ms
+FADE_START = SAMPLE_RATE // 100
+FADE_LENGTH = SAMPLE_RATE // 20
+
+class LossConcealer:
+    """Fill lost chunks by repeating the last pitch period, G.711 Appendix I style
+
+    process() takes every chunk in playout order, as int16 samples or
+    bytes, with None for a lost chunk, and returns the int16 samples to
+    play. On the first lost chunk the pitch is estimated by normalized
+    autocorrelation over the recent history (all lags at once, as one
+    matrix product); lost chunks are synthesized by tiling the last one,
+    two, then three pitch periods, which avoids the buzz of a single
+    repeated period. The synthetic signal is faded out from 10 ms into the
+    loss and is silent after 60 ms. The first received chunk after a loss
+    is overlap-added with a continuation of the synthetic signal so the
+    seam does not click.
+    """
+
+    def __init__(self):
+        self.history = np.zeros(HISTORY, dtype=np.float32)
+        self.lost = 0  # Consecutive lost chunks so far
+        self.pitch = MAX_PITCH
+        self._period = None
+        self._phase = 0
+        self._elapsed = 0  # Samples synthesized since the loss started
+        self.stats = {
+            'received': 0,
+            'concealed': 0,
+        }
+
+    def process(self, chunk):
+        """Return the samples to play for this chunk (None when it was lost)"""
+        if chunk is None:
+            self.stats['concealed'] += 1
+            if self.lost == 0:
+                self.pitch = self._estimate_pitch()
+                self._period = self.history[-self.pitch:]
+                self._phase = 0
+                self._elapsed = 0
+            elif self.lost < 3:
+                # Widen the substituted waveform to one more period; the phase keeps its place
+                self._period = self.history[-self.pitch * (self.lost + 1):]
+                self._phase += self.pitch
+            self.lost += 1
+            return np.clip(self._synthesize(CHUNK_SAMPLES), -32768, 32767).astype(np.int16)
+
+        self.stats['received'] += 1
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            chunk = np.frombuffer(chunk, dtype=np.int16)
+        samples = chunk.astype(np.float32)
+        if self.lost:
+            # Overlap-add: fade the synthetic continuation out while the real signal fades in
+            overlap = min(len(samples), self.pitch // 4 + 32 * min(self.lost, 3))
+            ramp = np.linspace(0.0, 1.0, overlap, endpoint=False, dtype=np.float32)
+            samples[:overlap] = self._synthesize(overlap) * (1.0 - ramp) + samples[:overlap] * ramp
+            self.lost = 0
+            self._period = None
+        self._remember(samples)
+        return np.clip(samples, -32768, 32767).astype(np.int16)
+
+    def _remember(self, samples):
+        history = self.history
+        count = len(samples)
+        if count >= HISTORY:
+            history[:] = samples[-HISTORY:]
+        else:
+            history[:-count] = history[count:]
+            history[-count:] = samples
+
+    def _estimate_pitch(self):
+        """Lag in MIN_PITCH..MAX_PITCH whose window best matches the most recent PITCH_WINDOW samples"""
+        history = self.history
+        target = history[-PITCH_WINDOW:]
+        # Row k is the window that ends MIN_PITCH + k samples before the newest sample
+        windows = np.lib.stride_tricks.sliding_window_view(history[:-MIN_PITCH], PITCH_WINDOW)[::-1]
+        correlation = windows @ target
+        energy = np.einsum('ij,ij->i', windows, windows) + 1e-3
+        score = np.where(correlation > 0, correlation * correlation / energy, 0.0)
+        # Multiples of the period score as well as the period itself: take the peak of the shortest near-best lag
+        lag = int(np.argmax(score >= 0.9 * score.max()))
+        while lag + 1 < len(score) and score[lag + 1] > score[lag]:
+            lag += 1
+        return MIN_PITCH + lag
+
+    def _synthesize(self, count):
+        """Next `count` substituted samples, attenuated by the time since the loss started"""
+        period = self._period
+        steps = np.arange(count)
+        output = period[(self._phase + steps) % len(period)]
+        gain = np.clip(1.0 - (self._elapsed + steps - FADE_START) / FADE_LENGTH, 0.0, 1.0)
+        self._phase = (self._phase + count) % len(period)
+        self._elapsed += count
+        return output * gain
+
+def _synthetic_speech(seconds, seed):
+    """Voiced-speech stand-in: harmonic source with a gliding pitch, syllable envelope and pauses"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 130 + 40 * np.sin(2 * np.pi * 0.3 * t) + 15 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    source = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t) + 0.3, 0, None)
+    envelope *= np.sin(2 * np.pi * 0.25 * t) > -0.5  # Pauses between phrases
+    noise = rng.normal(0, 150, len(t))
+    return np.clip(6000 * source * envelope + noise, -32768, 32767).astype(np.int16)
+
+def _read_trace(path):
+    import wave
+
+    with wave.open(path, 'rb') as trace:
+        if trace.getsampwidth() != 2 or trace.getnchannels() != 1 or trace.getframerate() != SAMPLE_RATE:
+            raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz 16-bit mono")
+        return np.frombuffer(trace.readframes(trace.getnframes()), dtype=np.int16)
+
+def _loss_pattern(chunks, rate, burst, rng):
+    """Lost-chunk mask; bursty losses follow a two-state Gilbert model with mean burst length `burst`"""
+    if burst <= 1:
+        return rng.random(chunks) < rate
+    lost = np.zeros(chunks, dtype=bool)
+    enter = rate / (burst * (1 - rate))
+    losing = False
+    draws = rng.random(chunks)
+    for n in range(chunks):
+        losing = draws[n] < (1 - 1 / burst if losing else enter)
+        lost[n] = losing
+    return lost
+
+def benchmark(trace=None, seconds=60, seed=11):
+    """Error over lost chunks and per-chunk cost: silence fill vs LossConcealer"""
+    import time
+
+    signal = _read_trace(trace) if trace else _synthetic_speech(seconds, seed)
+    chunks = len(signal) // CHUNK_SAMPLES
+    signal = signal[:chunks * CHUNK_SAMPLES].reshape(chunks, CHUNK_SAMPLES)
+    rng = np.random.default_rng(seed)
+    # Only chunks with something to conceal count: silence fill is perfect on silence
+    voiced = np.abs(signal).max(axis=1) > 500
+
+    def snr(output, mask):
+        mask = mask & voiced
+        reference = signal[mask].astype(np.float64)
+        error = reference - output[mask]
+        return 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1.0))
+
+    print(f"  {'loss':<16} {'silence SNR':>12} {'PLC SNR':>9} {'us/lost chunk':>14} {'us/chunk':>9}")
+    for rate, burst in ((0.05, 1), (0.10, 1), (0.20, 1), (0.10, 3)):
+        lost = _loss_pattern(chunks, rate, burst, rng)
+        concealer = LossConcealer()
+        output = np.empty_like(signal)
+        concealing = 0.0
+        start = time.perf_counter()
+        for n in range(chunks):
+            if lost[n]:
+                began = time.perf_counter()
+                output[n] = concealer.process(None)
+                concealing += time.perf_counter() - began
+            else:
+                output[n] = concealer.process(signal[n])
+        elapsed = time.perf_counter() - start
+        silence = np.where(lost[:, None], 0, signal)
+        label = f"{100 * rate:.0f}% " + ("random" if burst <= 1 else f"bursts of {burst}")
+        print(f"  {label:<16} {snr(silence, lost):>9.1f} dB {snr(output, lost):>6.1f} dB "
+              f"{1e6 * concealing / max(lost.sum(), 1):>14.0f} {1e6 * elapsed / chunks:>9.1f}")
+    print(f"  (chunk budget {1e6 * CHUNK_SAMPLES / SAMPLE_RATE:.0f} us)")
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"Packet-loss concealment benchmark ({path or '60 s synthetic voiced speech'})")
+    benchmark(path)
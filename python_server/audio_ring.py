@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Fixed-size ring of received audio chunks, indexed by sequence number, with zero-copy windows
+"""
+from array import array
+
+import numpy as np
+
+from protocol import CHUNK_SIZE, SAMPLE_RATE, serial_diff
+
+CHUNK_SAMPLES = CHUNK_SIZE // 2
+CHUNK_DURATION = CHUNK_SAMPLES / SAMPLE_RATE
+
+class AudioRing:
+    """Keep the last `seconds` of received audio in one preallocated int16 array
+
+    Chunk `sequence` lives in row `sequence % capacity`. The capacity is
+    rounded up to a power of two so that this stays continuous across the
+    2**32 sequence wrap. Each row is written twice, at `slot` and
+    `slot + capacity`, so any window of up to `capacity` consecutive chunks
+    is one contiguous slice. window() returns it as a view without copying,
+    together with a mask of the chunks that were actually received (the
+    rest hold stale audio from an older lap, or zeros). Inserting is O(1):
+    two 324-byte row copies and a tag store, with no pruning pass.
+    """
+
+    def __init__(self, seconds=10.0):
+        capacity = 1
+        while capacity * CHUNK_DURATION < seconds:
+            capacity *= 2
+        self.capacity = capacity
+        self._samples = np.zeros((2 * capacity, CHUNK_SAMPLES), dtype=np.int16)
+        # Byte view for inserts: a memoryview slice store is much cheaper than a NumPy row assignment
+        self._bytes = memoryview(self._samples).cast('B')
+        # Sequence number held by each row, -1 for never written; np.frombuffer reads it without a copy
+        self._tags = array('q', [-1]) * capacity
+        self.newest = None
+        self.stats = {
+            'inserted': 0,
+            'duplicates': 0,
+            'too_old': 0,
+        }
+
+    def insert(self, sequence, payload):
+        """Store one received 324-byte chunk (bytes or byte memoryview); return False if it was not kept"""
+        stats = self.stats
+        newest = self.newest
+        if newest is not None:
+            ahead = serial_diff(sequence, newest)
+            if ahead <= -self.capacity:
+                stats['too_old'] += 1
+                return False
+            if ahead > 0:
+                self.newest = sequence
+        else:
+            self.newest = sequence
+        slot = sequence % self.capacity
+        tags = self._tags
+        if tags[slot] == sequence:
+            stats['duplicates'] += 1
+            return False
+        # Copying out of the payload view is what lets the receive buffer be reused
+        offset = slot * CHUNK_SIZE
+        mirror = offset + self.capacity * CHUNK_SIZE
+        data = self._bytes
+        data[offset:offset + CHUNK_SIZE] = payload
+        data[mirror:mirror + CHUNK_SIZE] = payload
+        tags[slot] = sequence
+        stats['inserted'] += 1
+        return True
+
+    def window(self, start, count):
+        """(samples, received) for chunks start .. start + count - 1
+
+        samples is a read-only (count * CHUNK_SAMPLES,) view into the ring,
+        valid until those rows are overwritten a lap later; received is a
+        bool mask with one entry per chunk.
+        """
+        if not 0 < count <= self.capacity:
+            raise ValueError(f"window of {count} chunks, ring holds {self.capacity}")
+        slot = start % self.capacity
+        samples = self._samples[slot:slot + count].reshape(-1)
+        samples.flags.writeable = False
+        wanted = (start + np.arange(count, dtype=np.int64)) & 0xFFFFFFFF
+        tags = np.frombuffer(self._tags, dtype=np.int64)[(slot + np.arange(count)) % self.capacity]
+        return samples, tags == wanted
+
+    def latest(self, seconds):
+        """window() covering the most recent `seconds` up to the newest chunk received"""
+        if self.newest is None:
+            return np.zeros(0, dtype=np.int16), np.zeros(0, dtype=bool)
+        count = min(self.capacity, max(1, round(seconds / CHUNK_DURATION)))
+        return self.window((self.newest - count + 1) & 0xFFFFFFFF, count)
+
+    def gaps(self, seconds):
+        """Sequence numbers missing from the most recent `seconds`"""
+        if self.newest is None:
+            return []
+        count = min(self.capacity, max(1, round(seconds / CHUNK_DURATION)))
+        start = (self.newest - count + 1) & 0xFFFFFFFF
+        _, received = self.window(start, count)
+        return [(start + int(n)) & 0xFFFFFFFF for n in np.flatnonzero(~received)]
+
+def benchmark(chunks=200000, seconds=10.0, loss=0.01, seed=2):
+    """Per-chunk cost: legacy dict store with its pruning pass vs AudioRing, plus window reads"""
+    import time
+
+    rng = np.random.default_rng(seed)
+    payload = rng.integers(-2000, 2000, CHUNK_SAMPLES, dtype=np.int16).tobytes()
+    sequences = [n for n, lost in enumerate(rng.random(chunks) < loss) if not lost]
+
+    def dict_insert(sequence):
+        # Legacy: dict keyed on sequence, pruned by walking every key once it holds 2000 entries
+        store[sequence] = bytes(payload)
+        if len(store) > 2000:
+            cutoff = sequence - 1000
+            for key in list(store.keys()):
+                if key < cutoff:
+                    del store[key]
+
+    store = {}
+    ring = AudioRing(seconds)
+    costs = {}
+    clock = time.perf_counter
+    for label, insert in (('dict', dict_insert), ('ring', lambda sequence: ring.insert(sequence, payload))):
+        times = []
+        for sequence in sequences:
+            began = clock()
+            insert(sequence)
+            times.append(clock() - began)
+        times.sort()
+        costs[label] = (sum(times) / len(times), times[int(0.999 * len(times))], sum(t > 20e-6 for t in times))
+
+    # A level meter reading the last second every chunk
+    reads = 10000
+    start = time.perf_counter()
+    for _ in range(reads):
+        samples, received = ring.latest(1.0)
+        peak = int(np.abs(samples).max())
+    window_cost = (time.perf_counter() - start) / reads
+    start = time.perf_counter()
+    for _ in range(reads):
+        copied = b''.join(store[key] for key in range(sequences[-1] - 48, sequences[-1] + 1) if key in store)
+        peak = int(np.abs(np.frombuffer(copied, dtype=np.int16)).max())
+    copy_cost = (time.perf_counter() - start) / reads
+
+    for label, (mean, tail, slow) in costs.items():
+        print(f"  {label} insert: mean {1e6 * mean:.2f} us/chunk, p99.9 {1e6 * tail:.1f} us, {slow} inserts over 20 us")
+    print(f"  ring: {ring.capacity} chunks, {ring._samples.nbytes // 1024} KiB preallocated, no pruning pass")
+    print(f"  last second for a level meter: dict join + peak {1e6 * copy_cost:.1f} us, ring view + peak "
+          f"{1e6 * window_cost:.1f} us (peak {peak}, {int(received.sum())}/{len(received)} chunks received)")
+
+if __name__ == "__main__":
+    print("Audio store benchmark (200k chunks, 1% loss, 10 s window)")
+    benchmark()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Paced audio uplink: packetize PCM from WAV files, arrays or generators and send it in real time
+"""
+import os
+import time
+import wave
+from collections import deque
+
+from protocol import AUDIO_HEADER, CHUNK_SIZE, SAMPLE_RATE, CODEC_SHIFT, AudioCodecs, PacketTypes
+
+CHUNK_DURATION = CHUNK_SIZE / 2 / SAMPLE_RATE
+# Further behind than this (a stall, a suspended laptop) the clock restarts instead of bursting to catch up
+MAX_LAG = 5 * CHUNK_DURATION
+
+def pcm_chunks(source):
+    """Return an iterator over CHUNK_SIZE bytes of 8 kHz 16-bit mono PCM at a time from `source`
+
+    source is a WAV file path, a bytes-like object or int16 array, or an
+    iterable of those in any sizes (a generator producing speech, say).
+    The last chunk is padded with silence. A WAV file in another format
+    raises ValueError here rather than on the first read.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return _wav_chunks(source)
+    if isinstance(source, (bytes, bytearray, memoryview)) or hasattr(source, 'dtype'):
+        source = (source,)
+    return _rechunk(source)
+
+def _rechunk(source):
+    pending = bytearray()
+    for block in source:
+        if hasattr(block, 'dtype'):
+            block = block.astype('<i2', copy=False).tobytes()
+        pending += block
+        while len(pending) >= CHUNK_SIZE:
+            yield bytes(pending[:CHUNK_SIZE])
+            del pending[:CHUNK_SIZE]
+    if pending:
+        yield bytes(pending) + bytes(CHUNK_SIZE - len(pending))
+
+def _wav_chunks(path):
+    wav = wave.open(os.fspath(path), 'rb')
+    if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or wav.getframerate() != SAMPLE_RATE:
+        wav.close()
+        raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz 16-bit mono, got {wav.getframerate()} Hz "
+                         f"{8 * wav.getsampwidth()}-bit with {wav.getnchannels()} channels")
+
+    def read():
+        with wav:
+            while True:
+                data = wav.readframes(CHUNK_SIZE // 2)
+                if not data:
+                    return
+                yield data + bytes(CHUNK_SIZE - len(data))
+    return read()
+
+class AudioSender:
+    """Send one audio packet per CHUNK_DURATION, each on an absolute deadline
+
+    Chunk n is due at start + n * CHUNK_DURATION, computed from the start
+    time rather than from the previous send, so sleep overshoot and send
+    cost never accumulate into drift. Its header timestamp is the wall
+    clock at start plus the same offset, so the device sees evenly spaced
+    capture times. A chunk that is late by less than MAX_LAG is sent at
+    once, so the stream catches up. After a longer stall the clock
+    restarts and the stall is counted as a resync.
+
+    With any codec other than PCM16 each chunk is encoded before sending
+    (162 bytes for G.711, 85 for ADPCM). Use run() on a dedicated thread, or call poll() from an existing loop such as a reactor timer
+    (it sends whatever is due and returns the next deadline). send_jitter
+    holds how late each packet left relative to its deadline.
+    """
+
+    def __init__(self, sock, addr, source, sequence=0, codec=AudioCodecs.PCM16):
+        self.sock = sock
+        self.addr = addr
+        self.sequence = sequence
+        self.codec = codec
+        self._encoder = None
+        payload_size = CHUNK_SIZE
+        if codec != AudioCodecs.PCM16:
+            import audio_codec
+            self._encoder = audio_codec.Encoder(codec)
+            payload_size = audio_codec.payload_size(codec)
+        self._chunks = pcm_chunks(source)
+        self._packet = bytearray(AUDIO_HEADER.size + payload_size)
+        self._start = None
+        self._start_ms = 0.0
+        self._index = 0
+        self.done = False
+        self.send_jitter = deque(maxlen=5000)
+        self.stats = {
+            'sent': 0,
+            'send_errors': 0,
+            'resyncs': 0,
+        }
+
+    def start(self, now=None, wall_now=None):
+        self._start = time.monotonic() if now is None else now
+        self._start_ms = 1000.0 * (time.time() if wall_now is None else wall_now)
+        self._index = 0
+
+    def poll(self, now=None):
+        """Send every chunk that is due; return the next deadline, or None once the source is exhausted"""
+        if self.done:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if self._start is None:
+            self.start(now)
+        packet = self._packet
+        while True:
+            deadline = self._start + self._index * CHUNK_DURATION
+            if deadline > now:
+                return deadline
+            if now - deadline > MAX_LAG:
+                self.stats['resyncs'] += 1
+                self._start += (now - deadline)
+                self._start_ms += 1000.0 * (now - deadline)
+                deadline = now
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.done = True
+                return None
+            timestamp = int(self._start_ms + self._index * CHUNK_DURATION * 1000.0)
+            if self._encoder is not None:
+                chunk = self._encoder.encode(chunk)
+            AUDIO_HEADER.pack_into(packet, 0, PacketTypes.AUDIO_PACKAGE | self.codec << CODEC_SHIFT,
+                                   self.sequence, timestamp, len(chunk))
+            packet[AUDIO_HEADER.size:] = chunk
+            try:
+                self.sock.sendto(packet, self.addr)
+                self.stats['sent'] += 1
+            except OSError:
+                self.stats['send_errors'] += 1
+            self.send_jitter.append(time.monotonic() - deadline)
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            self._index += 1
+
+    def run(self, stop_event=None):
+        """Send until the source is exhausted or stop_event is set"""
+        self.start()
+        deadline = self.poll()
+        while deadline is not None and not (stop_event is not None and stop_event.is_set()):
+            # No spinning to the deadline: the thread would hold the GIL from the I/O loop. Sleep
+            # overshoot is not carried over, since the next deadline is absolute
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            deadline = self.poll()
+
+    def summary(self):
+        """Send jitter percentiles in seconds over the most recent packets"""
+        jitter = sorted(self.send_jitter)
+        if not jitter:
+            return {'jitter_p50': 0.0, 'jitter_p99': 0.0, 'jitter_max': 0.0}
+        return {
+            'jitter_p50': jitter[len(jitter) // 2],
+            'jitter_p99': jitter[min(len(jitter) - 1, int(0.99 * len(jitter)))],
+            'jitter_max': jitter[-1],
+        }
+
+def benchmark(seconds=5.0):
+    """Drift and send jitter over real time: sleep(CHUNK_DURATION) after each send vs AudioSender"""
+    import socket
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))  # Its buffer holds a few seconds of packets; nothing reads them
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = receiver.getsockname()
+    count = int(seconds / CHUNK_DURATION)
+    silence = bytes(CHUNK_SIZE) * count
+
+    # Relative pacing: every send and sleep overshoot adds to the schedule
+    sends = []
+    sequence = 0
+    start = time.monotonic()
+    for chunk in pcm_chunks(silence):
+        sock.sendto(AUDIO_HEADER.pack(PacketTypes.AUDIO_PACKAGE, sequence, 0, CHUNK_SIZE) + chunk, addr)
+        sends.append(time.monotonic())
+        sequence += 1
+        time.sleep(CHUNK_DURATION)
+    lateness = sorted(sent - (start + n * CHUNK_DURATION) for n, sent in enumerate(sends))
+    drift = sends[-1] - start - (len(sends) - 1) * CHUNK_DURATION
+    print(f"  sleep per chunk: drift {1000 * drift:+.1f} ms after {seconds:.0f} s, "
+          f"lateness p50 {1000 * lateness[len(lateness) // 2]:.2f} ms, max {1000 * lateness[-1]:.2f} ms")
+
+    sender = AudioSender(sock, addr, silence)
+    sender.run()
+    drift = sender.send_jitter[-1]
+    jitter = sender.summary()
+    print(f"  AudioSender:     drift {1000 * drift:+.1f} ms after {seconds:.0f} s, "
+          f"send jitter p50 {1e6 * jitter['jitter_p50']:.0f} us, p99 {1e6 * jitter['jitter_p99']:.0f} us, "
+          f"max {1e6 * jitter['jitter_max']:.0f} us, {sender.stats['sent']} packets")
+    sock.close()
+    receiver.close()
+
+if __name__ == "__main__":
+    print("Audio uplink pacing benchmark (5 s per method, loopback)")
+    benchmark()
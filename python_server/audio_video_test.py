@@ -3,241 +3,373 @@
 Automated ESP32 audio streaming test
 """
 import socket
-import struct
 import threading
 import time
 import sys
-import numpy as np
 import os
-from collections import defaultdict
 
 # Global variables for thread-safe video display
-current_frame = None
-current_frame_id = None
-frame_condition = threading.Condition()  # Condition variable for frame availability
-import cv2
-
-# ESP32 Command definitions
-class Commands:
-    REQUEST_TALK = 0
-    END_TALK = 1
-    GRANT_TALK = 2
-    DENY_TALK = 3
-    TALK_ENDED = 4
-    DOORBELL_RING = 5
-    OPEN_DOOR = 6
-
-# Packet type definitions (matching udp_stream.c)
-class PacketTypes:
-    AUDIO_PACKAGE = 0
-    VIDEO_PACKAGE = 1
-
-HEADER_FORMAT = '<BIQH'
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
-
-# Video packet header format
-VIDEO_HEADER_FORMAT = '<BIQHHH'
-VIDEO_HEADER_SIZE = struct.calcsize(VIDEO_HEADER_FORMAT)
-
-# Configuration
-TCP_PORT = 12345
-UDP_PORT = 12345
-VIDEO_UDP_PORT = 12346
-CHUNK_SIZE = 324
-SAMPLE_RATE = 8000
-
-def parse_video_header(data):
-    """Parse video packet header and return header info and video data"""
-    if len(data) < VIDEO_HEADER_SIZE:
-        return None, None
-        
-    packet_type, frame_id, timestamp, length, packet_seq, total_packets = struct.unpack(VIDEO_HEADER_FORMAT, data[:VIDEO_HEADER_SIZE])
-    
-    video_data = data[VIDEO_HEADER_SIZE:VIDEO_HEADER_SIZE + length]
-    
-    header_info = {
-        'type': packet_type,
-        'frame_id': frame_id,
-        'timestamp': timestamp,
-        'length': length,
-        'packet_seq': packet_seq,
-        'total_packets': total_packets
-    }
-    
-    return header_info, video_data
+frame_mailbox = None  # FrameMailbox of (frame, frame_id, valid_fraction, timestamp, due) for the main thread
+last_good_image = None  # Last fully received decoded frame, used to conceal salvaged ones
+decode_pool = None  # DecodePool when frames are decoded off the main thread
+frame_decoder = None  # FrameDecoder shared by the display and any other video consumer
+presentation_scheduler = None  # PresentationScheduler when display is paced by capture timestamps
 
-def parse_audio_header(data):
-    """Parse UDP packet header and return header info and audio data"""
-    
-    packet_type, seq_num, timestamp, length = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
-
-    audio_data = data[HEADER_SIZE:HEADER_SIZE + length]
-
-    header_info = {
-        'type': packet_type,
-        'sequence': seq_num,
-        'timestamp': timestamp,
-        'length': length
-    }
+# cv2 and video_decode (which needs cv2) are imported on first use, so --headless never loads OpenCV
+from protocol import (
+    Commands, PacketTypes, HEADER_SIZE, TCP_PORT, UDP_PORT, VIDEO_UDP_PORT,
+    CHUNK_SIZE, SAMPLE_RATE, MAX_VIDEO_PACKET_SIZE, HDR_TYPE, HDR_SEQUENCE, HDR_FRAME_ID,
+    HDR_TIMESTAMP, serial_diff, AudioCodecs, PACKET_TYPE_MASK, CODEC_SHIFT,
+    COMMAND, COMMAND_SIZE, AUDIO_HEADER, SID_SIZE, pack_command,
+    parse_audio_header, parse_video_header,
+)
+from receive_engine import BatchReceiver
+from reactor import Reactor
+from reassembly import FrameReassembler
+from receiver_process import ReceiverProcess
+from frame_mailbox import FrameMailbox
+from presentation import PresentationScheduler
+from jitter_buffer import CHUNK_DURATION, JitterBuffer
+from audio_ring import AudioRing
+from dtx import ComfortNoise
+from audio_uplink import AudioSender
+from latency_probe import PROBE_INTERVAL, LatencyProbe
+import audio_codec
 
-    return header_info, audio_data
+def has_jpeg_markers(frame_data):
+    """Check the SOI and EOI markers of a reassembled frame"""
+    return (len(frame_data) >= 10 and frame_data[0] == 0xFF and frame_data[1] == 0xD8
+            and frame_data[-2] == 0xFF and frame_data[-1] == 0xD9)
 
-def queue_video_frame_for_display(frame_data, frame_id):
+def queue_video_frame_for_display(frame_data, frame_id, valid_fraction=1.0, timestamp=None):
     """Set current frame for main thread display (thread-safe)"""
-    global current_frame, current_frame_id
-    
     # First, validate the JPEG data
-    if len(frame_data) < 10:
-        return True
-    
-    # Check JPEG header and footer
-    has_jpeg_header = frame_data[0] == 0xFF and frame_data[1] == 0xD8
-    has_jpeg_footer = frame_data[-2] == 0xFF and frame_data[-1] == 0xD9
-    
-    if not has_jpeg_header:
+    if not has_jpeg_markers(frame_data):
         return True
-    
-    if not has_jpeg_footer:
+
+    # Paced display: due time from the capture timestamp (salvaged frames have none and show at once)
+    due = None
+    if presentation_scheduler is not None and timestamp is not None:
+        due = presentation_scheduler.schedule(timestamp)
+
+    if decode_pool is not None:
+        # Decoded on a worker; queue_decoded_frame hands it over in frame order
+        decode_pool.submit(frame_id, frame_data, (valid_fraction, timestamp, due))
         return True
     
-    # Set current frame and notify main thread
-    with frame_condition:
-        current_frame = frame_data
-        current_frame_id = frame_id
-        frame_condition.notify()
-        
+    # Set current frame, replacing one the main thread has not shown yet
+    frame_mailbox.put((frame_data, frame_id, valid_fraction, timestamp, due))
     return True
 
-def display_frame(frame_data, frame_id):
-    """Display the current frame (called from main thread only)"""
-        
+def queue_decoded_frame(frame_id, image, meta):
+    """Set a frame decoded by the pool for main thread display (thread-safe)"""
+    valid_fraction, timestamp, due = meta
+    frame_mailbox.put((image, frame_id, valid_fraction, timestamp, due))
+
+def display_frame(frame_data, frame_id, valid_fraction=1.0, keep_last_good=False, mode='full', unchanged=None):
+    """Decode and display the current frame (called from main thread only)"""
     # Verify JPEG markers
-    if not (frame_data[0] == 0xFF and frame_data[1] == 0xD8 and frame_data[-2] == 0xFF and frame_data[-1] == 0xD9):
+    if not has_jpeg_markers(frame_data):
         print(f"Frame {frame_id} has invalid JPEG markers, skipping")
         return False
     
-    # Decode JPEG data
-    frame_array = np.frombuffer(frame_data, dtype=np.uint8)
-    frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
+    # Decode JPEG data, unless an UnchangedFrameFilter finds the picture already on screen
+    if unchanged is not None and valid_fraction >= 1.0:
+        frame, changed = unchanged.decode(frame_data)
+        if not changed:
+            return poll_quit_key()
+    else:
+        if unchanged is not None:
+            unchanged.reset()  # The salvaged frame replaces the filter's reference on screen
+        frame = frame_decoder.image(frame_id, frame_data, mode)
     
+    if frame is None:
+        print(f"Failed to decode frame {frame_id}")
+        return True
+
+    return show_frame(frame, frame_id, valid_fraction, keep_last_good, copy=frame_decoder.shared(mode))
+
+def show_frame(frame, frame_id, valid_fraction=1.0, keep_last_good=False, copy=False):
+    """Display a decoded frame (called from main thread only)"""
+    global last_good_image
+    import cv2
+    from video_decode import conceal_missing_rows
+
     if frame is not None:
+        if copy:
+            frame = frame.copy()  # Other consumers of the FrameDecoder hold the same array
+        if valid_fraction < 1.0:
+            # Salvaged frame: fill the rows that never arrived from the last good frame
+            conceal_missing_rows(frame, last_good_image, valid_fraction)
+        elif keep_last_good:
+            last_good_image = frame.copy()
+        
         # Add frame info overlay
-        cv2.putText(frame, f"Frame {frame_id}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        # Scaled to the reduced decode modes; grayscale frames take a single intensity
+        scale = frame.shape[1] / 640
+        cv2.putText(frame, f"Frame {frame_id}", (int(10 * scale), int(30 * scale)), 
+                   cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 255, 0) if frame.ndim == 3 else 255, max(1, int(2 * scale)))
         
         # Display frame (safe in main thread)
         cv2.imshow('ESP32 Video Stream', frame)
         
-        # Check for quit key
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q') or key == 27:  # 'q' or ESC to quit
-            print("User quit detected")
-            return False
-    else:
-        print(f"Failed to decode frame {frame_id}")
+        return poll_quit_key()
 
     return True
 
-def audio_processing_thread(udp_recv, udp_send, esp32_ip, stats, stop_event):
-    """Dedicated thread for audio packet processing"""
-    # Audio processing variables
-    seq = None
-    audio_store = {}
-    
-    while not stop_event.is_set():
+def poll_quit_key():
+    """Service the video window; return False if 'q' or ESC was pressed"""
+    import cv2
+
+    key = cv2.waitKey(1) & 0xFF
+    if key == ord('q') or key == 27:  # 'q' or ESC to quit
+        print("User quit detected")
+        return False
+    return True
+
+class AudioProcessor:
+    """Audio packet processing, driven by the I/O loop when the socket is readable"""
+
+    def __init__(self, udp_recv, udp_send, esp32_ip, stats, jitter_buffer=None, concealer=None):
+        self.udp_send = udp_send
+        self.esp32_addr = (esp32_ip, UDP_PORT)
+        self.stats = stats
+        self.jitter_buffer = jitter_buffer
+        self.concealer = concealer
+        # Sequence numbers of the playout echo: one per tick, held ticks included, never reused
+        self.playout_sequence = 0
+        self.receiver = None
+        if udp_recv is not None:
+            self.receiver = BatchReceiver(udp_recv, CHUNK_SIZE + HEADER_SIZE + 50, slot_count=16)
+        # Audio processing variables
+        self.seq = None
+        self.first_seq = None
+        self.in_silence = False  # A silence descriptor came after the last audio chunk
+        self.codec = AudioCodecs.PCM16  # Codec of the last chunk received; playout answers in the same one
+        self.encoder = audio_codec.Encoder(self.codec)
+        # Last 10 s of received audio for recorders, level meters and loopback analysis
+        self.ring = AudioRing(10.0)
+
+    def on_readable(self, sock):
         try:
-            data, addr = udp_recv.recvfrom(CHUNK_SIZE + HEADER_SIZE + 50)
+            batch = self.receiver.receive()
+        except BlockingIOError:
+            return
+        except Exception as e:
+            print(f"Audio receive error: {e}")
+            return
+
+        for data in batch:
+            self.handle(data)
+
+    def handle(self, data):
+        """Process one audio datagram"""
+        # Parse the header and extract audio data
+        header_info, audio_data = parse_audio_header(data)
+        
+        if header_info is None:
+            return
+        
+        packet_type = header_info[HDR_TYPE] & PACKET_TYPE_MASK
+        if packet_type == PacketTypes.AUDIO_SID and len(audio_data) >= SID_SIZE:
+            # The doorbell stopped sending while it is quiet; this is not echoed
+            self.stats['silence_descriptors'] += 1
+            self.in_silence = True
+            self.seq = header_info[HDR_SEQUENCE]
+            if self.jitter_buffer is not None:
+                self.jitter_buffer.push_silence(header_info, audio_data[0])
+            return
+
+        if packet_type == PacketTypes.AUDIO_PACKAGE:
+            self.stats['audio_packets'] += 1
+            codec = header_info[HDR_TYPE] >> CODEC_SHIFT
+            if codec != AudioCodecs.PCM16:
+                # Everything past this point works on linear PCM; the echo below still sends the packet as received
+                audio_data = audio_codec.decode(audio_data, codec)
+                if audio_data is None:
+                    return
+            if codec != self.codec:
+                self.codec = codec
+                self.encoder = audio_codec.Encoder(codec)
+            if len(audio_data) == CHUNK_SIZE:
+                if self.first_seq is None:
+                    self.first_seq = header_info[HDR_SEQUENCE]
+                self.ring.insert(header_info[HDR_SEQUENCE], audio_data)
+
+            if self.jitter_buffer is not None:
+                # Reordered, late and duplicate chunks are sorted out (and counted) by the buffer
+                self.jitter_buffer.push(header_info, audio_data)
+                self.seq = header_info[HDR_SEQUENCE]
+                return
             
-            # Parse the header and extract audio data
-            header_info, audio_data = parse_audio_header(data)
+            # Check for missing sequences (chunks suppressed as silence are not missing)
+            if self.seq is not None and self.seq + 1 != header_info[HDR_SEQUENCE] and not self.in_silence:
+                print(f"Missing audio sequence: expected {self.seq + 1}, got {header_info[HDR_SEQUENCE]}")
+            self.seq = header_info[HDR_SEQUENCE]
+            self.in_silence = False
+
+            # The receiver process echoes on its own when it owns the sockets
+            if self.udp_send is not None:
+                self.udp_send.sendto(data, self.esp32_addr)
+
+    def playout(self):
+        """Echo the next chunk from the jitter buffer, called every CHUNK_DURATION by the I/O loop"""
+        chunk = self.jitter_buffer.pop()
+        if chunk is None or self.udp_send is None:
+            return
+        _, timestamp, payload, concealed = chunk
+        if self.concealer is not None:
+            # Every slot goes through the concealer, so its pitch history stays continuous
+            payload = self.concealer.process(None if concealed else payload).tobytes()
+        payload = self.encoder.encode(payload)
+        header = AUDIO_HEADER.pack(PacketTypes.AUDIO_PACKAGE | self.codec << CODEC_SHIFT, self.playout_sequence,
+                                   int(timestamp), len(payload))
+        self.playout_sequence = (self.playout_sequence + 1) & 0xFFFFFFFF
+        self.udp_send.sendto(header + payload, self.esp32_addr)
+
+class VideoProcessor:
+    """Video packet reassembly, driven by the I/O loop when the socket is readable"""
+
+    def __init__(self, video_udp_recv, stats, salvage=False, sink=None):
+        self.stats = stats
+        self.sink = sink or queue_video_frame_for_display
+        self.receiver = None
+        if video_udp_recv is not None:
+            self.receiver = BatchReceiver(video_udp_recv, MAX_VIDEO_PACKET_SIZE, slot_count=64)
+        self.reassembler = FrameReassembler(salvage=salvage)
+        self.last_delivered = None  # Frame ID last handed to the sink
+
+    def on_readable(self, sock):
+        try:
+            batch = self.receiver.receive()
+        except BlockingIOError:
+            return
+        except Exception as e:
+            print(f"Video receive error: {e}")
+            return
+
+        for video_data in batch:
+            self.handle(video_data)
+
+    def handle(self, video_data):
+        """Process one video datagram"""
+        stats = self.stats
+        video_header, video_payload = parse_video_header(video_data)
+        
+        if video_header and video_header[HDR_TYPE] == PacketTypes.VIDEO_PACKAGE:
+            stats['video_packets'] += 1
             
-            if header_info is None:
-                continue
+            # Track unique frames
+            stats['unique_frames_seen'].add(video_header[HDR_FRAME_ID])
             
-            if header_info['type'] == PacketTypes.AUDIO_PACKAGE:
-                stats['audio_packets'] += 1
+            completed = self.reassembler.add(video_header, video_payload)
+
+            # Partial frames salvaged on eviction (salvage mode only). They go first: the sink keeps
+            # only the latest frame, and a frame completed by this fragment is newer than any of them
+            salvaged = self.reassembler.salvaged
+            while salvaged:
+                frame_id, frame_data, valid_fraction = salvaged.popleft()
+                if self.last_delivered is not None and serial_diff(frame_id, self.last_delivered) <= 0:
+                    continue
+                self.last_delivered = frame_id
+                self.sink(frame_data, frame_id, valid_fraction)
+
+            if completed is not None:
+                # Queue frame for display in main thread
+                self.last_delivered = completed[0]
+                self.sink(completed[1], completed[0], 1.0, video_header[HDR_TIMESTAMP])
                 
-                # Check for missing sequences
-                if seq is not None and seq + 1 != header_info['sequence']:
-                    print(f"Missing audio sequence: expected {seq + 1}, got {header_info['sequence']}")
-                seq = header_info['sequence']
-
-                udp_send.sendto(data, (esp32_ip, UDP_PORT))
-
-                # Prune old entries
-                if len(audio_store) > 2000:
-                    cutoff = seq - 1000
-                    for k in list(audio_store.keys()):
-                        if k < cutoff:
-                            del audio_store[k]
-
-        except socket.timeout:
-            continue
-        except Exception as e:
-            if not stop_event.is_set():
-                print(f"Audio receive error: {e}")
+                stats['completed_frames'] += 1
 
-def video_processing_thread(video_udp_recv, stats, stop_event):
-    """Simple video packet processing thread"""
-    video_frames = defaultdict(dict)
-    video_frame_info = {}
-    
-    while not stop_event.is_set():
+    def finish(self):
+        print("Video processing stopping...")
+        
+        # Report any remaining incomplete frames
+        if len(self.reassembler) > 0:
+            print(f"{len(self.reassembler)} incomplete video frames at end")
+
+class ControlChannel:
+    """Commands sent by the ESP32 on the TCP connection during a talk session"""
+
+    def __init__(self, on_close):
+        self.on_close = on_close
+        self.pending = b''
+
+    def on_readable(self, sock):
         try:
-            video_data, video_addr = video_udp_recv.recvfrom(65535)  # Max UDP packet size
-            video_header, video_payload = parse_video_header(video_data)
-            
-            if video_header and video_header['type'] == PacketTypes.VIDEO_PACKAGE:
-                stats['video_packets'] += 1
-                frame_id = video_header['frame_id']
-                packet_seq = video_header['packet_seq']
-                total_packets = video_header['total_packets']
-                
-                # Track unique frames
-                stats['unique_frames_seen'].add(frame_id)
-                
-                # Initialize frame info if needed
-                if frame_id not in video_frame_info:
-                    video_frame_info[frame_id] = {
-                        'total_packets': total_packets,
-                        'received_packets': set()
-                    }
-                
-                # Store packet
-                video_frames[frame_id][packet_seq] = video_payload
-                video_frame_info[frame_id]['received_packets'].add(packet_seq)
-                
-                # Check if frame is complete
-                if len(video_frame_info[frame_id]['received_packets']) == total_packets:
-                    
-                    # Assemble frame data quickly
-                    frame_data = b''.join(video_frames[frame_id][i] for i in range(total_packets))
-                    
-                    # Queue frame for display in main thread
-                    queue_video_frame_for_display(frame_data, frame_id)
-                    
-                    stats['completed_frames'] += 1
-                    
-                    # Clean up completed frame
-                    del video_frames[frame_id]
-                    del video_frame_info[frame_id]
-
-        except socket.timeout:
-            # Don't spam timeout messages
-            continue
-        except Exception as e:
-            if not stop_event.is_set():
-                print(f"Video receive error: {e}")
-    
-    print("Video processing thread stopping...")
-    
-    # Report any remaining incomplete frames
-    if len(video_frames) > 0:
-        print(f"{len(video_frames)} incomplete video frames at end")
+            data = sock.recv(64)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Control connection error: {e}")
+            data = b''
+
+        if not data:
+            print("Control connection closed by ESP32")
+            self.on_close()
+            return
 
-def test_esp32_audio_video(esp32_ip: str):
-    """Test ESP32 audio and video streaming with multi-threading"""
+        self.pending += data
+        while len(self.pending) >= COMMAND_SIZE:
+            command = COMMAND.unpack_from(self.pending)[0]
+            self.pending = self.pending[COMMAND_SIZE:]
+            if command == Commands.TALK_ENDED:
+                print("Talk session ended by ESP32")
+                self.on_close()
+            elif command == Commands.DOORBELL_RING:
+                print("Doorbell ring")
+            else:
+                print(f"Unexpected command: {command}")
+
+def test_esp32_audio_video(esp32_ip: str, receiver_process=False, salvage=False, decode_workers=0,
+                           decode_mode='full', headless=False, paced=False, skip_unchanged=False,
+                           jitter_buffer=False, plc=False, send_audio=None,
+                           codec=AudioCodecs.PCM16, latency_probe=False, analytics=False):
+    """Test ESP32 audio and video streaming with a single event-driven I/O thread"""
+    global decode_pool, frame_decoder, frame_mailbox, presentation_scheduler
     print(f"Testing ESP32 audio and video streaming with {esp32_ip}")
+    startup_start = time.perf_counter()
+
+    # Headless runs reassemble and validate frames but never load OpenCV
+    display_import_time = unchanged = None
+    if not headless:
+        import cv2
+        from video_decode import DECODE_MODES, DecodePool, FrameDecoder, UnchangedFrameFilter
+        display_import_time = time.perf_counter() - startup_start
+        frame_decoder = FrameDecoder()
+        if skip_unchanged and not decode_workers:
+            unchanged = UnchangedFrameFilter(flags=DECODE_MODES[decode_mode])
+    concealer = None
+    if plc:
+        from audio_concealment import LossConcealer
+        concealer = LossConcealer()
+        jitter_buffer = True
+    sender = uplink_sock = None
+    if send_audio is not None:
+        uplink_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sender = AudioSender(uplink_sock, (esp32_ip, UDP_PORT), send_audio, codec=codec)
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Cannot send audio: {e}")
+            uplink_sock.close()
+            return False
+    probe = probe_sock = None
+    if latency_probe:
+        # Own socket: the doorbell reflects each probe to its sender, away from the audio stream
+        probe_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        probe = LatencyProbe(probe_sock, (esp32_ip, UDP_PORT))
+    analyzer = None
+    if analytics:
+        from audio_analytics import ANALYSIS_INTERVAL, AudioAnalyzer
+
+        def report_audio_event(kind, sequence, value):
+            if kind == 'voice_started':
+                print(f"Voice started at the door (audio chunk {sequence})")
+            elif kind == 'voice_stopped':
+                print(f"Voice stopped after {value:.1f} s")
+            elif kind == 'clipping':
+                print(f"Audio clipping: {value} samples at full scale in chunk {sequence}")
+        analyzer = AudioAnalyzer(on_event=report_audio_event)
     
     # Connect TCP
     tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -246,71 +378,84 @@ def test_esp32_audio_video(esp32_ip: str):
         print("TCP connected")
     except Exception as e:
         print(f"TCP connection failed: {e}")
+        # The uplink and probe sockets were opened before connecting
+        for sock in (tcp_sock, uplink_sock, probe_sock):
+            if sock:
+                sock.close()
         return False
     
-    # Setup UDP
-    udp_send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
-    # Setup video UDP
-    video_udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
-    # Increase UDP receive buffer size to handle burst of packets
-    try:
-        # Try to set a large receive buffer (4MB)
-        video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
-        actual_buffer = video_udp_recv.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
-    except Exception as e:
-        print(f"Could not set large UDP buffer: {e}")
-    
-    try:
-        udp_recv.bind(('0.0.0.0', UDP_PORT))
-        video_udp_recv.bind(('0.0.0.0', VIDEO_UDP_PORT))
-        print("UDP sockets ready (audio + video)")
-    except Exception as e:
-        print(f"UDP bind failed: {e}")
+    udp_send = udp_recv = video_udp_recv = receiver = None
+
+    def close_sockets():
         tcp_sock.close()
-        video_udp_recv.close()
-        return False
+        for sock in (udp_send, udp_recv, video_udp_recv, uplink_sock, probe_sock):
+            if sock:
+                sock.close()
+        if receiver:
+            receiver.stop()
+
+    if receiver_process:
+        # A separate process owns the UDP sockets and hands datagrams over in shared memory. It echoes
+        # audio on arrival unless this process sends the uplink: a file, or jitter-buffer playout
+        receiver = ReceiverProcess(esp32_ip, echo_audio=send_audio is None and not jitter_buffer)
+        if send_audio is None and jitter_buffer:
+            udp_send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if not receiver.start():
+            print("Receiver process failed to start")
+            close_sockets()
+            return False
+        print("UDP receiver process ready (audio + video)")
+    else:
+        # Setup UDP
+        udp_send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        # Setup video UDP
+        video_udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        # Increase UDP receive buffer size to handle burst of packets
+        try:
+            # Try to set a large receive buffer (4MB)
+            video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            actual_buffer = video_udp_recv.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except Exception as e:
+            print(f"Could not set large UDP buffer: {e}")
+        
+        try:
+            udp_recv.bind(('0.0.0.0', UDP_PORT))
+            video_udp_recv.bind(('0.0.0.0', VIDEO_UDP_PORT))
+            print("UDP sockets ready (audio + video)")
+        except Exception as e:
+            print(f"UDP bind failed: {e}")
+            close_sockets()
+            return False
     
     # Send talk request
     print("Requesting talk permission...")
-    talk_request = struct.pack('<I', Commands.REQUEST_TALK)
+    talk_request = pack_command(Commands.REQUEST_TALK)
     tcp_sock.send(talk_request)
     
     # Wait for response
     try:
         tcp_sock.settimeout(5.0)
-        response_data = tcp_sock.recv(4)
-        if len(response_data) == 4:
-            response = struct.unpack('<I', response_data)[0]
+        response_data = tcp_sock.recv(COMMAND_SIZE)
+        if len(response_data) == COMMAND_SIZE:
+            response = COMMAND.unpack(response_data)[0]
             if response == Commands.GRANT_TALK:
                 print("Talk permission GRANTED")
             else:
                 print(f"Unexpected response: {response}")
-                tcp_sock.close()
-                udp_send.close()
-                udp_recv.close()
-                if video_udp_recv:
-                    video_udp_recv.close()
+                close_sockets()
                 return False
         else:
             print("No response from ESP32")
-            tcp_sock.close()
-            udp_send.close()
-            udp_recv.close()
-            if video_udp_recv:
-                video_udp_recv.close()
+            close_sockets()
             return False
     except socket.timeout:
         print("Timeout waiting for talk permission")
-        tcp_sock.close()
-        udp_send.close()
-        udp_recv.close()
-        if video_udp_recv:
-            video_udp_recv.close()
+        close_sockets()
         return False
     
     # Shared statistics dictionary (thread-safe for simple counters)
@@ -319,86 +464,162 @@ def test_esp32_audio_video(esp32_ip: str):
         'video_packets': 0,
         'completed_frames': 0,
         'unique_frames_seen': set(),  # Track unique frame IDs
+        'valid_frames': 0,  # Headless mode: frames with intact JPEG markers
+        'invalid_frames': 0,
+        'silence_descriptors': 0,  # Audio chunks the doorbell suppressed as silence (DTX) are announced by these
     }
+
+    def check_frame(frame_data, frame_id, valid_fraction=1.0, timestamp=None):
+        """Headless frame sink: validate the JPEG markers instead of decoding"""
+        if has_jpeg_markers(frame_data):
+            stats['valid_frames'] += 1
+        else:
+            stats['invalid_frames'] += 1
     
-    # Threading control
+    # Single I/O thread multiplexes audio, video and control sockets
     stop_event = threading.Event()
-    threads = []
-    
-    # Set UDP receive timeout for threads
-    udp_recv.settimeout(0.1)
-    if video_udp_recv:
-        video_udp_recv.settimeout(0.1)
-    
-    # Start audio processing thread
-    audio_thread = threading.Thread(
-        target=audio_processing_thread,
-        args=(udp_recv, udp_send, esp32_ip, stats, stop_event),
-        name="AudioProcessor"
-    )
-    audio_thread.daemon = True
-    audio_thread.start()
-    threads.append(audio_thread)
-    print("Audio processing thread started")
-    
-    # Start video processing thread
-    video_thread = threading.Thread(
-        target=video_processing_thread,
-        args=(video_udp_recv, stats, stop_event),
-        name="VideoProcessor"
-    )
-    video_thread.daemon = True
-    video_thread.start()
-    threads.append(video_thread)
-    print("Video processing thread started")
+    frame_mailbox = FrameMailbox()
+    presentation_scheduler = PresentationScheduler() if paced and not headless else None
+    reactor = Reactor()
+    # The uplink carries either the echo or the file being sent, never both
+    audio_processor = AudioProcessor(udp_recv, udp_send if send_audio is None else None, esp32_ip, stats,
+                                     jitter_buffer=JitterBuffer(comfort=ComfortNoise().chunk) if jitter_buffer else None,
+                                     concealer=concealer)
+    video_processor = VideoProcessor(video_udp_recv, stats, salvage=salvage,
+                                     sink=check_frame if headless else None)
+
+    def shutdown():
+        stop_event.set()
+        reactor.stop()
+        frame_mailbox.close()
+
+    control = ControlChannel(shutdown)
+    if receiver:
+        reactor.register(receiver.sock, lambda sock: receiver.drain(audio_processor.handle, video_processor.handle))
+    else:
+        reactor.register(udp_recv, audio_processor.on_readable)
+        reactor.register(video_udp_recv, video_processor.on_readable)
+    reactor.register(tcp_sock, control.on_readable)
+    if probe is not None:
+        reactor.register(probe_sock, probe.on_readable)
+        reactor.call_every(PROBE_INTERVAL, probe.send)
+    if analyzer is not None:
+        # Batches of about 5 chunks, read in place from the audio ring on the I/O thread that fills it
+        reactor.call_every(ANALYSIS_INTERVAL, lambda: analyzer.follow(audio_processor.ring))
 
     # Start time for test duration
     start_time = time.time()
-    
-    # Main thread monitors for duration, early exit, and displays video frames
+
+    rate_window = {'start': start_time, 'packets': 0, 'peak': 0.0}
+
+    def sample_packet_rate():
+        """Track the highest packet rate sustained over one stats interval"""
+        now = time.time()
+        packets = stats['audio_packets'] + stats['video_packets']
+        if now > rate_window['start']:
+            rate = (packets - rate_window['packets']) / (now - rate_window['start'])
+            rate_window['peak'] = max(rate_window['peak'], rate)
+        rate_window['start'] = now
+        rate_window['packets'] = packets
+
+    def print_stats():
+        elapsed = time.time() - start_time
+        sample_packet_rate()
+        print(f"{elapsed:.1f}s - Audio: {stats['audio_packets']}, Video: {stats['video_packets']}, Frames: {stats['completed_frames']}")
+
+    reactor.call_every(5.0, print_stats)
+    if jitter_buffer:
+        # Steady playout clock; the reactor schedules each tick from the previous deadline, not from now
+        reactor.call_every(CHUNK_DURATION, audio_processor.playout)
+    if sender is not None:
+        # Paced from the I/O loop rather than a thread of its own, so sending never competes with receiving
+        def send_due_audio():
+            deadline = sender.poll()
+            if deadline is not None:
+                reactor.call_later(max(0.0, deadline - time.monotonic()), send_due_audio)
+        reactor.call_later(0.0, send_due_audio)
+
+    if decode_workers and not headless:
+        decode_pool = DecodePool(decode_workers, queue_decoded_frame, decoder=frame_decoder, mode=decode_mode)
+        print(f"JPEG decode pool started ({decode_workers} workers)")
+
+    def run_io():
+        try:
+            reactor.run()
+        finally:
+            shutdown()
+
+    io_thread = threading.Thread(target=run_io, name="NetworkIO")
+    io_thread.daemon = True
+    io_thread.start()
+    if sender is not None:
+        print(f"Sending {send_audio} to the device")
+    startup_time = time.perf_counter() - startup_start
+    print("Network I/O thread started")
+    
+    # Main thread displays video frames, sleeping until one arrives or the session stops
     try:
+        if headless:
+            # Nothing to display: sleep until the session stops
+            stop_event.wait()
         while not stop_event.is_set():
-            # Handle video frame display in main thread (thread-safe)
-            with frame_condition:
-                frame_condition.wait(timeout=0.1)  # 100ms timeout to check stop_event
-                global current_frame, current_frame_id
-                if current_frame and current_frame_id:
-                    if not display_frame(current_frame, current_frame_id):
-                        # User pressed 'q' or ESC to quit
-                        print("Video display stopped by user")
-                        stop_event.set()
-                        break
-                current_frame = None
-                current_frame_id = None
-
-            # Print periodic stats
-            elapsed = time.time() - start_time
-            if int(elapsed) % 5 == 0 and elapsed - int(elapsed) < 0.1:  # Every 5 seconds
-                print(f"{elapsed:.1f}s - Audio: {stats['audio_packets']}, Video: {stats['video_packets']}, Frames: {stats['completed_frames']}")
+            latest = frame_mailbox.take()
+            if latest is None:
+                break
+            frame_data, frame_id, valid_fraction, timestamp, due = latest
+            if due is not None:
+                # Skip frames that can no longer make their deadline before spending a decode on them
+                if presentation_scheduler.is_late(due):
+                    continue
+                wait = presentation_scheduler.wait_time(due)
+                if wait > 0 and stop_event.wait(wait):
+                    break
+                render_started = time.monotonic()
+            if decode_pool is not None:
+                displayed = show_frame(frame_data, frame_id, valid_fraction, keep_last_good=salvage,
+                                       copy=frame_decoder.shared(decode_mode))
+            else:
+                displayed = display_frame(frame_data, frame_id, valid_fraction, keep_last_good=salvage,
+                                          mode=decode_mode, unchanged=unchanged)
+            if not displayed:
+                # User pressed 'q' or ESC to quit
+                print("Video display stopped by user")
+                break
+            if due is not None:
+                presentation_scheduler.presented(due, timestamp, render_started)
     except KeyboardInterrupt:
         print("\nInterrupted by user")
-        stop_event.set()
-    
-    # Signal threads to stop and wait for completion
-    stop_event.set()
-    print("\nStopping processing threads...")
     
-    for thread in threads:
-        thread.join(timeout=1.0)
-        if thread.is_alive():
-            print(f"Thread {thread.name} did not stop gracefully")
+    # Signal the I/O loop to stop and wait for completion
+    print("\nStopping network I/O...")
+    stop_start = time.perf_counter()
+    shutdown()
+    io_thread.join(timeout=1.0)
+    stop_latency = time.perf_counter() - stop_start
+    sample_packet_rate()
+    if io_thread.is_alive():
+        print(f"Thread {io_thread.name} did not stop gracefully")
+    reactor.close()
+    video_processor.finish()
+    if decode_pool is not None:
+        decode_pool.close()
     
     # End talk session
     print("Ending talk session...")
-    end_talk = struct.pack('<I', Commands.END_TALK)
-    tcp_sock.send(end_talk)
+    end_talk = pack_command(Commands.END_TALK)
+    try:
+        tcp_sock.setblocking(True)
+        tcp_sock.send(end_talk)
+    except OSError as e:
+        print(f"Could not send end of talk: {e}")
 
     end_time= time.time()
     elapsed_time = end_time - start_time
     
     # Cleanup video window if it was opened
-    cv2.destroyAllWindows()
-    print("Video display window closed")
+    if not headless:
+        cv2.destroyAllWindows()
+        print("Video display window closed")
     
     # Results
     print(f"\nTest Results:")
@@ -420,6 +641,102 @@ def test_esp32_audio_video(esp32_ip: str):
     print(f"  Audio rate: {stats['audio_packets']/elapsed_time:.1f} packets/sec")
     print(f"  Video rate: {stats['video_packets']/elapsed_time:.1f} packets/sec")
     print(f"  Video frame rate: {stats['completed_frames']/elapsed_time:.1f} frames/sec")
+    if not headless:
+        print(f"  Frames skipped by display: {frame_mailbox.overwritten} (replaced before the main thread took them)")
+    if audio_processor.codec != AudioCodecs.PCM16:
+        print(f"  Audio codec: {audio_codec.codec_name(audio_processor.codec).upper()} "
+              f"({audio_codec.payload_size(audio_processor.codec)}-byte payloads, echoed in the same codec)")
+    ring = audio_processor.ring
+    if ring.newest is not None:
+        span = min(ring.capacity, serial_diff(ring.newest, audio_processor.first_seq) + 1)
+        samples, received = ring.window((ring.newest - span + 1) & 0xFFFFFFFF, span)
+        peak = max(int(samples.max()), -int(samples.min()))
+        print(f"  Audio ring: {int(received.sum())}/{len(received)} chunks of the last {len(received) * CHUNK_DURATION:.1f} s "
+              f"received, peak level {peak}")
+    if stats['silence_descriptors']:
+        comfort = audio_processor.jitter_buffer.stats['comfort_noise'] if audio_processor.jitter_buffer is not None else 0
+        print(f"  Silence suppression: {stats['silence_descriptors']} silence descriptors from the doorbell, "
+              f"{comfort} chunks of comfort noise played")
+    if audio_processor.jitter_buffer is not None:
+        buffer = audio_processor.jitter_buffer
+        buffer_stats = buffer.stats
+        print(f"  Jitter buffer: {buffer_stats['played']} played, {buffer_stats['lost']} lost and "
+              f"{buffer_stats['underruns'] + buffer_stats['stretched']} held (silence inserted)")
+        print(f"  Jitter buffer: {buffer_stats['late']} late, {buffer_stats['duplicates']} duplicates, "
+              f"{buffer_stats['malformed']} malformed, "
+              f"{buffer_stats['discarded']} discarded, occupancy {len(buffer)} (max {buffer_stats['max_occupancy']})")
+        print(f"  Jitter buffer: added latency {1000 * buffer.added_latency():.1f} ms, "
+              f"target {buffer.target:.1f} chunks, network jitter {1000 * buffer.jitter:.1f} ms")
+    if sender is not None:
+        uplink = sender.summary()
+        print(f"  Audio uplink: {sender.stats['sent']} chunks sent{' (file finished)' if sender.done else ''}, "
+              f"send jitter p50 {1e6 * uplink['jitter_p50']:.0f} us, p99 {1e6 * uplink['jitter_p99']:.0f} us, "
+              f"max {1e6 * uplink['jitter_max']:.0f} us, {sender.stats['resyncs']} clock restarts")
+    if probe is not None:
+        latency = probe.summary()
+        print(f"  Audio round trip: {probe.stats['received']}/{probe.stats['sent']} probes answered, "
+              f"min {1000 * latency['rtt_min']:.1f} ms, p50 {1000 * latency['rtt_p50']:.1f} ms, "
+              f"p90 {1000 * latency['rtt_p90']:.1f} ms, p99 {1000 * latency['rtt_p99']:.1f} ms, "
+              f"max {1000 * latency['rtt_max']:.1f} ms")
+        if latency['offset'] is not None:
+            print(f"  Audio one-way: uplink p50 {1000 * latency['uplink_p50']:.1f} ms (p95 {1000 * latency['uplink_p95']:.1f}), "
+                  f"downlink p50 {1000 * latency['downlink_p50']:.1f} ms (p95 {1000 * latency['downlink_p95']:.1f}), "
+                  f"device clock {latency['offset']:+.3f} s from this host")
+    if analyzer is not None:
+        analytics_stats = analyzer.stats
+        metrics = analyzer.metrics
+        print(f"  Audio analytics: {analytics_stats['chunks']} chunks analyzed, {analytics_stats['voice_segments']} voice segments "
+              f"({analytics_stats['voice_chunks'] * CHUNK_DURATION:.1f} s of speech), "
+              f"{analytics_stats['clipped_chunks']} clipped chunks ({analytics_stats['clipped_samples']} samples)")
+        print(f"  Audio level: {metrics['level_dbfs']:.1f} dBFS, noise floor {metrics['noise_floor_dbfs']:.1f} dBFS, "
+              f"peak {metrics['peak']} in the last batch")
+    if concealer is not None:
+        print(f"  Loss concealment: {concealer.stats['concealed']} chunks synthesized, "
+              f"{concealer.stats['received']} passed through")
+    if unchanged is not None:
+        print(f"  Unchanged frames not decoded: {unchanged.stats['exact_repeats'] + unchanged.stats['near_repeats']}"
+              f"/{unchanged.stats['frames']} ({100 * unchanged.skip_ratio():.1f}%, "
+              f"{unchanged.stats['exact_repeats']} exact repeats)")
+        print(f"  Decode CPU saved: {1000 * unchanged.cpu_saved():.0f} ms "
+              f"(fingerprinting cost {1000 * unchanged.stats['fingerprint_seconds']:.0f} ms)")
+    if presentation_scheduler is not None:
+        pacing = presentation_scheduler.summary()
+        print(f"  Paced display: {presentation_scheduler.stats['presented']} presented, "
+              f"{presentation_scheduler.stats['skipped_late']} skipped as late, delay {1000 * pacing['delay']:.1f} ms")
+        print(f"  Presentation jitter: p50 {1000 * pacing['jitter_p50']:.1f} ms, p95 {1000 * pacing['jitter_p95']:.1f} ms")
+        print(f"  End-to-end display latency: p50 {1000 * pacing['latency_p50']:.1f} ms, "
+              f"p95 {1000 * pacing['latency_p95']:.1f} ms (device clock vs host clock)")
+        presentation_scheduler = None
+    print(f"  Peak packet rate: {rate_window['peak']:.1f} packets/sec (per stats interval)")
+    if headless:
+        print(f"  Validated frames: {stats['valid_frames']} ({stats['invalid_frames']} with bad JPEG markers)")
+        print(f"  Startup time: {1000 * startup_time:.1f} ms (headless, OpenCV {'loaded' if 'cv2' in sys.modules else 'not loaded'})")
+    else:
+        print(f"  Startup time: {1000 * startup_time:.1f} ms (OpenCV import {1000 * display_import_time:.1f} ms)")
+    reassembly_stats = video_processor.reassembler.stats
+    print(f"  Lost video frames: {reassembly_stats['lost_frames']} ({reassembly_stats['capacity_evictions']} evicted for capacity)")
+    if salvage:
+        print(f"  Salvaged video frames: {reassembly_stats['salvaged_frames']}")
+    if reassembly_stats['invalid_fragments'] or reassembly_stats['oversized_fragments']:
+        print(f"  Rejected video fragments: {reassembly_stats['invalid_fragments']} invalid, "
+              f"{reassembly_stats['oversized_fragments']} claiming an oversized frame")
+    print(f"  Superseded video frames: {reassembly_stats['superseded_frames']} (late fragments: {reassembly_stats['late_fragments']})")
+    print(f"  Peak reassembly memory: {reassembly_stats['peak_bytes_in_flight'] / 1024:.0f} KiB")
+    if decode_pool is not None:
+        pool_stats = decode_pool.stats
+        print(f"  Decode rate: {decode_pool.decode_fps():.1f} frames/sec ({decode_workers} workers)")
+        print(f"  Decode queue: max depth {pool_stats['max_depth']}/{decode_pool.max_pending}, "
+              f"{pool_stats['dropped']} dropped, {pool_stats['refused']} refused, {pool_stats['failed']} undecodable")
+        decode_pool = None
+    print(f"  Shutdown latency: {1000 * stop_latency:.1f} ms")
+    print(f"  I/O loop wakeups: {reactor.stats['wakeups']} ({reactor.stats['wakeups']/elapsed_time:.1f}/sec)")
+    if reactor.stats['missed_ticks'] or reactor.stats['callback_errors']:
+        print(f"  I/O loop stalls: {reactor.stats['missed_ticks']} timer ticks skipped, "
+              f"{reactor.stats['callback_errors']} callback errors")
+    if receiver:
+        print(f"  Receiver ring drops: {receiver.ring.dropped}")
+        if receiver.ring.failed:
+            print(f"  Receiver ring records skipped after handler errors: {receiver.ring.failed}")
 
     expected_audio_rate = (SAMPLE_RATE * 2 / CHUNK_SIZE)
     print(f"  Expected audio rate: {expected_audio_rate:.1f} packets/sec")
@@ -440,27 +757,122 @@ def test_esp32_audio_video(esp32_ip: str):
         print("ESP32 appears to be processing audio at good speed")
     
     # Cleanup
-    tcp_sock.close()
-    udp_send.close()
-    udp_recv.close()
-    if video_udp_recv:
-        video_udp_recv.close()
+    close_sockets()
     
     # Report video results
     if stats['completed_frames'] > 0:
-        print(f"Displayed {stats['completed_frames']} video frames in real-time using separate threads")
+        print(f"Displayed {stats['completed_frames']} video frames in real-time using a single I/O thread")
 
     return stats['audio_packets'] > 0
 
+def benchmark_headless(seconds=3.0, frame_size=12000):
+    """Import cost with and without OpenCV, and the packet rate headless processing sustains"""
+    import subprocess
+
+    from protocol import AUDIO_HEADER, VIDEO_HEADER, VIDEO_FRAGMENT_SIZE
+
+    # Fresh interpreters, so nothing is already cached in sys.modules
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, modules in (('headless', 'audio_video_test'), ('display', 'audio_video_test, cv2, video_decode')):
+        times = []
+        for _ in range(5):
+            result = subprocess.run(
+                [sys.executable, '-c', f"import time; t = time.perf_counter(); import {modules}; print(time.perf_counter() - t)"],
+                cwd=here, capture_output=True, text=True, check=True)
+            times.append(float(result.stdout))
+        print(f"  import ({label}): {1000 * min(times):.1f} ms")
+
+    # One frame of fragments followed by audio, at the ESP32's 20 fps : 49 chunks/s mix
+    stats = {'audio_packets': 0, 'video_packets': 0, 'completed_frames': 0,
+             'unique_frames_seen': set(), 'valid_frames': 0}
+
+    def check_frame(frame_data, frame_id, valid_fraction=1.0, timestamp=None):
+        if has_jpeg_markers(frame_data):
+            stats['valid_frames'] += 1
+
+    audio_processor = AudioProcessor(None, None, '127.0.0.1', stats)
+    video_processor = VideoProcessor(None, stats, sink=check_frame)
+    frame = b'\xff\xd8' + os.urandom(frame_size - 4) + b'\xff\xd9'
+    total_packets = (len(frame) + VIDEO_FRAGMENT_SIZE - 1) // VIDEO_FRAGMENT_SIZE
+    fragments = [frame[seq * VIDEO_FRAGMENT_SIZE:(seq + 1) * VIDEO_FRAGMENT_SIZE] for seq in range(total_packets)]
+    audio_chunk = bytes(CHUNK_SIZE)
+
+    frame_id = audio_seq = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(50):
+            frame_id += 1
+            for seq, fragment in enumerate(fragments):
+                video_processor.handle(memoryview(
+                    VIDEO_HEADER.pack(PacketTypes.VIDEO_PACKAGE, frame_id, 0, len(fragment), seq, total_packets) + fragment))
+            for _ in range(2 + frame_id % 2):
+                audio_seq += 1
+                audio_processor.handle(memoryview(
+                    AUDIO_HEADER.pack(PacketTypes.AUDIO_PACKAGE, audio_seq, 0, CHUNK_SIZE) + audio_chunk))
+    elapsed = time.perf_counter() - start
+
+    packets = stats['audio_packets'] + stats['video_packets']
+    print(f"  headless processing: {packets / elapsed:.0f} packets/sec, {stats['valid_frames'] / elapsed:.0f} frames/sec "
+          f"validated ({frame_size // 1000} KB frames, packet building included)")
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python auto_esp32_test.py <esp32_ip>")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    if '--benchmark' in options:
+        print("Headless mode: import cost and maximum packet rate")
+        benchmark_headless()
+        sys.exit(0)
+    if len(args) < 1:
+        print("Usage: python audio_video_test.py <esp32_ip> [--receiver-process] [--salvage] [--decode-workers=N] [--decode-mode=MODE] [--headless] [--paced] [--skip-unchanged] [--jitter-buffer] [--plc] [--send-audio=FILE] [--codec=NAME] [--latency-probe] [--analytics]")
+        print("       python audio_video_test.py --benchmark")
+        print("  --receiver-process  receive UDP in a separate process (shared-memory ring)")
+        print("  --salvage           show incomplete frames, concealing missing rows")
+        print("  --decode-workers=N  decode JPEG frames on N worker threads")
+        print("  --decode-mode=MODE  display resolution: full, half, quarter, eighth or gray (default full)")
+        print("  --headless          no video window: reassemble and validate frames without loading OpenCV")
+        print("  --paced             show frames at their capture timestamp plus an adaptive delay")
+        print("  --skip-unchanged    do not decode frames that match the one on screen (inline decode only)")
+        print("  --jitter-buffer     reorder audio and echo it at a steady rate, inserting silence for lost chunks")
+        print("  --plc               with --jitter-buffer: fill lost chunks by pitch waveform substitution (NumPy)")
+        print("  --send-audio=FILE   send an 8 kHz 16-bit mono WAV file to the device instead of echoing its audio")
+        print("  --codec=NAME        codec for --send-audio: pcm, pcmu, pcma (G.711, half the payload) or adpcm (a quarter; default pcm)")
+        print("  --latency-probe     send 10 timestamped probes/s for the device to reflect: RTT and one-way delays")
+        print("  --analytics         audio level, clipping and voice activity from the received audio, with events (NumPy)")
         print("  Press 'q' or ESC in video window to stop")
         sys.exit(1)
     
-    esp32_ip = sys.argv[1]
-    
-    success = test_esp32_audio_video(esp32_ip)
+    esp32_ip = args[0]
+    decode_workers = 0
+    decode_mode = 'full'
+    send_audio = None
+    codec = 'pcm'
+    for option in options:
+        if option.startswith('--decode-workers='):
+            decode_workers = int(option.split('=', 1)[1])
+        elif option.startswith('--decode-mode='):
+            decode_mode = option.split('=', 1)[1]
+        elif option.startswith('--send-audio='):
+            send_audio = option.split('=', 1)[1]
+        elif option.startswith('--codec='):
+            codec = option.split('=', 1)[1]
+    headless = '--headless' in options
+    if codec not in audio_codec.CODEC_NAMES:
+        print(f"Unknown codec {codec}, expected one of {', '.join(audio_codec.CODEC_NAMES)}")
+        sys.exit(1)
+    if not headless:
+        from video_decode import DECODE_MODES
+        if decode_mode not in DECODE_MODES:
+            print(f"Unknown decode mode {decode_mode}, expected one of {', '.join(DECODE_MODES)}")
+            sys.exit(1)
+    
+    success = test_esp32_audio_video(esp32_ip, receiver_process='--receiver-process' in options,
+                                     salvage='--salvage' in options, decode_workers=decode_workers,
+                                     decode_mode=decode_mode, headless=headless,
+                                     paced='--paced' in options, skip_unchanged='--skip-unchanged' in options,
+                                     jitter_buffer='--jitter-buffer' in options, plc='--plc' in options,
+                                     send_audio=send_audio, codec=audio_codec.CODEC_NAMES[codec],
+                                     latency_probe='--latency-probe' in options,
+                                     analytics='--analytics' in options)
     if success:
         print(f"\nAudio and video streaming test completed successfully")
     else:
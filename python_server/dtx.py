@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Discontinuous transmission: the doorbell's silence suppression (as in udp_stream.c) and client comfort noise
+"""
+import math
+import time
+
+import numpy as np
+
+from audio_ring import CHUNK_SAMPLES, CHUNK_DURATION
+from protocol import AUDIO_HEADER, SID_INTERVAL, PacketTypes
+
+# udp_stream.c writer defaults
+DEFAULT_THRESHOLD = -45  # dBFS
+HANGOVER_CHUNKS = 10
+MAX_LEVEL = 127  # Quietest level a silence descriptor can carry, -dBFS
+
+def chunk_dbfs(power):
+    """Mean square relative to full scale -> whole dBFS, clamped like _udp_power_to_dbfs()"""
+    if power <= 1e-13:
+        return -MAX_LEVEL
+    return max(-MAX_LEVEL, round(10 * math.log10(power)))
+
+class SilenceSuppressor:
+    """The doorbell writer's DTX decision, chunk by chunk, for simulators and benchmarks
+
+    A chunk at or above threshold_dbfs is sent and rearms a hangover of
+    HANGOVER_CHUNKS quiet chunks that are still sent. After that, quiet
+    chunks are suppressed, with a silence descriptor in place of the first
+    one and of every SID_INTERVAL-th after it. decide() returns 'audio',
+    'sid' or None (suppressed); level holds the -dBFS noise level for the
+    descriptor.
+    """
+
+    def __init__(self, threshold_dbfs=DEFAULT_THRESHOLD):
+        self.threshold_dbfs = threshold_dbfs
+        self.hangover = 0
+        self.since_sid = -1
+        self.noise_power = 0.0
+        self.level = MAX_LEVEL
+
+    def decide(self, pcm):
+        samples = np.asarray(pcm, dtype=np.int16)
+        power = float(np.dot(samples, samples.astype(np.int64))) / len(samples) / (32768.0 * 32768.0)
+        if chunk_dbfs(power) >= self.threshold_dbfs:
+            self.hangover = HANGOVER_CHUNKS
+            self.since_sid = -1
+            return 'audio'
+        if self.noise_power == 0.0:
+            self.noise_power = power
+        self.noise_power += (power - self.noise_power) / 8
+        if self.hangover > 0:
+            self.hangover -= 1
+            return 'audio'
+        self.since_sid += 1
+        if self.since_sid == 0 or self.since_sid >= SID_INTERVAL:
+            self.since_sid = 0
+            self.level = -chunk_dbfs(self.noise_power)
+            return 'sid'
+        return None
+
+class ComfortNoise:
+    """Background-noise chunks at a given level for the chunks a sender suppressed
+
+    One gently low-passed Gaussian noise table with unit RMS is scaled
+    to each level once and kept as int16 bytes. A chunk is then a single
+    bytes slice, cheaper than receiving the packet it replaces.
+    Successive chunks step through the table by a stride coprime with its
+    length, so the noise does not audibly repeat.
+    """
+
+    TABLE_SAMPLES = 1 << 14
+    MAX_CACHED_LEVELS = 8
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        white = rng.normal(0, 1, self.TABLE_SAMPLES + CHUNK_SAMPLES)
+        # One-pole low-pass: street and room noise have more energy at low frequencies than white noise
+        colored = np.empty_like(white)
+        state = 0.0
+        for n, value in enumerate(white.tolist()):
+            state = 0.6 * state + value
+            colored[n] = state
+        colored /= np.sqrt(np.mean(colored ** 2))
+        self._table = colored
+        self._position = 0
+        self._scaled = {}  # Level -> table as int16 bytes
+
+    def chunk(self, sequence, level):
+        """CHUNK_SIZE bytes of noise at -level dBFS RMS (the JitterBuffer comfort callback)"""
+        scaled = self._scaled.get(level)
+        if scaled is None:
+            if len(self._scaled) >= self.MAX_CACHED_LEVELS:
+                self._scaled.clear()
+            samples = np.clip(self._table * (32768.0 * 10 ** (-level / 20)), -32768, 32767)
+            scaled = self._scaled[level] = np.round(samples).astype('<i2').tobytes()
+        start = 2 * self._position
+        self._position = (self._position + 1237) % self.TABLE_SAMPLES
+        return scaled[start:start + 2 * CHUNK_SAMPLES]
+
+def benchmark(trace=None, threshold=DEFAULT_THRESHOLD, repeats=5):
+    """Packets, bytes and receive CPU for a talk session, continuous vs DTX with comfort noise
+
+    trace is an 8 kHz 16-bit mono WAV recording of a session; without one,
+    a synthetic doorstep recording is used. Every chunk goes through a real
+    loopback socket and the client's receive path (header parse,
+    JitterBuffer, AudioRing) with playout on a virtual clock. Only the
+    receiving side is timed, best of repeats runs.
+    """
+    import socket
+
+    from audio_ring import AudioRing
+    from jitter_buffer import JitterBuffer
+    from protocol import parse_audio_header, HDR_TYPE, HDR_SEQUENCE, PACKET_TYPE_MASK
+
+    if trace is not None:
+        from audio_concealment import _read_trace
+        pcm = _read_trace(trace)
+        samples = pcm[:len(pcm) // CHUNK_SAMPLES * CHUNK_SAMPLES].reshape(-1, CHUNK_SAMPLES)
+        source = trace
+    else:
+        from audio_analytics import _doorstep_recording
+        samples, _ = _doorstep_recording(120, seed=8)
+        source = "synthetic doorstep recording"
+    duration = len(samples) * CHUNK_DURATION
+    print(f"  {source}: {duration:.0f} s, silence threshold {threshold} dBFS")
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = receiver.getsockname()
+    results = {}
+    for mode in ('continuous', 'DTX'):
+        best = None
+        for _ in range(repeats):
+            suppressor = SilenceSuppressor(threshold) if mode == 'DTX' else None
+            noise = ComfortNoise()
+            buffer = JitterBuffer(comfort=noise.chunk)
+            ring = AudioRing(10.0)
+            packets = sent_bytes = 0
+            cpu = 0.0
+            for sequence, chunk in enumerate(samples):
+                kind = 'audio' if suppressor is None else suppressor.decide(chunk)
+                capture = sequence * CHUNK_DURATION
+                if kind == 'audio':
+                    packet = AUDIO_HEADER.pack(PacketTypes.AUDIO_PACKAGE, sequence, int(capture * 1000), 2 * CHUNK_SAMPLES)
+                    packet += chunk.tobytes()
+                elif kind == 'sid':
+                    packet = AUDIO_HEADER.pack(PacketTypes.AUDIO_SID, sequence, int(capture * 1000), 1)
+                    packet += bytes([suppressor.level])
+                else:
+                    packet = None
+                if packet is not None:
+                    sender.sendto(packet, addr)
+                    packets += 1
+                    sent_bytes += len(packet)
+                start = time.thread_time()
+                if packet is not None:
+                    data = receiver.recv(2048)
+                    header, payload = parse_audio_header(memoryview(data))
+                    if header[HDR_TYPE] & PACKET_TYPE_MASK == PacketTypes.AUDIO_SID:
+                        buffer.push_silence(header, payload[0], now=capture + 0.01)
+                    else:
+                        buffer.push(header, payload, now=capture + 0.01)
+                        ring.insert(header[HDR_SEQUENCE], payload)
+                buffer.pop(now=capture + 0.015)
+                cpu += time.thread_time() - start
+            # The quietest of several runs is the least disturbed by the rest of the host
+            if best is None or cpu < best[2]:
+                best = (packets, sent_bytes, cpu, buffer.stats)
+        results[mode] = best
+    sender.close()
+    receiver.close()
+
+    base_packets, base_bytes, base_cpu, _ = results['continuous']
+    for mode, (packets, sent_bytes, cpu, stats) in results.items():
+        print(f"  {mode:<10}  {packets / duration:5.1f} packets/s, {8 * sent_bytes / duration / 1000:6.1f} kbit/s, "
+              f"receive CPU {1e6 * cpu / duration:6.0f} us/s ({100 * cpu / duration:.3f}% of a core); "
+              f"{stats['played']} played, {stats['comfort_noise']} comfort noise, {stats['lost']} lost")
+    packets, sent_bytes, cpu, _ = results['DTX']
+    print(f"  DTX saves {100 * (1 - packets / base_packets):.0f}% of packets, {100 * (1 - sent_bytes / base_bytes):.0f}% "
+          f"of bytes and {100 * (1 - cpu / base_cpu):.0f}% of receive CPU")
+
+if __name__ == "__main__":
+    import sys
+
+    print("Silence suppression benchmark (loopback, virtual playout clock)")
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Single-slot latest-value mailbox for handing frames from one thread to another
+"""
+import threading
+from collections import deque
+
+class FrameMailbox:
+    """Hold the most recent item put by one producer until one consumer takes it
+
+    put() never blocks and never takes a lock while the consumer is busy: the
+    slot is a deque(maxlen=1), whose append and popleft are atomic, so a newer
+    item simply replaces an unconsumed one. The Event is only set when the
+    consumer is parked in take(), which then blocks without a polling
+    timeout. Counters are each written by a single thread, so overwritten
+    (published but never taken) items are counted exactly.
+    """
+
+    def __init__(self):
+        self._slot = deque(maxlen=1)
+        self._ready = threading.Event()
+        self._waiting = False
+        self._closed = False
+        self.published = 0  # Written by the producer only
+        self.taken = 0  # Written by the consumer only
+
+    @property
+    def overwritten(self):
+        return self.published - self.taken - len(self._slot)
+
+    def put(self, item):
+        """Publish item, replacing any item the consumer has not taken yet"""
+        self._slot.append(item)
+        self.published += 1
+        if self._waiting:
+            self._ready.set()
+
+    def take(self, block=True):
+        """Return the latest item, or None if the mailbox is empty and closed (or block is False)"""
+        slot = self._slot
+        while True:
+            try:
+                item = slot.popleft()
+            except IndexError:
+                if self._closed or not block:
+                    return None
+            else:
+                self.taken += 1
+                return item
+            # Announce the wait before re-checking, so a put() racing with us always sets the event
+            self._waiting = True
+            self._ready.clear()
+            if not slot and not self._closed:
+                self._ready.wait()
+            self._waiting = False
+
+    def close(self):
+        """Wake the consumer; take() returns None once the last item is gone (thread-safe)"""
+        self._closed = True
+        self._ready.set()
+
+def benchmark(handoffs=20000, interval=0.0005):
+    """Producer cost and wake-up latency: Condition-guarded globals vs FrameMailbox"""
+    import time
+
+    def percentile(values, fraction):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    # Legacy handoff: shared variables guarded by a Condition
+    condition = threading.Condition()
+    current = [None]
+
+    def legacy_put(item):
+        with condition:
+            current[0] = item
+            condition.notify()
+
+    def legacy_take():
+        with condition:
+            while current[0] is None:
+                condition.wait()
+            item, current[0] = current[0], None
+            return item
+
+    mailbox = FrameMailbox()
+
+    print(f"  {'':<10} {'put ns':>8} {'wake p50':>10} {'wake p99':>10} {'skipped':>8}")
+    for label, put, take in (('condition', legacy_put, legacy_take), ('mailbox', mailbox.put, mailbox.take)):
+        # Producer cost with the consumer busy elsewhere
+        start = time.perf_counter()
+        for n in range(handoffs):
+            put(n)
+        put_cost = (time.perf_counter() - start) / handoffs
+        take()
+
+        # Wake-up latency: the consumer is blocked when each item is published
+        latencies = []
+        received = [0]
+
+        def consume():
+            while True:
+                sent = take()
+                if sent is None or sent < 0:
+                    return
+                latencies.append(time.perf_counter() - sent)
+                received[0] += 1
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        count = handoffs // 10
+        for _ in range(count):
+            time.sleep(interval)
+            put(time.perf_counter())
+        time.sleep(interval)
+        put(-1)
+        consumer.join()
+        print(f"  {label:<10} {1e9 * put_cost:>8.0f} {1e6 * percentile(latencies, 0.5):>8.0f} us "
+              f"{1e6 * percentile(latencies, 0.99):>7.0f} us {count - received[0]:>8}")
+    mailbox.close()
+
+if __name__ == "__main__":
+    print("Frame handoff benchmark (one producer, one consumer)")
+    benchmark()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Adaptive jitter buffer for the audio stream: reorders chunks and plays them out at a steady rate
+"""
+import math
+import time
+from collections import deque
+
+from protocol import CHUNK_SIZE, SAMPLE_RATE, SID_INTERVAL, HDR_SEQUENCE, HDR_TIMESTAMP, serial_diff
+
+# One chunk of 8 kHz 16-bit mono audio
+CHUNK_DURATION = CHUNK_SIZE / 2 / SAMPLE_RATE
+# Loss deadline from PACKET_FORMATS.md: a chunk is lost if it is not in 20 ms + 5 ms after the previous one
+LOSS_GRACE = 0.005
+MAX_TARGET_CHUNKS = 10
+# Sequence numbers this far from the playout position mean the device restarted the stream
+RESYNC_DISTANCE = 50
+SILENCE = bytes(CHUNK_SIZE)
+# Comfort noise continues this long after a silence descriptor; beyond it, missing chunks are losses again
+SILENCE_TIMEOUT_CHUNKS = 3 * SID_INTERVAL
+
+class JitterBuffer:
+    """Hold audio chunks keyed on sequence number and release them one per playout tick
+
+    push() is called on arrival; pop() is called every CHUNK_DURATION by
+    the playout clock and returns (sequence, timestamp, payload, concealed).
+    Held ticks, which insert silence without using up a slot, return None
+    as the sequence: the slot they wait on is still played later.
+    Chunks are reordered by sequence number (serial arithmetic, so the
+    2**32 wrap is harmless); duplicates and chunks arriving after their
+    slot was played are dropped and counted.
+
+    Playout starts once `target` chunks are buffered. The target adapts to
+    the RFC 3550 interarrival jitter computed from the capture timestamps:
+    it jumps up when jitter grows, a chunk misses its slot or the buffer
+    runs dry, and decays slowly
+    when the network calms down. Playout holds for a tick (playing silence)
+    while fewer than target - 1 chunks are buffered, which is how a larger
+    target turns into actual delay, and chunks beyond target + 2 are
+    discarded to give the extra latency back. When the next chunk is missing at its
+    tick, silence is played: if its loss deadline (previous chunk's arrival
+    + 20 ms + 5 ms) has not passed, playout holds on it (an underrun, which
+    also raises the target), otherwise it is declared lost and skipped.
+
+    Silence descriptors from a doorbell with DTX go in with push_silence()
+    and take the slot of the chunk they replace. From that slot on, until
+    the next audio chunk, every missing chunk is played as comfort noise
+    from comfort(sequence, level). These chunks are not reported as
+    concealed, are not counted as lost and do not grow the target. If no
+    refresh arrives within SILENCE_TIMEOUT_CHUNKS, missing chunks count as
+    lost again.
+    """
+
+    def __init__(self, min_target=1, max_target=MAX_TARGET_CHUNKS, conceal=None, comfort=None):
+        self.min_target = min_target
+        self.max_target = max_target
+        self.target = float(min_target)
+        # conceal(sequence) returns the payload to play for a missing chunk
+        self.conceal = conceal or (lambda sequence: SILENCE)
+        # comfort(sequence, level) returns the payload for a chunk suppressed as silence at level -dBFS
+        self.comfort = comfort or (lambda sequence, level: SILENCE)
+        self.silence_level = None  # Noise level while playing out suppressed silence
+        self._silence_until = None
+        self.chunks = {}
+        self.next_sequence = None
+        self.playing = False
+        self.jitter = 0.0
+        self._last_transit = None
+        self._deadline = None
+        self._last_timestamp = None
+        self.latency = deque(maxlen=1000)  # Seconds each played chunk waited in the buffer
+        self.stats = {
+            'pushed': 0,
+            'played': 0,
+            'lost': 0,
+            'underruns': 0,
+            'late': 0,
+            'duplicates': 0,
+            'malformed': 0,  # Payloads that were not exactly CHUNK_SIZE bytes
+            'discarded': 0,
+            'stretched': 0,
+            'comfort_noise': 0,
+            'resyncs': 0,
+            'max_occupancy': 0,
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def push(self, header, payload, now=None):
+        """Buffer one received chunk; return False if it was malformed, a duplicate or arrived too late"""
+        if len(payload) != CHUNK_SIZE:
+            # Playout, concealment and re-encoding all work on whole 16-bit chunks
+            self.stats['malformed'] += 1
+            return False
+        # Payload views point into reusable receive buffers, so keep a copy
+        return self._insert(header, bytes(payload), None, now)
+
+    def push_silence(self, header, level, now=None):
+        """Buffer a silence descriptor with its noise level in -dBFS; same return value as push()"""
+        return self._insert(header, None, level, now)
+
+    def _insert(self, header, payload, level, now):
+        if now is None:
+            now = time.monotonic()
+        stats = self.stats
+        sequence = header[HDR_SEQUENCE]
+        chunks = self.chunks
+
+        if self.playing:
+            behind = serial_diff(sequence, self.next_sequence)
+            if behind < -RESYNC_DISTANCE or behind > RESYNC_DISTANCE:
+                self._resync()
+            elif behind < 0:
+                # Its slot was already played: the delay is too short for this network
+                stats['late'] += 1
+                self.target = min(self.max_target, self.target + 0.5)
+                return False
+        if sequence in chunks:
+            stats['duplicates'] += 1
+            return False
+
+        chunks[sequence] = (header[HDR_TIMESTAMP], payload, now, level)
+        stats['pushed'] += 1
+        if len(chunks) > stats['max_occupancy']:
+            stats['max_occupancy'] = len(chunks)
+
+        # RFC 3550 interarrival jitter, from arrival time against capture timestamp
+        transit = now - header[HDR_TIMESTAMP] / 1000.0
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+        self._last_transit = transit
+
+        desired = 1 + 4 * self.jitter / CHUNK_DURATION
+        if desired > self.target:
+            self.target = desired
+        else:
+            # About one chunk of delay given back per two seconds of calm
+            self.target = max(desired, self.target - 0.01)
+        self.target = min(self.max_target, max(self.min_target, self.target))
+        return True
+
+    def pop(self, now=None):
+        """Return the chunk to play at this tick, or None while prebuffering"""
+        if now is None:
+            now = time.monotonic()
+        stats = self.stats
+        chunks = self.chunks
+        target = math.ceil(self.target)
+
+        if not self.playing:
+            if not chunks or len(chunks) < target:
+                return None
+            self.playing = True
+            self.next_sequence = min(chunks, key=lambda sequence: serial_diff(sequence, next(iter(chunks))))
+            self._deadline = None
+
+        # Give back latency built up by a burst, one chunk per tick
+        if len(chunks) > target + 2:
+            if chunks.pop(self.next_sequence, None) is not None:
+                stats['discarded'] += 1
+            self._advance()
+
+        sequence = self.next_sequence
+        timestamp = self._last_timestamp + CHUNK_DURATION * 1000 if self._last_timestamp is not None else 0
+        if len(chunks) < target - 1 and self.silence_level is None:
+            # The target grew: build the extra delay by holding playout for one tick
+            stats['stretched'] += 1
+            return None, timestamp, SILENCE, True
+
+        chunk = chunks.pop(sequence, None)
+        if chunk is not None:
+            timestamp, payload, arrival, level = chunk
+            self._deadline = arrival + CHUNK_DURATION + LOSS_GRACE
+            self._last_timestamp = timestamp
+            self._advance()
+            if level is not None:
+                self.silence_level = level
+                self._silence_until = (sequence + SILENCE_TIMEOUT_CHUNKS) & 0xFFFFFFFF
+                stats['comfort_noise'] += 1
+                return sequence, timestamp, self.comfort(sequence, level), False
+            self.silence_level = None
+            self.latency.append(now - arrival)
+            stats['played'] += 1
+            return sequence, timestamp, payload, False
+
+        if self.silence_level is not None:
+            if serial_diff(self._silence_until, sequence) > 0:
+                # Suppressed by the sender, not lost
+                stats['comfort_noise'] += 1
+                self._last_timestamp = timestamp
+                self._advance()
+                return sequence, timestamp, self.comfort(sequence, self.silence_level), False
+            self.silence_level = None
+            self._deadline = None
+
+        if self._deadline is not None and now < self._deadline:
+            # Late, not lost yet: play silence in its place and wait another tick
+            stats['underruns'] += 1
+            self.target = min(self.max_target, self.target + 1)
+            return None, timestamp, SILENCE, True
+        stats['lost'] += 1
+        if self._deadline is not None:
+            self._deadline += CHUNK_DURATION
+        self._last_timestamp = timestamp
+        self._advance()
+        return sequence, timestamp, self.conceal(sequence), True
+
+    def _advance(self):
+        self.next_sequence = (self.next_sequence + 1) & 0xFFFFFFFF
+
+    def _resync(self):
+        self.chunks.clear()
+        self.playing = False
+        self.silence_level = None
+        self.stats['resyncs'] += 1
+
+    def added_latency(self):
+        """Mean time played chunks spent in the buffer, in seconds"""
+        return sum(self.latency) / len(self.latency) if self.latency else 0.0
+
+def benchmark(seconds=120, loss=0.02, reorder=0.02, duplicate=0.01, seed=5):
+    """Glitches and latency on a jittery link: play in arrival order vs JitterBuffer (virtual clock)"""
+    import heapq
+    import random
+
+    random.seed(seed)
+    count = int(seconds / CHUNK_DURATION)
+    arrivals = []
+    for sequence in range(count):
+        if random.random() < loss:
+            continue
+        capture = sequence * CHUNK_DURATION
+        delay = 0.015 + random.expovariate(1 / 0.004)
+        if random.random() < reorder:
+            delay += CHUNK_DURATION * 1.5
+        if random.random() < 0.01:
+            delay += 0.080  # Wi-Fi retry burst
+        arrivals.append((capture + delay, sequence, capture))
+        if random.random() < duplicate:
+            arrivals.append((capture + delay + 0.002, sequence, capture))
+    heapq.heapify(arrivals)
+
+    # Arrival order: each tick plays whatever came in since the last one, silence if nothing did
+    naive_glitches = naive_out_of_order = 0
+    pending = list(arrivals)
+    heapq.heapify(pending)
+    last_sequence = -1
+    queue = deque()
+    for tick in range(count + 20):
+        now = tick * CHUNK_DURATION + 0.015
+        while pending and pending[0][0] <= now:
+            queue.append(heapq.heappop(pending)[1])
+        if not queue:
+            naive_glitches += 1
+            continue
+        sequence = queue.popleft()
+        if sequence <= last_sequence:
+            naive_out_of_order += 1
+        last_sequence = sequence
+
+    buffer = JitterBuffer()
+    pending = list(arrivals)
+    heapq.heapify(pending)
+    played = []
+    for tick in range(count + 20):
+        now = tick * CHUNK_DURATION + 0.015
+        while pending and pending[0][0] <= now:
+            arrival, sequence, capture = heapq.heappop(pending)
+            buffer.push((0, sequence, capture * 1000.0, CHUNK_SIZE), SILENCE, now=arrival)
+        chunk = buffer.pop(now)
+        if chunk is not None and chunk[0] is not None:
+            played.append(chunk[0])
+    # Every slot is played at most once, in sequence order
+    in_order = all(serial_diff(b, a) > 0 for a, b in zip(played, played[1:]))
+    stats = buffer.stats
+
+    print(f"  arrival order:  {naive_glitches} silent ticks, {naive_out_of_order} chunks played out of order")
+    print(f"  jitter buffer:  {stats['lost'] + stats['underruns'] + stats['stretched']} silent ticks ({stats['lost']} lost, "
+          f"{stats['underruns']} underruns, {stats['stretched']} stretched), in order: {in_order}")
+    print(f"                  {stats['late']} late, {stats['duplicates']} duplicates, {stats['discarded']} discarded, "
+          f"target {buffer.target:.1f} chunks, max occupancy {stats['max_occupancy']}, "
+          f"added latency {1000 * buffer.added_latency():.1f} ms")
+
+if __name__ == "__main__":
+    print("Audio playout benchmark (2 min, 2% loss, 2% reordered, 1% duplicated, 1% bursts)")
+    benchmark()
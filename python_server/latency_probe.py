@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Audio round-trip latency probe: timestamped packets the doorbell reflects, RTT and one-way delay estimates
+"""
+import time
+from collections import deque
+
+from protocol import AUDIO_HEADER, PROBE, PROBE_SIZE, HDR_TYPE, HDR_SEQUENCE, PACKET_TYPE_MASK, PacketTypes
+
+PROBE_INTERVAL = 0.1  # 10 probes/s, 39 bytes each
+# A probe not answered within this long is counted as lost
+PROBE_TIMEOUT = 2.0
+# The clock offset comes from the fastest of this many recent probes...
+OFFSET_WINDOW = 32
+# ...and one-way estimates start once this many have returned
+MIN_OFFSET_SAMPLES = 8
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def reflect(packet, received_us, sent_us):
+    """The doorbell's answer to a probe (_udp_reflect_probe in udp_stream.c), for simulators and benchmarks"""
+    reply = bytearray(packet[:AUDIO_HEADER.size + PROBE_SIZE])
+    client_us = PROBE.unpack_from(reply, AUDIO_HEADER.size)[0]
+    PROBE.pack_into(reply, AUDIO_HEADER.size, client_us, received_us, sent_us)
+    return bytes(reply)
+
+class LatencyProbe:
+    """Send timestamped probes to the doorbell's audio port and time the reflections
+
+    Each probe carries its send time t1. The doorbell's UDP reader adds its
+    receive time t2 and send time t3 and returns the probe at once,
+    without playing it, and arrival is t4. The round trip is
+    (t4 - t1) - (t3 - t2), the network both ways without the device
+    turnaround. The device-minus-client clock offset is NTP's
+    ((t2 - t1) + (t3 - t4)) / 2, taken from the fastest probe among the
+    last OFFSET_WINDOW: queueing only ever lengthens a trip, so the
+    fastest probe is the one whose two directions are most nearly
+    symmetric, and the short window follows crystal drift. Once
+    MIN_OFFSET_SAMPLES probes have returned, every reply also yields
+    one-way uplink (t2 - t1 - offset) and downlink (t4 - t3 + offset)
+    estimates.
+
+    Probes go out from their own socket, so replies never mix with the
+    audio stream. Drive send() from a timer and on_readable() from the
+    I/O loop.
+    """
+
+    def __init__(self, sock, addr, window=OFFSET_WINDOW):
+        self.sock = sock
+        self.addr = addr
+        self.sequence = 0
+        self.offset = None  # Device clock minus client clock, microseconds
+        self._pending = {}  # Sequence -> client send time (us), in send order
+        self._recent = deque(maxlen=window)  # (round trip, offset) of recent replies, us
+        self.rtt = deque(maxlen=5000)  # Seconds
+        self.uplink = deque(maxlen=5000)
+        self.downlink = deque(maxlen=5000)
+        self.stats = {
+            'sent': 0,
+            'received': 0,
+            'lost': 0,
+            'unmatched': 0,  # Replies after their timeout, duplicates and foreign packets
+            'send_errors': 0,
+        }
+
+    def send(self, now=None):
+        """Send the next probe"""
+        now_us = int(1e6 * (time.time() if now is None else now))
+        self._expire(now_us)
+        packet = (AUDIO_HEADER.pack(PacketTypes.AUDIO_PROBE, self.sequence, now_us // 1000, PROBE_SIZE) +
+                  PROBE.pack(now_us, 0, 0))
+        try:
+            self.sock.sendto(packet, self.addr)
+            self._pending[self.sequence] = now_us
+            self.stats['sent'] += 1
+        except OSError:
+            self.stats['send_errors'] += 1
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+
+    def _expire(self, now_us):
+        limit = now_us - int(1e6 * PROBE_TIMEOUT)
+        pending = self._pending
+        while pending:
+            sequence = next(iter(pending))
+            if pending[sequence] >= limit:
+                break
+            del pending[sequence]
+            self.stats['lost'] += 1
+
+    def on_readable(self, sock):
+        while True:
+            try:
+                data = sock.recv(256)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                print(f"Latency probe receive error: {e}")
+                return
+            self.handle(data)
+
+    def handle(self, data, now=None):
+        """Time one reflected probe"""
+        now_us = int(1e6 * (time.time() if now is None else now))
+        if len(data) < AUDIO_HEADER.size + PROBE_SIZE:
+            self.stats['unmatched'] += 1
+            return
+        header = AUDIO_HEADER.unpack_from(data)
+        sent_us = self._pending.pop(header[HDR_SEQUENCE], None)
+        if header[HDR_TYPE] & PACKET_TYPE_MASK != PacketTypes.AUDIO_PROBE or sent_us is None:
+            self.stats['unmatched'] += 1
+            return
+        _, device_received, device_sent = PROBE.unpack_from(data, AUDIO_HEADER.size)
+        round_trip = (now_us - sent_us) - (device_sent - device_received)
+        self.stats['received'] += 1
+        self.rtt.append(round_trip / 1e6)
+        recent = self._recent
+        recent.append((round_trip, ((device_received - sent_us) + (device_sent - now_us)) / 2))
+        if len(recent) >= MIN_OFFSET_SAMPLES:
+            self.offset = min(recent)[1]
+            self.uplink.append((device_received - sent_us - self.offset) / 1e6)
+            self.downlink.append((now_us - device_sent + self.offset) / 1e6)
+
+    def summary(self):
+        """Round-trip and one-way percentiles in seconds over the most recent probes"""
+        rtt = self.rtt
+        return {
+            'rtt_min': min(rtt) if rtt else 0.0,
+            'rtt_p50': _percentile(rtt, 0.5),
+            'rtt_p90': _percentile(rtt, 0.9),
+            'rtt_p99': _percentile(rtt, 0.99),
+            'rtt_max': max(rtt) if rtt else 0.0,
+            'uplink_p50': _percentile(self.uplink, 0.5),
+            'uplink_p95': _percentile(self.uplink, 0.95),
+            'downlink_p50': _percentile(self.downlink, 0.5),
+            'downlink_p95': _percentile(self.downlink, 0.95),
+            'offset': None if self.offset is None else self.offset / 1e6,
+        }
+
+class _Recorder:
+    """Socket stand-in that keeps the last datagram sent"""
+
+    def __init__(self):
+        self.packet = None
+
+    def sendto(self, data, addr):
+        self.packet = data
+
+def benchmark(probes=3000, seed=5):
+    """Offset and one-way accuracy on an asymmetric, drifting link (virtual clock), then real loopback RTT"""
+    import random
+    import socket
+    import threading
+
+    random.seed(seed)
+    recorder = _Recorder()
+    probe = LatencyProbe(recorder, None)
+    offset, drift = 3.7, 40e-6  # Device clock ahead by 3.7 s, gaining 40 ppm
+    naive, filtered, uplink_error = [], [], []
+    for n in range(probes):
+        now = 1000.0 + n * PROBE_INTERVAL
+        # Uplink: Wi-Fi contention and retry bursts from the client side; downlink: lightly loaded
+        up = 0.002 + random.expovariate(1 / 0.0015) + (0.030 if random.random() < 0.03 else 0.0)
+        down = 0.002 + random.expovariate(1 / 0.0005)
+        turnaround = 0.0002
+        device_received = now + up
+        true_offset = offset + drift * (device_received - 1000.0)
+        probe.send(now)
+        reply = reflect(recorder.packet, int(1e6 * (device_received + true_offset)),
+                        int(1e6 * (device_received + turnaround + true_offset)))
+        arrival = device_received + turnaround + down
+        probe.handle(reply, arrival)
+        if probe.offset is not None:
+            # The per-probe NTP offset, as a probe without filtering would report it
+            naive.append(abs(probe._recent[-1][1] / 1e6 - true_offset))
+            filtered.append(abs(probe.offset / 1e6 - true_offset))
+            uplink_error.append(abs(probe.uplink[-1] - up))
+    print(f"  clock offset error, every probe on its own: p50 {1000 * _percentile(naive, 0.5):.2f} ms, "
+          f"p99 {1000 * _percentile(naive, 0.99):.2f} ms")
+    print(f"  clock offset error, fastest of last {OFFSET_WINDOW}:     p50 {1000 * _percentile(filtered, 0.5):.2f} ms, "
+          f"p99 {1000 * _percentile(filtered, 0.99):.2f} ms (40 ppm drift tracked)")
+    print(f"  one-way uplink error: p50 {1000 * _percentile(uplink_error, 0.5):.2f} ms, "
+          f"p95 {1000 * _percentile(uplink_error, 0.95):.2f} ms")
+
+    # Loopback: a thread reflects probes as the doorbell would
+    device = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    device.bind(('127.0.0.1', 0))
+    device.settimeout(0.5)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(1.0)
+    stop = threading.Event()
+
+    def reflector():
+        while not stop.is_set():
+            try:
+                data, addr = device.recvfrom(256)
+            except socket.timeout:
+                continue
+            received = time.time_ns() // 1000
+            device.sendto(reflect(data, received, time.time_ns() // 1000), addr)
+
+    thread = threading.Thread(target=reflector, daemon=True)
+    thread.start()
+    probe = LatencyProbe(client, device.getsockname())
+    count = 1000
+    cpu = time.process_time()
+    for _ in range(count):
+        probe.send()
+        try:
+            probe.handle(client.recv(256))
+        except socket.timeout:
+            pass
+    cpu = time.process_time() - cpu
+    stop.set()
+    thread.join()
+    device.close()
+    client.close()
+    summary = probe.summary()
+    print(f"  loopback: {probe.stats['received']}/{probe.stats['sent']} replies, RTT p50 {1e6 * summary['rtt_p50']:.0f} us, "
+          f"p99 {1e6 * summary['rtt_p99']:.0f} us; {1e6 * cpu / count:.0f} us CPU per probe (client and reflector), "
+          f"{100 * cpu / count / PROBE_INTERVAL:.2f}% of a core at {1 / PROBE_INTERVAL:.0f} probes/s")
+
+if __name__ == "__main__":
+    print("Latency probe benchmark (5 min of probes on a simulated link, then 1000 over loopback)")
+    benchmark()
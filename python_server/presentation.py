@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Timestamp-paced video presentation: map device capture times to local display deadlines
+"""
+import time
+from collections import deque
+
+# Bounds of the adaptive presentation delay added on top of the fastest observed transit
+MIN_DELAY = 0.010
+MAX_DELAY = 0.200
+# A frame this much slower than the fastest recent one means the device clock jumped
+RESYNC_THRESHOLD = 1.0
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class PresentationScheduler:
+    """Turn the capture timestamp of each frame into a local monotonic deadline
+
+    The device and host clocks are not compared directly: transit is taken
+    as local arrival time minus capture time, and the smallest transit
+    over the last `window` frames stands for the clock offset plus the
+    fastest network path. Each frame is due at its capture time plus that
+    base plus an adaptive delay, which follows the 95th percentile of the
+    transit spread (clamped to [min_delay, max_delay]) so bursts are
+    absorbed without adding more latency than the network needs.
+
+    The display thread asks is_late() before decoding, so frames that can
+    no longer make their deadline are skipped without spending a decode on
+    them, and calls presented() after showing a frame to record the
+    presentation jitter and end-to-end latency.
+    """
+
+    def __init__(self, min_delay=MIN_DELAY, max_delay=MAX_DELAY, window=100, late_tolerance=0.005):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.late_tolerance = late_tolerance
+        self.delay = min_delay
+        self.render_cost = 0.0  # Smoothed decode + display time
+        self._transits = deque(maxlen=window)
+        self.jitter = deque(maxlen=1000)  # Seconds between deadline and actual presentation
+        self.latency = deque(maxlen=1000)  # Capture to presentation, device clock vs wall clock
+        self.stats = {
+            'scheduled': 0,
+            'presented': 0,
+            'skipped_late': 0,
+            'resyncs': 0,
+        }
+
+    def schedule(self, timestamp_ms, now=None):
+        """Return the local monotonic time at which the frame captured at timestamp_ms is due"""
+        if now is None:
+            now = time.monotonic()
+        capture = timestamp_ms / 1000.0
+        transit = now - capture
+        transits = self._transits
+        if transits and transit - min(transits) > RESYNC_THRESHOLD:
+            # Device clock went backwards (or restarted): forget the old mapping
+            transits.clear()
+            self.stats['resyncs'] += 1
+        transits.append(transit)
+
+        base = min(transits)
+        target = _percentile(transits, 0.95) - base + self.render_cost
+        target = min(self.max_delay, max(self.min_delay, target))
+        # Grow quickly when the network gets worse, shrink slowly when it calms down
+        self.delay += (target - self.delay) * (0.5 if target > self.delay else 0.05)
+        self.stats['scheduled'] += 1
+        return capture + base + self.delay
+
+    def wait_time(self, due, now=None):
+        """Seconds to wait before starting to render a frame due at `due`"""
+        if now is None:
+            now = time.monotonic()
+        return due - self.render_cost - now
+
+    def is_late(self, due, now=None):
+        """True if rendering now would show the frame after its deadline; counts it as skipped"""
+        if now is None:
+            now = time.monotonic()
+        if now + self.render_cost > due + self.late_tolerance:
+            self.stats['skipped_late'] += 1
+            return True
+        return False
+
+    def presented(self, due, timestamp_ms, render_started, now=None, wall_now=None):
+        """Record a frame shown at `now` after rendering since render_started"""
+        if now is None:
+            now = time.monotonic()
+        if wall_now is None:
+            wall_now = time.time()
+        self.render_cost += (now - render_started - self.render_cost) * 0.1
+        self.jitter.append(now - due)
+        self.latency.append(wall_now - timestamp_ms / 1000.0)
+        self.stats['presented'] += 1
+
+    def summary(self):
+        """Jitter and latency percentiles over the most recent frames, in seconds"""
+        jitter = [abs(value) for value in self.jitter]
+        return {
+            'delay': self.delay,
+            'jitter_p50': _percentile(jitter, 0.5),
+            'jitter_p95': _percentile(jitter, 0.95),
+            'latency_p50': _percentile(self.latency, 0.5),
+            'latency_p95': _percentile(self.latency, 0.95),
+        }
+
+def benchmark(frames=2000, fps=20, render=0.004, seed=3):
+    """Judder and latency on a bursty network: present on arrival vs paced (virtual clock)"""
+    import random
+
+    random.seed(seed)
+    interval = 1.0 / fps
+    clock_offset = 1234.5  # Host monotonic clock minus device clock, unknown to the scheduler
+    arrivals = []
+    for n in range(frames):
+        capture = n * interval
+        delay = 0.020 + random.expovariate(1 / 0.006)
+        if random.random() < 0.05:
+            delay += 0.060  # Wi-Fi retry burst
+        arrivals.append((capture + clock_offset + delay, n, capture))
+    arrivals.sort()
+
+    def run(paced):
+        scheduler = PresentationScheduler()
+        shown = []
+        skipped = 0
+        display_free = 0.0
+        last_frame = -1
+        for arrival, n, capture in arrivals:
+            if n < last_frame:
+                skipped += 1  # Superseded by a newer frame, as the reassembler would
+                continue
+            start = max(arrival, display_free)
+            if paced:
+                due = scheduler.schedule(capture * 1000.0, now=arrival)
+                if scheduler.is_late(due, now=start):
+                    skipped += 1
+                    continue
+                start = max(start, due - scheduler.render_cost)
+                present = start + render
+                scheduler.presented(due, capture * 1000.0, start, now=present, wall_now=present - clock_offset)
+            else:
+                present = start + render
+            display_free = present
+            last_frame = n
+            shown.append((present, capture))
+
+        intervals = [b[0] - a[0] for a, b in zip(shown, shown[1:])]
+        captured = [b[1] - a[1] for a, b in zip(shown, shown[1:])]
+        judder = [abs(i - c) for i, c in zip(intervals, captured)]
+        latency = [present - capture - clock_offset for present, capture in shown]
+        return (len(shown), skipped, _percentile(judder, 0.5), _percentile(judder, 0.95),
+                _percentile(latency, 0.5), _percentile(latency, 0.95))
+
+    print(f"  {'':<10} {'shown':>6} {'skipped':>8} {'judder p50':>11} {'judder p95':>11} {'latency p50':>12} {'latency p95':>12}")
+    for label, paced in (('on arrival', False), ('paced', True)):
+        shown, skipped, judder50, judder95, latency50, latency95 = run(paced)
+        print(f"  {label:<10} {shown:>6} {skipped:>8} {1000 * judder50:>8.1f} ms {1000 * judder95:>8.1f} ms "
+              f"{1000 * latency50:>9.1f} ms {1000 * latency95:>9.1f} ms")
+
+if __name__ == "__main__":
+    print("Presentation pacing benchmark (20 fps, 20 ms + jittered network delay, 5% bursts)")
+    benchmark()
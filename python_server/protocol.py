@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Doorbell wire protocol: commands, packet types and zero-copy header decoding
+"""
+import struct
+
+# ESP32 Command definitions
+class Commands:
+    REQUEST_TALK = 0
+    END_TALK = 1
+    GRANT_TALK = 2
+    DENY_TALK = 3
+    TALK_ENDED = 4
+    DOORBELL_RING = 5
+    OPEN_DOOR = 6
+
+# Packet type definitions (matching udp_stream.c)
+class PacketTypes:
+    AUDIO_PACKAGE = 0
+    VIDEO_PACKAGE = 1
+    AUDIO_PROBE = 2  # Latency probe on the audio port, reflected by the doorbell
+    AUDIO_SID = 3  # Silence descriptor: the doorbell suppressed chunks from this sequence on
+
+# Audio payload codecs (udp_stream_codec_t), carried in the high nibble of the audio type byte
+class AudioCodecs:
+    PCM16 = 0
+    PCMU = 1
+    PCMA = 2
+    ADPCM = 3
+
+PACKET_TYPE_MASK = 0x0F
+CODEC_SHIFT = 4
+
+HEADER_FORMAT = '<BIQH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Video packet header format
+VIDEO_HEADER_FORMAT = '<BIQHHH'
+VIDEO_HEADER_SIZE = struct.calcsize(VIDEO_HEADER_FORMAT)
+
+# Latency probe payload: client send, device receive and device send times in microseconds
+PROBE_FORMAT = '<qqq'
+PROBE_SIZE = struct.calcsize(PROBE_FORMAT)
+
+# Silence descriptor payload: one byte of noise level in -dBFS (0-127), repeated every SID_INTERVAL chunks
+SID_SIZE = 1
+SID_INTERVAL = 10
+
+COMMAND_FORMAT = '<I'
+COMMAND_SIZE = struct.calcsize(COMMAND_FORMAT)
+
+# Precompiled codecs, shared by every decoder
+AUDIO_HEADER = struct.Struct(HEADER_FORMAT)
+VIDEO_HEADER = struct.Struct(VIDEO_HEADER_FORMAT)
+COMMAND = struct.Struct(COMMAND_FORMAT)
+PROBE = struct.Struct(PROBE_FORMAT)
+
+# Configuration
+TCP_PORT = 12345
+UDP_PORT = 12345
+VIDEO_UDP_PORT = 12346
+CHUNK_SIZE = 324
+SAMPLE_RATE = 8000
+MAX_VIDEO_PACKET_SIZE = 1400  # MTU-safe video datagram size
+VIDEO_FRAGMENT_SIZE = 1381  # Max JPEG bytes per video packet (1400 - 19)
+
+# Header records are the plain tuples returned by the precompiled structs:
+# no per-packet dict or object allocation. Index them with the constants below.
+# Audio: (type, sequence, timestamp, length)
+# Video: (type, frame_id, timestamp, length, packet_seq, total_packets)
+
+HDR_TYPE = 0
+HDR_SEQUENCE = 1
+HDR_FRAME_ID = 1
+HDR_TIMESTAMP = 2
+HDR_LENGTH = 3
+HDR_PACKET_SEQ = 4
+HDR_TOTAL_PACKETS = 5
+
+_unpack_audio = AUDIO_HEADER.unpack_from
+_unpack_video = VIDEO_HEADER.unpack_from
+
+def parse_audio_header(data):
+    """Decode an audio datagram, return (header tuple, payload) or (None, None)
+
+    Pass a memoryview to get a zero-copy payload view.
+    """
+    if len(data) < HEADER_SIZE:
+        return None, None
+
+    header = _unpack_audio(data)
+    return header, data[HEADER_SIZE:HEADER_SIZE + header[HDR_LENGTH]]
+
+def parse_video_header(data):
+    """Decode a video datagram, return (header tuple, payload) or (None, None)
+
+    Pass a memoryview to get a zero-copy payload view.
+    """
+    if len(data) < VIDEO_HEADER_SIZE:
+        return None, None
+
+    header = _unpack_video(data)
+    return header, data[VIDEO_HEADER_SIZE:VIDEO_HEADER_SIZE + header[HDR_LENGTH]]
+
+def serial_diff(a, b):
+    """Signed distance a - b between 32-bit frame IDs/sequence numbers (RFC 1982)
+
+    Positive when a is newer than b, correct across the 2**32 wraparound.
+    """
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+def pack_command(command):
+    """Encode a control command for the TCP channel"""
+    return COMMAND.pack(command)
+
+def _legacy_parse_audio_header(data):
+    """Original dict/copy based decoder, kept for benchmark comparison"""
+    packet_type, seq_num, timestamp, length = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+    audio_data = data[HEADER_SIZE:HEADER_SIZE + length]
+    return {'type': packet_type, 'sequence': seq_num, 'timestamp': timestamp, 'length': length}, audio_data
+
+def _legacy_parse_video_header(data):
+    """Original dict/copy based decoder, kept for benchmark comparison"""
+    if len(data) < VIDEO_HEADER_SIZE:
+        return None, None
+    packet_type, frame_id, timestamp, length, packet_seq, total_packets = struct.unpack(VIDEO_HEADER_FORMAT, data[:VIDEO_HEADER_SIZE])
+    video_data = data[VIDEO_HEADER_SIZE:VIDEO_HEADER_SIZE + length]
+    return {
+        'type': packet_type,
+        'frame_id': frame_id,
+        'timestamp': timestamp,
+        'length': length,
+        'packet_seq': packet_seq,
+        'total_packets': total_packets
+    }, video_data
+
+def benchmark(count=200000):
+    """Compare packets/s per core of the legacy and zero-copy decoders"""
+    import time
+
+    audio = AUDIO_HEADER.pack(PacketTypes.AUDIO_PACKAGE, 1, 0, CHUNK_SIZE) + bytes(CHUNK_SIZE)
+    video = VIDEO_HEADER.pack(PacketTypes.VIDEO_PACKAGE, 1, 0, VIDEO_FRAGMENT_SIZE, 0, 20) + bytes(VIDEO_FRAGMENT_SIZE)
+
+    # Receive buffers are handed to the decoders as memoryviews
+    cases = [
+        ("audio legacy", _legacy_parse_audio_header, audio),
+        ("audio struct", parse_audio_header, memoryview(audio)),
+        ("video legacy", _legacy_parse_video_header, video),
+        ("video struct", parse_video_header, memoryview(video)),
+    ]
+    results = {}
+    for name, parser, packet in cases:
+        start = time.process_time()
+        for _ in range(count):
+            parser(packet)
+        elapsed = time.process_time() - start
+        results[name] = count / elapsed
+        print(f"  {name:<14} {results[name]:>12,.0f} packets/s")
+
+    print(f"  audio speedup: {results['audio struct'] / results['audio legacy']:.2f}x")
+    print(f"  video speedup: {results['video struct'] / results['video legacy']:.2f}x")
+    return results
+
+if __name__ == "__main__":
+    print("Packet decoding microbenchmark (single core)")
+    benchmark()
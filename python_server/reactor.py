@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Single-threaded selectors-based I/O loop with timers and a wake-up fd
+"""
+import heapq
+import selectors
+import socket
+import time
+import traceback
+
+class Reactor:
+    """Multiplex sockets and timers on one thread, sleeping until there is work
+
+    Readable sockets are dispatched to the callback given at register().
+    stop() may be called from any thread: it writes to an internal
+    socketpair so a blocked select() returns immediately instead of waiting
+    out a polling timeout.
+
+    Interval timers keep their phase: each tick is scheduled from the
+    previous deadline, not from when it ran. Ticks missed during a stall
+    are dropped and counted rather than run back to back. An exception
+    from any callback is printed and counted, and the loop carries on.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        self._selector.register(self._wake_recv, selectors.EVENT_READ, None)
+        self._timers = []
+        self._timer_seq = 0
+        self._running = False
+        self.stats = {
+            'wakeups': 0,
+            'events': 0,
+            'timers': 0,
+            'missed_ticks': 0,
+            'callback_errors': 0,
+        }
+
+    def register(self, sock, callback):
+        """Call callback(sock) whenever sock is readable"""
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ, callback)
+
+    def unregister(self, sock):
+        self._selector.unregister(sock)
+
+    def call_later(self, delay, callback, interval=None):
+        """Run callback() after delay seconds, then every interval seconds if given"""
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_seq, callback, interval))
+
+    def call_every(self, interval, callback):
+        self.call_later(interval, callback, interval)
+
+    def stop(self):
+        """Ask the loop to exit (thread-safe)"""
+        self._running = False
+        try:
+            self._wake_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # A wake-up is already pending or the loop is closed
+
+    def run(self):
+        """Dispatch events and timers until stop() is called"""
+        self._running = True
+        select = self._selector.select
+        timers = self._timers
+        while self._running:
+            timeout = None
+            if timers:
+                timeout = max(0.0, timers[0][0] - time.monotonic())
+
+            events = select(timeout)
+            self.stats['wakeups'] += 1
+
+            for key, mask in events:
+                callback = key.data
+                if callback is None:
+                    self._drain_wakeup()
+                    continue
+                self.stats['events'] += 1
+                try:
+                    callback(key.fileobj)
+                except Exception:
+                    self._report(callback)
+
+            now = time.monotonic()
+            while timers and timers[0][0] <= now and self._running:
+                deadline, seq, callback, interval = heapq.heappop(timers)
+                if interval is not None:
+                    deadline += interval
+                    if deadline <= now:
+                        # Stalled past whole intervals: skip to the next tick on the same phase
+                        missed = int((now - deadline) / interval) + 1
+                        self.stats['missed_ticks'] += missed
+                        deadline += missed * interval
+                    self._timer_seq += 1
+                    heapq.heappush(timers, (deadline, self._timer_seq, callback, interval))
+                self.stats['timers'] += 1
+                try:
+                    callback()
+                except Exception:
+                    self._report(callback)
+
+    def _report(self, callback):
+        self.stats['callback_errors'] += 1
+        print(f"Reactor callback {getattr(callback, '__qualname__', callback)} failed:")
+        traceback.print_exc()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wake_recv.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        self._selector.close()
+        self._wake_recv.close()
+        self._wake_send.close()
+
+def benchmark(idle_seconds=2.55):
+    """Measure idle CPU and stop latency: 0.1 s polling threads vs the reactor
+
+    The default duration requests the stop mid-way through a poll interval.
+    """
+    import threading
+
+    def make_sockets():
+        socks = []
+        for _ in range(2):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(('127.0.0.1', 0))
+            socks.append(s)
+        return socks
+
+    # Legacy layout: two receive threads and a condition waiter, all polling at 0.1 s
+    socks = make_sockets()
+    stop_event = threading.Event()
+    condition = threading.Condition()
+    wakeups = [0]
+
+    def poll_loop(sock):
+        sock.settimeout(0.1)
+        while not stop_event.is_set():
+            try:
+                sock.recv(2048)
+            except socket.timeout:
+                wakeups[0] += 1
+
+    def wait_loop():
+        while not stop_event.is_set():
+            with condition:
+                condition.wait(timeout=0.1)
+                wakeups[0] += 1
+
+    threads = [threading.Thread(target=poll_loop, args=(s,)) for s in socks]
+    threads.append(threading.Thread(target=wait_loop))
+    for t in threads:
+        t.start()
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    legacy_cpu = time.process_time() - cpu_start
+    stop_start = time.perf_counter()
+    stop_event.set()
+    for t in threads:
+        t.join()
+    legacy_stop = time.perf_counter() - stop_start
+    legacy_wakeups = wakeups[0]
+    for s in socks:
+        s.close()
+
+    # Reactor: one thread, blocked in select() until traffic or stop()
+    socks = make_sockets()
+    reactor = Reactor()
+    for s in socks:
+        reactor.register(s, lambda sock: sock.recv(2048))
+    thread = threading.Thread(target=reactor.run)
+    thread.start()
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    reactor_cpu = time.process_time() - cpu_start
+    stop_start = time.perf_counter()
+    reactor.stop()
+    thread.join()
+    reactor_stop = time.perf_counter() - stop_start
+    reactor.close()
+    for s in socks:
+        s.close()
+
+    print(f"  {'':<10} {'wakeups/s':>10} {'idle CPU':>10} {'stop latency':>14}")
+    print(f"  {'polling':<10} {legacy_wakeups / idle_seconds:>10.1f} {100 * legacy_cpu / idle_seconds:>9.3f}% {1000 * legacy_stop:>11.2f} ms")
+    print(f"  {'reactor':<10} {reactor.stats['wakeups'] / idle_seconds:>10.1f} {100 * reactor_cpu / idle_seconds:>9.3f}% {1000 * reactor_stop:>11.2f} ms")
+
+if __name__ == "__main__":
+    print("Idle behaviour benchmark (no traffic)")
+    benchmark()
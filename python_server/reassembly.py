@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Video frame reassembly from fragmented UDP packets
+"""
+import time
+from collections import defaultdict, deque
+
+from protocol import HDR_FRAME_ID, HDR_PACKET_SEQ, HDR_TOTAL_PACKETS, VIDEO_FRAGMENT_SIZE, serial_diff
+
+# Loss deadline from PACKET_FORMATS.md: full frame within 50 ms + 5 ms
+FRAME_DEADLINE = 0.055
+MAX_FRAMES_IN_FLIGHT = 16
+MAX_BYTES_IN_FLIGHT = 2 * 1024 * 1024
+# total_packets comes from the untrusted header; larger frames are rejected before any buffer is allocated
+MAX_FRAME_BYTES = 512 * 1024
+# A frame this far behind the newest completed one means the device restarted its counter
+RESTART_DISTANCE = 1000
+# Salvaged frames need at least this share of the JPEG as a contiguous prefix
+SALVAGE_MIN_FRACTION = 0.2
+JPEG_EOI = b'\xff\xd9'
+
+class _PartialFrame:
+    """One frame being reassembled: contiguous buffer plus a bitmask of received fragments"""
+    __slots__ = ('frame_id', 'buffer', 'view', 'total_packets', 'received', 'complete', 'end', 'deadline')
+
+    def __init__(self, frame_id, total_packets, deadline):
+        self.frame_id = frame_id
+        self.buffer = bytearray(total_packets * VIDEO_FRAGMENT_SIZE)
+        self.view = memoryview(self.buffer)
+        self.total_packets = total_packets
+        self.received = 0
+        self.complete = (1 << total_packets) - 1
+        self.end = 0
+        self.deadline = deadline
+
+class FrameReassembler:
+    """Collect video fragments per frame_id and return frames once complete
+
+    The ESP32 cuts each JPEG at multiples of VIDEO_FRAGMENT_SIZE, so every
+    fragment is written straight to its final offset in a buffer allocated
+    once per frame. Completion is an integer bitmask comparison and the
+    finished frame is handed out as a trimmed memoryview, with no join.
+
+    The reassembly window is bounded: a frame not complete within
+    `deadline` seconds of its first fragment is evicted and counted as
+    lost, and the oldest frames are evicted early when more than
+    `max_frames` frames or `max_bytes` of buffers are in flight. A frame
+    whose header claims more than `max_frame_bytes` (or `max_bytes`) is
+    rejected without allocating, fragment by fragment. Every
+    frame gets the same deadline, so creation order is deadline order and
+    a FIFO serves as the timer queue. Deadlines are checked when a frame
+    opens, so fragments of frames already in flight pay no clock read. A
+    frame whose last fragment arrives after its deadline but before it
+    was evicted is complete and delivered as usual.
+
+    Frames are only delivered in order. Once a frame completes, in-flight
+    frames older than it are dropped (superseded) and fragments of older
+    frames are ignored on arrival. Frame IDs are compared with serial
+    number arithmetic, so the 2**32 wraparound does not stall the stream;
+    a frame far behind the newest one is taken as a device restart.
+
+    With salvage enabled, a frame evicted with a long enough contiguous
+    prefix of fragments is not dropped: the prefix is terminated with a
+    synthesized EOI marker in place and queued on `salvaged` as
+    (frame_id, frame_data view, valid_fraction), where valid_fraction is
+    the share of the JPEG that arrived intact.
+    """
+
+    def __init__(self, deadline=FRAME_DEADLINE, max_frames=MAX_FRAMES_IN_FLIGHT,
+                 max_bytes=MAX_BYTES_IN_FLIGHT, retired_history=256, salvage=False,
+                 salvage_min_fraction=SALVAGE_MIN_FRACTION, max_frame_bytes=MAX_FRAME_BYTES):
+        self.deadline = deadline
+        self.salvage = salvage
+        self.salvage_min_fraction = salvage_min_fraction
+        self.salvaged = deque()
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.max_frame_bytes = min(max_frame_bytes, max_bytes)
+        self.frames = {}
+        self.bytes_in_flight = 0
+        self._deadlines = deque()
+        self._next_deadline = float('inf')
+        # Recently completed or evicted frame IDs, so late fragments do not reopen them
+        self._retired = set()
+        self._retired_order = deque()
+        self._retired_history = retired_history
+        self.last_completed = None
+        self.stats = {
+            'invalid_fragments': 0,
+            'oversized_fragments': 0,  # Their header claimed a frame larger than max_frame_bytes
+            'duplicate_fragments': 0,
+            'late_fragments': 0,
+            'lost_frames': 0,
+            'capacity_evictions': 0,
+            'superseded_frames': 0,
+            'salvaged_frames': 0,
+            'stream_restarts': 0,
+            'peak_bytes_in_flight': 0,
+        }
+
+    def __len__(self):
+        """Number of incomplete frames currently held"""
+        return len(self.frames)
+
+    def add(self, header, payload, now=None):
+        """Store one fragment, return (frame_id, frame_data view) when its frame completes"""
+        # Unpacked in VIDEO_HEADER field order: one tuple unpack is cheaper than three HDR_* lookups
+        _, frame_id, _, _, packet_seq, total_packets = header
+
+        frame = self.frames.get(frame_id)
+        if frame is None:
+            # Deadlines are checked when a frame opens, not on every fragment
+            if now is None:
+                now = time.monotonic()
+            if now >= self._next_deadline:
+                self.expire(now)
+            if packet_seq >= total_packets:
+                self.stats['invalid_fragments'] += 1
+                return None
+            if total_packets * VIDEO_FRAGMENT_SIZE > self.max_frame_bytes:
+                self.stats['oversized_fragments'] += 1
+                return None
+            if self.last_completed is not None:
+                age = serial_diff(frame_id, self.last_completed)
+                if age < -RESTART_DISTANCE:
+                    self._restart()
+                elif age <= 0:
+                    # Out of date: a newer frame has already been delivered
+                    self.stats['late_fragments'] += 1
+                    return None
+            if frame_id in self._retired:
+                self.stats['late_fragments'] += 1
+                return None
+            frame = self._open(frame_id, total_packets, now)
+        elif packet_seq >= frame.total_packets or total_packets != frame.total_packets:
+            self.stats['invalid_fragments'] += 1
+            return None
+
+        bit = 1 << packet_seq
+        received = frame.received
+        if received & bit:
+            self.stats['duplicate_fragments'] += 1
+            return None
+        length = len(payload)
+        if length > VIDEO_FRAGMENT_SIZE:
+            self.stats['invalid_fragments'] += 1
+            return None
+
+        # Write the fragment at its final offset
+        offset = packet_seq * VIDEO_FRAGMENT_SIZE
+        frame.view[offset:offset + length] = payload
+        received |= bit
+        frame.received = received
+        if packet_seq == total_packets - 1:
+            frame.end = offset + length
+
+        if received != frame.complete:
+            return None
+
+        # Delivered whole even if its deadline has passed: eviction is for frames that cannot complete
+        frame_data = frame.view[:frame.end]
+        self._close(frame)
+        self.last_completed = frame_id
+        if self.frames:
+            self._supersede(frame_id)
+        return frame_id, frame_data
+
+    def expire(self, now=None):
+        """Evict every frame whose deadline has passed, return how many were lost"""
+        if now is None:
+            now = time.monotonic()
+        deadlines = self._deadlines
+        lost = 0
+        while deadlines and deadlines[0].deadline <= now:
+            frame = deadlines.popleft()
+            if self.frames.get(frame.frame_id) is frame:
+                if not self._evict(frame):
+                    lost += 1
+        self._next_deadline = deadlines[0].deadline if deadlines else float('inf')
+        self.stats['lost_frames'] += lost
+        return lost
+
+    def _open(self, frame_id, total_packets, now):
+        size = total_packets * VIDEO_FRAGMENT_SIZE
+        # Make room, oldest first, before allocating a new buffer
+        while self._deadlines and (len(self.frames) >= self.max_frames
+                                   or self.bytes_in_flight + size > self.max_bytes):
+            oldest = self._deadlines.popleft()
+            if self.frames.get(oldest.frame_id) is oldest:
+                self.stats['capacity_evictions'] += 1
+                if not self._evict(oldest):
+                    self.stats['lost_frames'] += 1
+        self._next_deadline = self._deadlines[0].deadline if self._deadlines else float('inf')
+
+        frame = _PartialFrame(frame_id, total_packets, now + self.deadline)
+        self.frames[frame_id] = frame
+        if not self._deadlines:
+            self._next_deadline = frame.deadline
+        self._deadlines.append(frame)
+        self.bytes_in_flight += size
+        if self.bytes_in_flight > self.stats['peak_bytes_in_flight']:
+            self.stats['peak_bytes_in_flight'] = self.bytes_in_flight
+        return frame
+
+    def _evict(self, frame):
+        """Drop an unfinished frame, salvaging its prefix if enabled; return True if salvaged"""
+        if self.salvage and frame.received != frame.complete:
+            # Number of fragments received contiguously from packet 0
+            prefix_packets = (~frame.received & (frame.received + 1)).bit_length() - 1
+            prefix_bytes = prefix_packets * VIDEO_FRAGMENT_SIZE
+            total_bytes = frame.end or len(frame.buffer)
+            valid_fraction = prefix_bytes / total_bytes
+            if prefix_packets and valid_fraction >= self.salvage_min_fraction and prefix_bytes + 2 <= len(frame.buffer):
+                frame.view[prefix_bytes:prefix_bytes + 2] = JPEG_EOI
+                frame_data = frame.view[:prefix_bytes + 2]
+                self._close(frame)
+                self.stats['salvaged_frames'] += 1
+                self.salvaged.append((frame.frame_id, frame_data, valid_fraction))
+                self.last_completed = frame.frame_id
+                if self.frames:
+                    self._supersede(frame.frame_id)
+                return True
+        self._close(frame)
+        return False
+
+    def _supersede(self, frame_id):
+        """Drop every in-flight frame older than the frame just delivered"""
+        older = [frame for fid, frame in self.frames.items() if serial_diff(fid, frame_id) < 0]
+        for frame in older:
+            self._close(frame)
+        self.stats['superseded_frames'] += len(older)
+
+    def _restart(self):
+        """The device restarted its frame counter: forget ordering state"""
+        self.stats['stream_restarts'] += 1
+        self.last_completed = None
+        self._retired.clear()
+        self._retired_order.clear()
+
+    def _close(self, frame):
+        """Drop a completed or evicted frame and remember its ID"""
+        del self.frames[frame.frame_id]
+        self.bytes_in_flight -= len(frame.buffer)
+        # The deadline queue may still reference the frame; do not keep its buffer alive
+        frame.buffer = frame.view = None
+        self._retired.add(frame.frame_id)
+        self._retired_order.append(frame.frame_id)
+        if len(self._retired_order) > self._retired_history:
+            self._retired.discard(self._retired_order.popleft())
+
+class _LegacyFrameReassembler:
+    """Previous dict/set/join reassembler, kept for benchmark comparison"""
+
+    def __init__(self):
+        self.video_frames = defaultdict(dict)
+        self.video_frame_info = {}
+
+    def add(self, header, payload):
+        video_frames = self.video_frames
+        video_frame_info = self.video_frame_info
+        frame_id = header[HDR_FRAME_ID]
+        packet_seq = header[HDR_PACKET_SEQ]
+        total_packets = header[HDR_TOTAL_PACKETS]
+        if frame_id not in video_frame_info:
+            video_frame_info[frame_id] = {'total_packets': total_packets, 'received_packets': set()}
+        video_frames[frame_id][packet_seq] = bytes(payload)
+        video_frame_info[frame_id]['received_packets'].add(packet_seq)
+        if len(video_frame_info[frame_id]['received_packets']) != total_packets:
+            return None
+        frame_data = b''.join(video_frames[frame_id][i] for i in range(total_packets))
+        del video_frames[frame_id]
+        del video_frame_info[frame_id]
+        return frame_id, frame_data
+
+def _fragment_stream(frame_count, frame_size, shuffle):
+    """Pre-parsed (header, payload view) fragments for frame_count frames"""
+    import random
+
+    from protocol import PacketTypes, VIDEO_HEADER, parse_video_header
+
+    jpeg = b'\xff\xd8' + bytes(random.getrandbits(8) for _ in range(frame_size - 4)) + b'\xff\xd9'
+    total_packets = (len(jpeg) + VIDEO_FRAGMENT_SIZE - 1) // VIDEO_FRAGMENT_SIZE
+    fragments = []
+    for frame_id in range(frame_count):
+        frame = []
+        for seq in range(total_packets):
+            chunk = jpeg[seq * VIDEO_FRAGMENT_SIZE:(seq + 1) * VIDEO_FRAGMENT_SIZE]
+            datagram = VIDEO_HEADER.pack(PacketTypes.VIDEO_PACKAGE, frame_id, 0, len(chunk), seq, total_packets) + chunk
+            frame.append(parse_video_header(memoryview(datagram)))
+        if shuffle:
+            random.shuffle(frame)
+        fragments.extend(frame)
+    return jpeg, total_packets, fragments
+
+def benchmark(frame_count=2000, frame_size=20000, fps=20):
+    """Reassembly throughput for VGA JPEG frames (~20 KB at quality 20)"""
+    for shuffle in (False, True):
+        jpeg, total_packets, fragments = _fragment_stream(frame_count, frame_size, shuffle)
+        order = "shuffled" if shuffle else "in order"
+        print(f"  {frame_size} B frames, {total_packets} fragments each, {order}:")
+        results = {}
+        for name, cls in (("dict+join", _LegacyFrameReassembler), ("bitmask", FrameReassembler)):
+            # Best of three runs, so a noisy host does not decide the comparison
+            elapsed = float('inf')
+            for _ in range(3):
+                reassembler = cls()
+                add = reassembler.add
+                completed = 0
+                start = time.process_time()
+                for header, payload in fragments:
+                    if add(header, payload) is not None:
+                        completed += 1
+                elapsed = min(elapsed, time.process_time() - start)
+                assert completed == frame_count
+            results[name] = frame_count / elapsed
+            print(f"    {name:<10} {results[name]:>10,.0f} frames/s  ({100 * fps / results[name]:.3f}% of a core at {fps} fps)")
+        print(f"    speedup: {results['bitmask'] / results['dict+join']:.2f}x")
+
+    # Sanity check: the reassembled view matches the original JPEG
+    reassembler = FrameReassembler()
+    for header, payload in fragments[:total_packets]:
+        completed = reassembler.add(header, payload)
+    assert bytes(completed[1]) == jpeg
+
+def soak(hours=1.0, fps=20, loss=0.05, reorder=0.02, frame_size=20000, start_id=2**32 - 36000):
+    """Simulated lossy session on a virtual clock: in-flight memory must stay flat
+
+    Some fragments are delayed until after the next frame, and frame IDs
+    start close enough to 2**32 to wrap half way through.
+    """
+    import random
+
+    jpeg, total_packets, fragments = _fragment_stream(1, frame_size, False)
+    payloads = [payload for header, payload in fragments]
+    reassembler = FrameReassembler()
+    frame_count = int(hours * 3600 * fps)
+    completed = 0
+    out_of_order = 0
+    last_id = None
+    deferred = []
+    samples = []
+
+    def deliver(header, now):
+        nonlocal completed, out_of_order, last_id
+        result = reassembler.add(header, payloads[header[HDR_PACKET_SEQ]], now)
+        if result is not None:
+            completed += 1
+            if last_id is not None and serial_diff(result[0], last_id) <= 0:
+                out_of_order += 1
+            last_id = result[0]
+
+    for n in range(frame_count):
+        now = n / fps
+        frame_id = (start_id + n) & 0xFFFFFFFF
+        late, deferred = deferred, []
+        for seq in range(total_packets):
+            if random.random() < loss:
+                continue
+            header = (1, frame_id, 0, len(payloads[seq]), seq, total_packets)
+            if random.random() < reorder:
+                deferred.append(header)
+            else:
+                deliver(header, now)
+        for header in late:
+            deliver(header, now)
+        if n % (fps * 600) == 0:
+            samples.append(reassembler.bytes_in_flight)
+    reassembler.expire(frame_count / fps + 1.0)
+
+    stats = reassembler.stats
+    print(f"  {hours:.1f} h at {fps} fps, {100 * loss:.0f}% fragment loss, {100 * reorder:.0f}% delayed, IDs wrap at 2**32:")
+    print(f"  {completed} delivered, {stats['lost_frames']} lost, {stats['superseded_frames']} superseded, "
+          f"{out_of_order} out of order, {stats['stream_restarts']} restarts")
+    print(f"  in flight every 10 min (KiB): {', '.join(f'{b / 1024:.0f}' for b in samples)}")
+    print(f"  peak in flight: {stats['peak_bytes_in_flight'] / 1024:.0f} KiB, frames held at end: {len(reassembler)}")
+    assert out_of_order == 0 and stats['stream_restarts'] == 0
+
+def check_late_completion():
+    """A frame completing after its deadline is delivered whole and frees its buffer, with and without salvage"""
+    for salvage in (False, True):
+        reassembler = FrameReassembler(salvage=salvage)
+        results = [reassembler.add((1, 1, 0, 100, seq, 3), bytes(100), now)
+                   for seq, now in ((0, 0.0), (1, 0.01), (2, 0.1))]
+        assert results[:2] == [None, None] and results[2][0] == 1 and len(results[2][1]) == 2 * VIDEO_FRAGMENT_SIZE + 100
+        # The next frame's first fragment runs expire(); the delivered frame must not be evicted again
+        assert reassembler.add((1, 2, 0, 100, 0, 3), bytes(100), 0.2) is None
+        assert not reassembler.salvaged and reassembler.stats['lost_frames'] == 0
+        assert len(reassembler) == 1 and reassembler.bytes_in_flight == 3 * VIDEO_FRAGMENT_SIZE
+    print("  late completion: delivered whole, no salvage, no leaked buffer (drop-only and salvage)")
+
+if __name__ == "__main__":
+    print("Reassembly checks")
+    check_late_completion()
+    print("Video reassembly benchmark (VGA, 20 fps)")
+    benchmark()
+    print("Lossy session soak")
+    soak()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Batched UDP receive into a preallocated pool of fixed-size buffers
+"""
+import socket
+
+# Non-blocking flag for the drain phase (not available on Windows)
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+class BatchReceiver:
+    """Drain a datagram socket in batches into reusable buffer slots
+
+    All slots live in one contiguous bytearray allocated up front. Each call
+    to receive() waits for the first datagram using the socket's own
+    blocking/timeout setting, then keeps reading with MSG_DONTWAIT until the
+    socket would block or the batch is full. The returned memoryviews point
+    into the slots and stay valid only until the next receive() call, so
+    consumers that need the data longer must copy it.
+    """
+
+    def __init__(self, sock, slot_size, slot_count=64):
+        self.sock = sock
+        self.slot_size = slot_size
+        self.slot_count = slot_count if _MSG_DONTWAIT else 1
+        self._pool = bytearray(slot_size * self.slot_count)
+        view = memoryview(self._pool)
+        self._slots = [view[i * slot_size:(i + 1) * slot_size] for i in range(self.slot_count)]
+        self.stats = {
+            'datagrams': 0,
+            'batches': 0,
+            'max_batch': 0,
+        }
+
+    def receive(self):
+        """Receive one batch, return a list of datagram views
+
+        Raises socket.timeout (or BlockingIOError on a non-blocking socket)
+        when no datagram arrives at all, like recvfrom() would.
+        """
+        slots = self._slots
+        recv_into = self.sock.recv_into
+        batch = []
+
+        nbytes = recv_into(slots[0])
+        batch.append(slots[0][:nbytes])
+
+        for i in range(1, self.slot_count):
+            try:
+                nbytes = recv_into(slots[i], 0, _MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append(slots[i][:nbytes])
+
+        count = len(batch)
+        self.stats['datagrams'] += count
+        self.stats['batches'] += 1
+        if count > self.stats['max_batch']:
+            self.stats['max_batch'] = count
+        return batch
+
+def _udp_pair(rcvbuf):
+    """Bound receiver and connected sender on the loopback interface"""
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.connect(receiver.getsockname())
+    return receiver, sender
+
+def benchmark(packet_size=1400, burst=128, rounds=400):
+    """Compare the legacy recvfrom(65535) loop against batched recv_into"""
+    import time
+    import tracemalloc
+
+    receiver, sender = _udp_pair(4 * 1024 * 1024)
+    receiver.setblocking(False)
+    packet = bytes(packet_size)
+
+    def legacy(count):
+        received = 0
+        while received < count:
+            try:
+                data, addr = receiver.recvfrom(65535)
+            except BlockingIOError:
+                break
+            received += 1
+        return received
+
+    engine = BatchReceiver(receiver, 1500, slot_count=64)
+
+    def batched(count):
+        received = 0
+        while received < count:
+            try:
+                received += len(engine.receive())
+            except BlockingIOError:
+                break
+        return received
+
+    def run(loop, rounds):
+        total = 0
+        elapsed = 0.0
+        for _ in range(rounds):
+            for _ in range(burst):
+                sender.send(packet)
+            start = time.perf_counter()
+            total += loop(burst)
+            elapsed += time.perf_counter() - start
+        return total, elapsed
+
+    results = {}
+    for name, loop in (("recvfrom", legacy), ("recv_into", batched)):
+        total, elapsed = run(loop, rounds)
+        # Separate, shorter pass for allocation tracing so it does not skew timing
+        tracemalloc.start()
+        run(loop, 10)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = total / elapsed
+        print(f"  {name:<10} {results[name]:>12,.0f} datagrams/s  peak alloc {peak / 1024:8.1f} KiB  ({total} received)")
+
+    print(f"  speedup: {results['recv_into'] / results['recvfrom']:.2f}x")
+    print(f"  batches: {engine.stats['batches']}, max batch {engine.stats['max_batch']}")
+    receiver.close()
+    sender.close()
+    return results
+
+if __name__ == "__main__":
+    print("Batched receive benchmark (loopback, 1400-byte datagrams)")
+    benchmark()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Dedicated UDP receiver process feeding a shared-memory ring buffer
+"""
+import multiprocessing
+import socket
+import struct
+import time
+import traceback
+from multiprocessing import shared_memory
+
+from protocol import PacketTypes, PACKET_TYPE_MASK, HEADER_SIZE, UDP_PORT, VIDEO_UDP_PORT, MAX_VIDEO_PACKET_SIZE
+from receive_engine import BatchReceiver
+from reactor import Reactor
+
+# Ring channels
+CHANNEL_AUDIO = 0
+CHANNEL_VIDEO = 1
+
+# Control block: producer-owned words in the first cache line, consumer-owned in the second
+_CTL_SIZE = 128
+_CTL_WRITE_INDEX = 0
+_CTL_DROPPED = 1
+_CTL_SLOT_COUNT = 2
+_CTL_SLOT_SIZE = 3
+_CTL_READ_INDEX = 8
+
+# Per-record header: payload length, channel, receive time (monotonic ns)
+RECORD_HEADER = struct.Struct('<IBxxxQ')
+
+# Control socket messages
+_MSG_READY = b'R'
+_MSG_ERROR = b'E'
+_MSG_DATA = b'.'
+_MSG_STOP = b'S'
+
+class ShmRing:
+    """Single-producer/single-consumer datagram ring in shared memory
+
+    The write index is stored only by the producer and the read index only
+    by the consumer; both are aligned 64-bit counters that only increase, so
+    neither side needs a lock. A record is published by storing the write
+    index after its bytes are in place and released by storing the read
+    index after the consumer is done with it. When the ring is full new
+    records are dropped and counted. A record whose handler raises is
+    still released, and counted in failed, so it is never replayed.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self._ctl = shm.buf[:_CTL_SIZE].cast('Q')
+        self.slot_count = self._ctl[_CTL_SLOT_COUNT]
+        self.slot_size = self._ctl[_CTL_SLOT_SIZE]
+        self.record_size = RECORD_HEADER.size + self.slot_size
+        self._data = shm.buf[_CTL_SIZE:]
+        self._records = [self._data[i * self.record_size:(i + 1) * self.record_size]
+                         for i in range(self.slot_count)]
+        self.failed = 0  # Records skipped because the consumer's handler raised
+
+    @classmethod
+    def create(cls, slot_count=1024, slot_size=MAX_VIDEO_PACKET_SIZE):
+        record_size = RECORD_HEADER.size + slot_size
+        shm = shared_memory.SharedMemory(create=True, size=_CTL_SIZE + slot_count * record_size)
+        ctl = shm.buf[:_CTL_SIZE].cast('Q')
+        for i in range(len(ctl)):
+            ctl[i] = 0
+        ctl[_CTL_SLOT_COUNT] = slot_count
+        ctl[_CTL_SLOT_SIZE] = slot_size
+        ctl.release()
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def dropped(self):
+        return self._ctl[_CTL_DROPPED]
+
+    def __len__(self):
+        return self._ctl[_CTL_WRITE_INDEX] - self._ctl[_CTL_READ_INDEX]
+
+    def write(self, channel, recv_ns, data):
+        """Producer: copy one datagram into the ring, return False if it was full"""
+        ctl = self._ctl
+        index = ctl[_CTL_WRITE_INDEX]
+        if index - ctl[_CTL_READ_INDEX] >= self.slot_count or len(data) > self.slot_size:
+            ctl[_CTL_DROPPED] += 1
+            return False
+        record = self._records[index % self.slot_count]
+        RECORD_HEADER.pack_into(record, 0, len(data), channel, recv_ns)
+        record[RECORD_HEADER.size:RECORD_HEADER.size + len(data)] = data
+        ctl[_CTL_WRITE_INDEX] = index + 1
+        return True
+
+    def drain(self, handler):
+        """Consumer: call handler(channel, recv_ns, view) for every pending record
+
+        The view is only valid during the call. Returns the number of records.
+        """
+        ctl = self._ctl
+        index = ctl[_CTL_READ_INDEX]
+        end = ctl[_CTL_WRITE_INDEX]
+        records = self._records
+        unpack = RECORD_HEADER.unpack_from
+        start = index
+        while index < end:
+            record = records[index % self.slot_count]
+            length, channel, recv_ns = unpack(record)
+            try:
+                handler(channel, recv_ns, record[RECORD_HEADER.size:RECORD_HEADER.size + length])
+            except Exception:
+                # Skip the record: leaving the read index on it would hand it back on every drain
+                self.failed += 1
+                print(f"Ring record {index} ({length} bytes, channel {channel}) failed, skipped:")
+                traceback.print_exc()
+            # Released only after the handler, as the view points into the slot
+            index += 1
+            ctl[_CTL_READ_INDEX] = index
+        return index - start
+
+    def close(self):
+        self._records = []
+        self._data.release()
+        self._ctl.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def receiver_main(ring_name, control_sock, esp32_ip, echo_audio=True,
+                  audio_port=UDP_PORT, video_port=VIDEO_UDP_PORT):
+    """Receiver process: own the UDP sockets and copy every datagram into the ring"""
+    ring = ShmRing.attach(ring_name)
+    udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    video_udp_recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    udp_send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        video_udp_recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    except OSError as e:
+        print(f"Could not set large UDP buffer: {e}")
+    try:
+        udp_recv.bind(('0.0.0.0', audio_port))
+        video_udp_recv.bind(('0.0.0.0', video_port))
+    except OSError as e:
+        print(f"UDP bind failed: {e}")
+        control_sock.send(_MSG_ERROR)
+        ring.close()
+        return
+
+    reactor = Reactor()
+    audio_receiver = BatchReceiver(udp_recv, ring.slot_size, slot_count=16)
+    video_receiver = BatchReceiver(video_udp_recv, ring.slot_size, slot_count=64)
+    esp32_addr = (esp32_ip, audio_port)
+
+    def notify():
+        try:
+            control_sock.send(_MSG_DATA)
+        except BlockingIOError:
+            pass  # Consumer already has unread notifications
+
+    def on_audio(sock):
+        try:
+            batch = audio_receiver.receive()
+        except BlockingIOError:
+            return
+        recv_ns = time.monotonic_ns()
+        for data in batch:
+            # Echo straight from the receiver so decode load cannot delay it
+            if echo_audio and len(data) >= HEADER_SIZE and data[0] & PACKET_TYPE_MASK == PacketTypes.AUDIO_PACKAGE:
+                udp_send.sendto(data, esp32_addr)
+            ring.write(CHANNEL_AUDIO, recv_ns, data)
+        notify()
+
+    def on_video(sock):
+        try:
+            batch = video_receiver.receive()
+        except BlockingIOError:
+            return
+        recv_ns = time.monotonic_ns()
+        for data in batch:
+            ring.write(CHANNEL_VIDEO, recv_ns, data)
+        notify()
+
+    def on_control(sock):
+        try:
+            data = sock.recv(64)
+        except BlockingIOError:
+            return
+        if not data or _MSG_STOP in data:
+            reactor.stop()
+
+    reactor.register(udp_recv, on_audio)
+    reactor.register(video_udp_recv, on_video)
+    reactor.register(control_sock, on_control)
+    control_sock.send(_MSG_READY)
+    try:
+        reactor.run()
+    except KeyboardInterrupt:
+        pass  # The parent decides when the session ends
+    finally:
+        reactor.close()
+        udp_recv.close()
+        video_udp_recv.close()
+        udp_send.close()
+        ring.close()
+
+class ReceiverProcess:
+    """Parent-side handle for a receiver process and its ring
+
+    Register .sock with the parent's Reactor and call drain() when it is
+    readable: the child sends one notification byte per received batch.
+    """
+
+    def __init__(self, esp32_ip, slot_count=1024, echo_audio=True):
+        self.esp32_ip = esp32_ip
+        self.echo_audio = echo_audio
+        self.ring = ShmRing.create(slot_count)
+        self.sock, self._child_sock = socket.socketpair()
+        self.process = None
+
+    def start(self, timeout=5.0):
+        """Start the child and wait for it to bind its sockets, return True if ready"""
+        self.process = multiprocessing.Process(
+            target=receiver_main,
+            args=(self.ring.name, self._child_sock, self.esp32_ip, self.echo_audio),
+            name="UDPReceiver",
+            daemon=True,
+        )
+        self.process.start()
+        self.sock.settimeout(timeout)
+        try:
+            status = self.sock.recv(1)
+        except socket.timeout:
+            status = b''
+        if status != _MSG_READY:
+            self.stop()
+            return False
+        self.sock.setblocking(False)
+        return True
+
+    def drain(self, on_audio, on_video):
+        """Consume pending ring records, dispatching datagram views by channel"""
+        try:
+            while self.sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        def handle(channel, recv_ns, data):
+            if channel == CHANNEL_AUDIO:
+                on_audio(data)
+            else:
+                on_video(data)
+
+        return self.ring.drain(handle)
+
+    def stop(self, timeout=1.0):
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.sock.send(_MSG_STOP)
+            except OSError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.sock.close()
+        self._child_sock.close()
+        self.ring.close()
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] / 1e6
+    return pick(0.5), pick(0.99), samples[-1] / 1e6
+
+def _audio_sender(port, count, interval):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    deadline = time.monotonic()
+    for seq in range(count):
+        deadline += interval
+        time.sleep(max(0.0, deadline - time.monotonic()))
+        sender.sendto(struct.pack('<BIQH', PacketTypes.AUDIO_PACKAGE, seq, time.monotonic_ns(), 324) + bytes(324),
+                      ('127.0.0.1', port))
+    sender.close()
+
+def _decode_load(stop, busy=0.03, period=0.05):
+    """Pure-Python stand-in for JPEG decode and display: holds the GIL for busy s every period s"""
+    while not stop.is_set():
+        end = time.monotonic() + busy
+        while time.monotonic() < end:
+            pass
+        time.sleep(period - busy)
+
+def benchmark(count=250, interval=0.02025, port=23456):
+    """Audio receive latency under decode load: in-process thread vs receiver process"""
+    import threading
+
+    results = {}
+
+    # In-process: receive thread competes for the GIL with the decode load
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+    sock.settimeout(1.0)
+    stop = threading.Event()
+    load = threading.Thread(target=_decode_load, args=(stop,))
+    load.start()
+    sender = multiprocessing.Process(target=_audio_sender, args=(port, count, interval))
+    sender.start()
+    latencies = []
+    try:
+        for _ in range(count):
+            data = sock.recv(2048)
+            latencies.append(time.monotonic_ns() - struct.unpack_from('<Q', data, 5)[0])
+    except socket.timeout:
+        pass
+    sender.join()
+    stop.set()
+    load.join()
+    sock.close()
+    results['thread'] = _percentiles(latencies)
+
+    # Receiver process: the ring records the receive time in the child
+    receiver = ReceiverProcess('127.0.0.1', echo_audio=False)
+    receiver.process = multiprocessing.Process(
+        target=receiver_main,
+        args=(receiver.ring.name, receiver._child_sock, '127.0.0.1', False, port, port + 1),
+        daemon=True,
+    )
+    receiver.process.start()
+    receiver.sock.recv(1)
+    receiver.sock.setblocking(False)
+    stop = threading.Event()
+    load = threading.Thread(target=_decode_load, args=(stop,))
+    load.start()
+    sender = multiprocessing.Process(target=_audio_sender, args=(port, count, interval))
+    sender.start()
+    latencies = []
+
+    def on_audio(channel, recv_ns, data):
+        latencies.append(recv_ns - struct.unpack_from('<Q', data, 5)[0])
+
+    while sender.is_alive() or len(receiver.ring):
+        receiver.ring.drain(on_audio)
+        time.sleep(0.005)
+    sender.join()
+    stop.set()
+    load.join()
+    receiver.stop()
+    results['process'] = _percentiles(latencies)
+
+    print(f"  {'':<10} {'p50':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, (p50, p99, worst) in results.items():
+        print(f"  {name:<10} {p50:>8.3f} {p99:>8.3f} {worst:>8.3f}")
+    return results
+
+if __name__ == "__main__":
+    print("Audio receive latency under simulated decode load")
+    benchmark()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Streaming polyphase resampler: 8 kHz audio to 16/48 kHz (any integer multiple) for downstream consumers
+"""
+import time
+
+import numpy as np
+
+from audio_ring import CHUNK_SAMPLES, CHUNK_DURATION
+from protocol import SAMPLE_RATE
+
+# Input samples each output sample is computed from; with the Kaiser window below this gives
+# about 75 dB of stopband attenuation with a 3.4-4.6 kHz transition band at every output rate
+TAPS_PER_PHASE = 32
+KAISER_BETA = 7.5
+CUTOFF = SAMPLE_RATE / 2  # Hz
+
+def design_filter(factor, taps_per_phase=TAPS_PER_PHASE):
+    """Kaiser-windowed sinc low-pass at the output rate, factor * taps_per_phase taps, gain factor"""
+    length = factor * taps_per_phase
+    position = np.arange(length) - (length - 1) / 2
+    cutoff = CUTOFF / (SAMPLE_RATE * factor)  # Cycles per output sample
+    h = 2 * cutoff * np.sinc(2 * cutoff * position) * np.kaiser(length, KAISER_BETA)
+    # Each phase sums to one, so a constant input comes out flat without a ripple at the input rate
+    phases = h.reshape(taps_per_phase, factor)
+    return (phases / phases.sum(axis=0)).ravel()
+
+class Resampler:
+    """Upsample one or many 8 kHz streams chunk by chunk to several output rates at once
+
+    Each output rate must be an integer multiple of 8 kHz. Its filter
+    is split into one phase per output sample of an input period, and
+    the phases of all rates are stacked into one (taps x outputs)
+    matrix. A chunk is then one matrix product of a sliding-window view
+    of the input against it. That is a single pass over the input for
+    every rate, with no zero-stuffed samples multiplied. The last
+    taps_per_phase - 1 input samples of each stream are kept between
+    calls, so chunked output is the same as resampling the whole signal
+    at once, with no seams at chunk boundaries. Output is delayed by
+    the filter's group delay, about taps_per_phase / 2 input samples
+    (delays holds it per rate, in seconds).
+
+    With streams=None, process() takes one stream's chunk, as an int16
+    array or PCM bytes. Otherwise it takes a (streams x samples) int16
+    array, one row per stream, and resamples every stream in the same
+    matrix product.
+    """
+
+    def __init__(self, rates=(16000, 48000), streams=None, taps_per_phase=TAPS_PER_PHASE):
+        self.rates = tuple(rates)
+        self.streams = streams
+        self.taps = taps_per_phase
+        columns = []
+        self._slices = {}
+        self.delays = {}
+        start = 0
+        for rate in self.rates:
+            factor, remainder = divmod(rate, SAMPLE_RATE)
+            if remainder or factor < 1:
+                raise ValueError(f"Output rate {rate} is not a multiple of {SAMPLE_RATE} Hz")
+            # Window row j holds input sample n - (taps - 1) + j; it meets tap (taps - 1 - j) * factor + phase
+            columns.append(design_filter(factor, taps_per_phase).reshape(taps_per_phase, factor)[::-1])
+            self._slices[rate] = (slice(start, start + factor), factor)
+            self.delays[rate] = (factor * taps_per_phase - 1) / 2 / rate
+            start += factor
+        self._matrix = np.ascontiguousarray(np.hstack(columns), dtype=np.float32)
+        self._buffer = np.zeros((1 if streams is None else streams, taps_per_phase - 1), dtype=np.float32)
+
+    def reset(self):
+        """Forget the history, as at the start of a stream"""
+        self._buffer[:, :self.taps - 1] = 0
+
+    def process(self, samples):
+        """Resample the next chunk; returns {rate: int16 output}, shaped like the input"""
+        if isinstance(samples, (bytes, bytearray, memoryview)):
+            samples = np.frombuffer(samples, dtype='<i2')
+        rows = samples.reshape(len(self._buffer), -1)
+        count = rows.shape[1]
+        history = self.taps - 1
+        buffer = self._buffer
+        if buffer.shape[1] != history + count:
+            # Chunk size changed: carry the history into a buffer of the new size
+            grown = np.empty((len(buffer), history + count), dtype=np.float32)
+            grown[:, :history] = buffer[:, buffer.shape[1] - history:]
+            buffer = self._buffer = grown
+        buffer[:, history:] = rows
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps, axis=1)
+        products = windows @ self._matrix  # (streams, count, outputs)
+        buffer[:, :history] = buffer[:, count:]
+        out = {}
+        for rate, (columns, factor) in self._slices.items():
+            values = products[:, :, columns].reshape(len(buffer), count * factor)
+            values = np.clip(np.rint(values), -32768, 32767).astype(np.int16)
+            out[rate] = values[0] if self.streams is None else values
+        return out
+
+def _tone(frequency, seconds, rate, delay=0.0):
+    t = np.arange(int(seconds * rate)) / rate - delay
+    return 12000 * np.sin(2 * np.pi * frequency * t)
+
+def _image_rejection(output, rate, frequency):
+    """dB between the tone and the strongest component above the input band (images at 8 kHz multiples +- f)"""
+    window = np.hanning(len(output))
+    spectrum = np.abs(np.fft.rfft(output * window))
+    frequencies = np.fft.rfftfreq(len(output), 1 / rate)
+    tone = spectrum[np.argmin(np.abs(frequencies - frequency))]
+    images = spectrum[frequencies > SAMPLE_RATE / 2 + 100].max()
+    return 20 * np.log10(tone / max(images, 1e-9))
+
+def benchmark(seconds=10, seed=3):
+    """Seams at chunk boundaries, tone accuracy and image rejection, then streams per core"""
+    from audio_concealment import _synthetic_speech
+
+    speech = _synthetic_speech(seconds, seed)
+    speech = speech[:len(speech) // CHUNK_SAMPLES * CHUNK_SAMPLES]
+    chunks = speech.reshape(-1, CHUNK_SAMPLES)
+
+    # Chunked vs whole signal: a stateful stage must give the same samples
+    whole = Resampler().process(speech)
+    streaming = Resampler()
+    pieces = [streaming.process(chunk) for chunk in chunks]
+    for rate in (16000, 48000):
+        chunked = np.concatenate([piece[rate] for piece in pieces])
+        # The same filter restarted on every chunk, as a stateless stage would run it
+        restarted = np.concatenate([Resampler((rate,)).process(chunk)[rate] for chunk in chunks])
+        reference = whole[rate].astype(np.int32)
+        print(f"  {rate // 1000} kHz speech, max error vs whole-signal resampling: "
+              f"streaming {np.abs(chunked - reference).max()} LSB, "
+              f"restarted per chunk {np.abs(restarted - reference).max()} LSB")
+        tone_in = np.rint(_tone(1000, 1.0, SAMPLE_RATE)).astype(np.int16)
+        resampler = Resampler((rate,))
+        out = np.concatenate([resampler.process(chunk)[rate]
+                              for chunk in tone_in[:len(tone_in) // CHUNK_SAMPLES * CHUNK_SAMPLES].reshape(-1, CHUNK_SAMPLES)])
+        ideal = _tone(1000, len(out) / rate, rate, resampler.delays[rate])
+        settled = slice(rate // 10, None)
+        error = out[settled] - ideal[settled]
+        snr = 10 * np.log10(np.mean(ideal[settled] ** 2) / np.mean(error ** 2))
+        factor = rate // SAMPLE_RATE
+        tone_linear = np.interp(np.arange(len(tone_in) * factor) / factor, np.arange(len(tone_in)), tone_in)
+        print(f"  {rate // 1000} kHz 1 kHz tone: SNR {snr:.1f} dB, image rejection {_image_rejection(out[settled], rate, 1000):.0f} dB "
+              f"(linear interpolation {_image_rejection(tone_linear, rate, 1000):.0f} dB)")
+
+    chunk_rate = 1 / CHUNK_DURATION
+    rounds = 200
+    single = Resampler()
+    start = time.process_time()
+    for n in range(rounds):
+        single.process(chunks[n % len(chunks)])
+    per_chunk = (time.process_time() - start) / rounds
+    print(f"  1 stream, 16 + 48 kHz in one pass: {1e6 * per_chunk:.0f} us per chunk "
+          f"-> {1 / (per_chunk * chunk_rate):.0f} streams per core")
+    separate = [Resampler((16000,)), Resampler((48000,))]
+    start = time.process_time()
+    for n in range(rounds):
+        for resampler in separate:
+            resampler.process(chunks[n % len(chunks)])
+    per_chunk = (time.process_time() - start) / rounds
+    print(f"  1 stream, 16 and 48 kHz separately: {1e6 * per_chunk:.0f} us per chunk "
+          f"-> {1 / (per_chunk * chunk_rate):.0f} streams per core")
+    for streams in (100, 500):
+        batch = Resampler(streams=streams)
+        block = np.resize(chunks, (streams, CHUNK_SAMPLES))
+        rounds = 50
+        start = time.process_time()
+        for _ in range(rounds):
+            batch.process(block)
+        per_round = (time.process_time() - start) / rounds
+        print(f"  {streams} streams per call: {1e6 * per_round / streams:.1f} us per stream-chunk "
+              f"-> {streams / (per_round * chunk_rate):.0f} streams per core")
+
+if __name__ == "__main__":
+    print("Resampler benchmark (8 kHz synthetic speech and tones to 16 and 48 kHz)")
+    benchmark()
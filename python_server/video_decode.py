@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+JPEG decoding helpers for the video pipeline
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from protocol import serial_diff
+
+# JPEG MCU height for 4:2:0 subsampling: decode errors start on these boundaries
+MCU_ROWS = 16
+
+# Reduced modes scale during the IDCT and grayscale skips chroma, so both cost less than full color
+DECODE_MODES = {
+    'full': cv2.IMREAD_COLOR,
+    'half': cv2.IMREAD_REDUCED_COLOR_2,
+    'quarter': cv2.IMREAD_REDUCED_COLOR_4,
+    'eighth': cv2.IMREAD_REDUCED_COLOR_8,
+    'gray': cv2.IMREAD_GRAYSCALE,
+}
+
+# Decoded images FrameDecoder keeps, one per (frame_id, mode); enough for the frames a decode pool has in flight
+DECODE_CACHE_SIZE = 8
+
+# A frame counts as unchanged when fewer than this share of its 1/8-scale grayscale thumbnail
+# pixels moved by more than UNCHANGED_PIXEL_DELTA (sensor noise stays well below it)
+UNCHANGED_THRESHOLD = 0.005
+UNCHANGED_PIXEL_DELTA = 12
+
+def decode_jpeg(frame_data, flags=cv2.IMREAD_COLOR):
+    """Decode a JPEG held in any buffer (bytes, bytearray or memoryview) without copying it"""
+    return cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), flags)
+
+def conceal_missing_rows(image, last_good, valid_fraction):
+    """Replace the rows of a salvaged frame that were not received with the last good frame
+
+    The salvaged JPEG is a prefix of the original, and JPEG scans top to
+    bottom, so rows past roughly valid_fraction of the height hold decoder
+    fill. One MCU row of margin is dropped as well. Returns the index of
+    the first concealed row.
+    """
+    height = image.shape[0]
+    first_row = max(0, int(valid_fraction * height) // MCU_ROWS * MCU_ROWS - MCU_ROWS)
+    if last_good is not None and last_good.shape == image.shape:
+        image[first_row:] = last_good[first_row:]
+    return first_row
+
+class UnchangedFrameFilter:
+    """Skip the full decode of frames that show the same picture as the last decoded one
+
+    Two fingerprints, cheapest first: the length and CRC-32 of the JPEG
+    bytes catch exact repeats, and a 1/8-scale grayscale decode (DC
+    coefficients only, a fraction of a full decode) catches frames that
+    differ only by sensor noise. Counting changed pixels rather than
+    averaging the difference keeps small moving objects from being diluted
+    by the static background. A frame is compared with the thumbnail of the
+    last frame that was fully decoded, so slow changes add up until they
+    cross the threshold. threshold=0 keeps only the exact check.
+    """
+
+    def __init__(self, threshold=UNCHANGED_THRESHOLD, pixel_delta=UNCHANGED_PIXEL_DELTA, flags=cv2.IMREAD_COLOR):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.flags = flags
+        self._signature = None
+        self._thumbnail = None
+        self._image = None
+        self.stats = {
+            'frames': 0,
+            'exact_repeats': 0,
+            'near_repeats': 0,
+            'decoded': 0,
+            'fingerprint_seconds': 0.0,
+            'decode_seconds': 0.0,
+        }
+
+    def reset(self):
+        """Forget the reference frame, e.g. after something else was shown in between"""
+        self._signature = self._thumbnail = self._image = None
+
+    def decode(self, frame_data):
+        """Return (image, changed); image is the previous one when changed is False"""
+        stats = self.stats
+        stats['frames'] += 1
+        start = time.perf_counter()
+        signature = (len(frame_data), zlib.crc32(frame_data))
+        if signature == self._signature:
+            stats['exact_repeats'] += 1
+            stats['fingerprint_seconds'] += time.perf_counter() - start
+            return self._image, False
+
+        thumbnail = None
+        if self.threshold:
+            thumbnail = decode_jpeg(frame_data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            reference = self._thumbnail
+            if (thumbnail is not None and reference is not None and thumbnail.shape == reference.shape
+                    and np.count_nonzero(cv2.absdiff(thumbnail, reference) > self.pixel_delta)
+                    < self.threshold * thumbnail.size):
+                stats['near_repeats'] += 1
+                self._signature = signature
+                stats['fingerprint_seconds'] += time.perf_counter() - start
+                return self._image, False
+        decode_start = time.perf_counter()
+        stats['fingerprint_seconds'] += decode_start - start
+
+        image = decode_jpeg(frame_data, self.flags)
+        stats['decode_seconds'] += time.perf_counter() - decode_start
+        if image is None:
+            return None, True
+        stats['decoded'] += 1
+        self._signature = signature
+        self._thumbnail = thumbnail
+        self._image = image
+        return image, True
+
+    def skip_ratio(self):
+        return (self.stats['exact_repeats'] + self.stats['near_repeats']) / max(1, self.stats['frames'])
+
+    def cpu_saved(self):
+        """Estimated decode seconds saved, net of the time spent fingerprinting"""
+        stats = self.stats
+        skipped = stats['exact_repeats'] + stats['near_repeats']
+        decode_cost = stats['decode_seconds'] / max(1, stats['decoded'])
+        return skipped * decode_cost - stats['fingerprint_seconds']
+
+class FrameDecoder:
+    """Decode each frame once per mode and share it with every consumer of that mode
+
+    Consumers either subscribe with the DECODE_MODES name they need, e.g.
+    a motion detector at 'gray', and are fed by decode(), or pull a frame
+    with image(), as the display does at --decode-mode. Both go through
+    one cache keyed by (frame_id, mode), so a frame is decoded once per
+    mode however many consumers ask for it and in whatever order. The
+    cache holds the last cache_size decodes and is safe to use from the
+    decode pool's workers. Consumers of the same mode share one image
+    array and must copy it before drawing on it when shared() is true.
+    """
+
+    def __init__(self, cache_size=DECODE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._subscribers = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {mode: {'decoded': 0, 'failed': 0, 'cached': 0, 'seconds': 0.0} for mode in DECODE_MODES}
+
+    def subscribe(self, mode, callback):
+        """Call callback(frame_id, image, meta) with every frame decoded in mode"""
+        if mode not in DECODE_MODES:
+            raise ValueError(f"Unknown decode mode {mode!r}, expected one of {', '.join(DECODE_MODES)}")
+        self._subscribers.setdefault(mode, []).append(callback)
+
+    def unsubscribe(self, mode, callback):
+        callbacks = self._subscribers.get(mode)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[mode]
+
+    def shared(self, mode):
+        """True if subscribers also receive the images of mode"""
+        return mode in self._subscribers
+
+    def image(self, frame_id, frame_data, mode):
+        """The frame decoded in mode, from the cache if any consumer already asked for it; None if it fails"""
+        key = (frame_id, mode)
+        stats = self.stats[mode]
+        with self._lock:
+            if key in self._cache:
+                stats['cached'] += 1
+                return self._cache[key]
+        start = time.perf_counter()
+        image = decode_jpeg(frame_data, DECODE_MODES[mode])
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats['seconds'] += elapsed
+            stats['decoded' if image is not None else 'failed'] += 1
+            self._cache[key] = image
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return image
+
+    def decode(self, frame_id, frame_data, meta=None):
+        """Feed the frame to every subscriber, decoding it once per subscribed mode"""
+        for mode, callbacks in list(self._subscribers.items()):
+            image = self.image(frame_id, frame_data, mode)
+            if image is None:
+                continue
+            for callback in callbacks:
+                callback(frame_id, image, meta)
+
+class DecodePool:
+    """Decode frames on a thread pool and deliver them in frame_id order
+
+    cv2.imdecode releases the GIL, so several frames can decode in
+    parallel. on_decoded(frame_id, image, meta) is called for every frame
+    in submission order, from whichever worker finishes the head of the
+    queue. At most max_pending frames are queued or decoding; when the limit
+    is hit the oldest frame still waiting for a worker is dropped, or the
+    new frame is refused if every pending frame is already decoding. With a
+    FrameDecoder, workers decode through its cache in mode instead of
+    calling decode_jpeg() with flags.
+    """
+
+    def __init__(self, workers, on_decoded, max_pending=None, flags=cv2.IMREAD_COLOR, decoder=None, mode='full'):
+        self.workers = workers
+        self.on_decoded = on_decoded
+        self.max_pending = max(max_pending or 2 * workers, workers + 1)
+        self.flags = flags
+        self.decoder = decoder
+        self.mode = mode
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="JPEGDecode")
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.Lock()  # Keeps on_decoded calls in order without holding _lock
+        self.started = time.monotonic()
+        self.stats = {
+            'submitted': 0,
+            'decoded': 0,
+            'failed': 0,
+            'dropped': 0,
+            'refused': 0,
+            'stale': 0,
+            'max_depth': 0,
+        }
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def submit(self, frame_id, frame_data, meta=None):
+        """Queue a JPEG for decoding, return False if it is older than the last one queued or the pool is full"""
+        stats = self.stats
+        dropped = None
+        with self._lock:
+            if self._pending and serial_diff(frame_id, self._pending[-1][0]) <= 0:
+                stats['stale'] += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                dropped = self._drop_oldest_queued()
+                if dropped is None:
+                    # Every pending frame is on a worker: this one would only wait behind them
+                    stats['refused'] += 1
+                    return False
+            future = self.executor.submit(self._decode, frame_id, frame_data)
+            self._pending.append((frame_id, future, meta))
+            stats['submitted'] += 1
+            if len(self._pending) > stats['max_depth']:
+                stats['max_depth'] = len(self._pending)
+        # Outside the lock: both of these may run _on_done synchronously
+        if dropped is not None:
+            dropped.cancel()
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _decode(self, frame_id, frame_data):
+        if self.decoder is not None:
+            return self.decoder.image(frame_id, frame_data, self.mode)
+        return decode_jpeg(frame_data, self.flags)
+
+    def _drop_oldest_queued(self):
+        """Remove the oldest frame that has not started decoding, return its future
+
+        Frames already on a worker are kept, otherwise a steady overload
+        would discard every frame just before it finished.
+        """
+        pending = self._pending
+        for index, (frame_id, future, meta) in enumerate(pending):
+            if not future.running() and not future.done():
+                del pending[index]
+                self.stats['dropped'] += 1
+                return future
+        return None
+
+    def _on_done(self, future):
+        stats = self.stats
+        # Frames are collected under _lock and delivered after releasing it, so a slow on_decoded
+        # never blocks submit(); _deliver_lock keeps two workers from delivering out of order
+        with self._deliver_lock:
+            ready = []
+            with self._lock:
+                pending = self._pending
+                while pending and pending[0][1].done():
+                    frame_id, done, meta = pending.popleft()
+                    if done.cancelled():
+                        continue
+                    image = done.result()
+                    if image is None:
+                        stats['failed'] += 1
+                        continue
+                    stats['decoded'] += 1
+                    ready.append((frame_id, image, meta))
+            for frame_id, image, meta in ready:
+                self.on_decoded(frame_id, image, meta)
+
+    def decode_fps(self):
+        return self.stats['decoded'] / max(1e-9, time.monotonic() - self.started)
+
+    def close(self):
+        with self._lock:
+            pending = [future for frame_id, future, meta in self._pending]
+            self._pending.clear()
+        for future in pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+def _test_jpegs(count, quality=20):
+    """Synthetic VGA frames with a moving pattern, JPEG-encoded like the ESP32 camera"""
+    rng = np.random.default_rng(1)
+    base = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    base = cv2.GaussianBlur(base, (0, 0), 3)
+    jpegs = []
+    for i in range(count):
+        image = np.roll(base, i * 4, axis=1)
+        cv2.putText(image, f"Frame {i}", (10, 240), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        jpegs.append(encoded.tobytes())
+    return jpegs
+
+def benchmark_salvage(seconds=30, fps=20, losses=(0.01, 0.02, 0.05, 0.1)):
+    """Displayed fps under fragment loss: drop-only vs salvage mode (virtual clock)"""
+    import random
+
+    from protocol import VIDEO_FRAGMENT_SIZE
+    from reassembly import FrameReassembler
+
+    jpegs = _test_jpegs(fps)
+    frame_count = seconds * fps
+    print(f"  {'loss':>5} {'completion':>11} {'drop-only fps':>14} {'salvage fps':>12} {'undecodable':>12}")
+    for loss in losses:
+        displayed = {}
+        for salvage in (False, True):
+            random.seed(7)
+            reassembler = FrameReassembler(salvage=salvage)
+            shown = 0
+            failed = 0
+            last_shown = None
+
+            def show(frame_id, frame_data):
+                nonlocal shown, failed, last_shown
+                if last_shown is not None and serial_diff(frame_id, last_shown) <= 0:
+                    return  # Older than the frame on screen
+                last_shown = frame_id
+                if decode_jpeg(frame_data) is None:
+                    failed += 1
+                else:
+                    shown += 1
+
+            for n in range(frame_count):
+                jpeg = jpegs[n % len(jpegs)]
+                total_packets = (len(jpeg) + VIDEO_FRAGMENT_SIZE - 1) // VIDEO_FRAGMENT_SIZE
+                now = n / fps
+                for seq in range(total_packets):
+                    if random.random() < loss:
+                        continue
+                    payload = jpeg[seq * VIDEO_FRAGMENT_SIZE:(seq + 1) * VIDEO_FRAGMENT_SIZE]
+                    completed = reassembler.add((1, n, 0, len(payload), seq, total_packets), payload, now)
+                    # Salvaged frames are older than one completed in the same call, so they are shown first
+                    while reassembler.salvaged:
+                        show(*reassembler.salvaged.popleft()[:2])
+                    if completed is not None:
+                        show(*completed)
+            reassembler.expire(frame_count / fps + 1.0)
+            while reassembler.salvaged:
+                show(*reassembler.salvaged.popleft()[:2])
+            displayed[salvage] = shown / seconds
+            if salvage:
+                salvage_failed = failed
+            else:
+                completion = shown / frame_count
+        print(f"  {100 * loss:>4.0f}% {100 * completion:>10.1f}% {displayed[False]:>14.1f} {displayed[True]:>12.1f} {salvage_failed:>12}")
+
+def benchmark_modes(frames=300):
+    """Decode cost per mode, and decodes done for the display and several consumers via FrameDecoder"""
+    jpegs = _test_jpegs(20)
+    print(f"  {'mode':<8} {'output':>12} {'ms/frame':>9} {'vs full':>8}")
+    full_cost = None
+    for mode, flags in DECODE_MODES.items():
+        start = time.perf_counter()
+        for n in range(frames):
+            image = decode_jpeg(jpegs[n % len(jpegs)], flags)
+        cost = (time.perf_counter() - start) / frames
+        if full_cost is None:
+            full_cost = cost
+        shape = 'x'.join(str(size) for size in image.shape)
+        print(f"  {mode:<8} {shape:>12} {1000 * cost:>9.3f} {cost / full_cost:>7.2f}x")
+
+    # Display pulling 'full', plus a thumbnail strip, motion detector and a recorder at full resolution
+    decoder = FrameDecoder()
+    delivered = [0]
+
+    def consumer(frame_id, image, meta):
+        delivered[0] += 1
+
+    for mode in ('full', 'quarter', 'gray', 'full'):
+        decoder.subscribe(mode, consumer)
+    for n in range(frames):
+        decoder.decode(n, jpegs[n % len(jpegs)])
+        if decoder.image(n, jpegs[n % len(jpegs)], 'full') is not None:
+            delivered[0] += 1
+    decodes = sum(stats['decoded'] for stats in decoder.stats.values())
+    print(f"  display + 4 consumers over 3 modes: {delivered[0]} images delivered from {decodes} decodes ({frames} frames)")
+
+def benchmark_unchanged(frames=600, fps=20):
+    """Decode CPU on a static porch scene with sensor noise and a short passer-by"""
+    rng = np.random.default_rng(2)
+    porch = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (0, 0), 4)
+    jpegs = []
+    for n in range(frames):
+        image = porch.copy()
+        # Someone crosses the frame for 2 s in the middle of the clip
+        if frames // 2 <= n < frames // 2 + 2 * fps:
+            x = (n - frames // 2) * 640 // (2 * fps)
+            cv2.rectangle(image, (x, 150), (x + 80, 450), (40, 60, 200), -1)
+        noise = rng.normal(0, 2.0, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        jpegs.append(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 20])[1].tobytes())
+    repeats = [jpegs[n // 4 * 4] for n in range(frames)]  # Camera resending its last buffer
+
+    start = time.process_time()
+    for jpeg in jpegs:
+        decode_jpeg(jpeg)
+    full_cpu = time.process_time() - start
+
+    print(f"  {'scene':<16} {'skipped':>8} {'decodes':>8} {'CPU/frame':>10} {'vs always':>10}")
+    print(f"  {'always decode':<16} {0:>7.1f}% {frames:>8} {1000 * full_cpu / frames:>7.3f} ms {1.0:>9.2f}x")
+    for label, clip, threshold in (('noisy static', jpegs, UNCHANGED_THRESHOLD), ('exact repeats', repeats, 0)):
+        unchanged = UnchangedFrameFilter(threshold)
+        start = time.process_time()
+        for jpeg in clip:
+            unchanged.decode(jpeg)
+        cpu = time.process_time() - start
+        print(f"  {label:<16} {100 * unchanged.skip_ratio():>7.1f}% {unchanged.stats['decoded']:>8} "
+              f"{1000 * cpu / frames:>7.3f} ms {cpu / full_cpu:>9.2f}x")
+
+def benchmark_pool(frames=400, workers=(1, 2, 4)):
+    """Decode throughput of the worker pool vs decoding inline on one thread"""
+    jpegs = _test_jpegs(20)
+
+    start = time.perf_counter()
+    for n in range(frames):
+        decode_jpeg(jpegs[n % len(jpegs)])
+    inline_fps = frames / (time.perf_counter() - start)
+    print(f"  {'inline':<10} {inline_fps:>8.1f} fps")
+
+    for count in workers:
+        delivered = []
+        done = threading.Event()
+
+        def on_decoded(frame_id, image, meta):
+            delivered.append(frame_id)
+            if frame_id == frames - 1:
+                done.set()
+
+        # Deep queue so nothing is dropped while measuring raw throughput
+        pool = DecodePool(count, on_decoded, max_pending=frames)
+        start = time.perf_counter()
+        for n in range(frames):
+            pool.submit(n, jpegs[n % len(jpegs)])
+        done.wait()
+        elapsed = time.perf_counter() - start
+        pool.close()
+        assert delivered == sorted(delivered)
+        print(f"  {count} worker{'s' if count > 1 else ' '}  {frames / elapsed:>8.1f} fps  ({frames / elapsed / inline_fps:.2f}x, in order)")
+
+    # Backpressure: submit at 4x what one worker sustains, queue depth capped at 2
+    delivered = []
+    pool = DecodePool(1, lambda frame_id, image, meta: delivered.append(frame_id), max_pending=2)
+    interval = 1.0 / (4 * inline_fps)
+    for n in range(frames):
+        pool.submit(n, jpegs[n % len(jpegs)])
+        time.sleep(interval)
+    pool.close()
+    print(f"  overload 4x: {pool.stats['decoded']} decoded, {pool.stats['dropped']} dropped, {pool.stats['refused']} refused, max depth {pool.stats['max_depth']}")
+
+if __name__ == "__main__":
+    print("JPEG decode cost per mode (VGA, quality 20)")
+    benchmark_modes()
+    print("Unchanged-frame filter (VGA, quality 20, 30 s static scene with 2 s of motion)")
+    benchmark_unchanged()
+    print("JPEG decode pool throughput (VGA, quality 20)")
+    benchmark_pool()
+    print("Displayed frame rate under fragment loss (VGA, quality 20, 20 fps)")
+    benchmark_salvage()